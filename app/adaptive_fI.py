@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+f-I curve with adaptive sampling of the current amplitudes.
+
+Instead of simulating evenly spaced amplitudes (cf. calculate_fI_curve),
+of which many are subthreshold or saturated, the rheobase is found by
+bisection and the amplitudes are then added where the firing rate
+changes the most, until the rate changes between neighbouring amplitudes
+are within the requested accuracy.
+"""
+
+import numpy as np
+
+# Upper bound on the number of simulations of a protocol
+MAX_RUNS = 30
+
+# Resolution of the amplitudes as a fraction of the range
+AMP_RESOLUTION = 0.01
+
+
+def calculate_adaptive_fI_curve(model, duration=1000, min_amp=0, max_amp=1,
+                                rate_tol=5, amp_tol=None, max_runs=MAX_RUNS, **kwargs):
+    """
+    Calculate the frequency-current (f-I) curve of the neuron model
+    with adaptive sampling of the current amplitudes.
+
+    Parameters
+    ----------
+    model : Model
+        The neuron model with a current clamp at the soma.
+    duration : int
+        Duration of the simulation in ms.
+    min_amp : float
+        Minimum amplitude of the current injection in nA.
+    max_amp : float
+        Maximum amplitude of the current injection in nA.
+    rate_tol : float
+        Largest change of the firing rate in Hz between
+        neighbouring amplitudes above the rheobase.
+    amp_tol : float
+        Smallest distance between the amplitudes in nA.
+        Defaults to 1% of the range.
+    max_runs : int
+        Maximum number of simulations.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the sorted current amplitudes, the firing
+        rates, the voltages, the rheobase (None if the cell does not fire
+        within the range) and the number of simulations.
+    """
+    from dendrotweaks.analysis import detect_somatic_spikes
+
+    seg = model.seg_tree.root
+    iclamp = model.iclamps[seg]
+    if amp_tol is None:
+        amp_tol = (max_amp - min_amp) * AMP_RESOLUTION
+
+    rates = {}
+    vs = {}
+
+    def get_rate(amp):
+        amp = float(np.round(amp, 6))
+        if amp not in rates:
+            iclamp.amp = amp
+            model.run(duration=duration)
+            spike_data = detect_somatic_spikes(model, **kwargs)
+            rates[amp] = len(spike_data['spike_times']) / iclamp.dur * 1000
+            vs[amp] = model.simulator.recordings['v'][seg]
+        return rates[amp]
+
+    # Rheobase by bisection between a silent and a firing amplitude
+    rheobase = None
+    if get_rate(max_amp) > 0:
+        lo, hi = min_amp, max_amp
+        if get_rate(lo) > 0:
+            hi = lo
+        while hi - lo > amp_tol and len(rates) < max_runs:
+            mid = (lo + hi) / 2
+            if get_rate(mid) > 0:
+                hi = mid
+            else:
+                lo = mid
+        rheobase = hi
+
+        # Refine the interval with the largest rate change
+        while len(rates) < max_runs:
+            amps = np.array(sorted(a for a in rates if a >= rheobase))
+            if len(amps) < 2:
+                break
+            drates = np.abs(np.diff([rates[a] for a in amps]))
+            widths = np.diff(amps)
+            drates[widths <= 2 * amp_tol] = 0
+            i = np.argmax(drates)
+            if drates[i] <= rate_tol:
+                break
+            get_rate((amps[i] + amps[i + 1]) / 2)
+
+    amps = sorted(rates)
+    return {
+        'current_amplitudes': amps,
+        'firing_rates': [rates[amp] for amp in amps],
+        'voltages': vs,
+        'time': model.simulator.t,
+        'rheobase': rheobase,
+        'n_runs': len(rates),
+    }
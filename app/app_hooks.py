@@ -0,0 +1,25 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Bokeh server lifecycle hooks (see session_manager.py).
+The per-session cleanup is registered in main.py.
+"""
+
+from tornado.ioloop import PeriodicCallback
+from tornado.web import HTTPError
+
+from session_manager import sessions, IDLE_CHECK_INTERVAL_MS
+from handlers import remove_stale_uploads, UPLOAD_CHECK_INTERVAL_MS
+
+
+def on_server_loaded(server_context):
+    PeriodicCallback(sessions.evict_idle, IDLE_CHECK_INTERVAL_MS).start()
+    PeriodicCallback(remove_stale_uploads, UPLOAD_CHECK_INTERVAL_MS).start()
+
+
+async def on_session_created(session_context):
+    # New sessions wait while the memory is over the high-watermark
+    # and are rejected if it is not released in time
+    if not await sessions.wait_for_memory():
+        raise HTTPError(503, reason='The server is busy. Please try again later.')
@@ -18,6 +18,7 @@ class AdjustableSpinner():
             self.spinner.step = new
 
         self.ninput.on_change('value', ninput_callback)
+        self._widget = None
 
     def calculate_step(self, value):
         magnitude = math.floor(math.log10(abs(value))) if value != 0 else 0
@@ -25,11 +26,16 @@ class AdjustableSpinner():
         return base_step
 
     def get_widget(self):
-        return row(self.spinner, self.ninput)
+        if self._widget is None:
+            self._widget = row(self.spinner, self.ninput)
+        return self._widget
 
     def on_change(self, attr, callback):
         self.spinner.on_change(attr, callback)
 
+    def js_on_change(self, attr, callback):
+        self.spinner.js_on_change(attr, callback)
+
     @property
     def _callbacks(self):
         return self.spinner._callbacks
@@ -62,6 +68,72 @@ class AdjustableSpinner():
         self.spinner.visible = value
         self.ninput.visible = value
 
+    def update(self, title, value, step=None, visible=True):
+        step = self.calculate_step(value) if step is None else step
+        self.spinner.update(title=title, value=value, step=step)
+        self.ninput.value = step
+        self.visible = visible
+
+    @property
+    def js_property_callbacks(self):
+        return self.spinner.js_property_callbacks
+
+    @js_property_callbacks.setter
+    def js_property_callbacks(self, value):
+        self.spinner.js_property_callbacks = value
+
+
+class ModelPool():
+    """
+    Reuses the Bokeh models of the panels and glyphs that are rebuilt 
+    on every selection. A model is looked up by a key and updated
+    with the given properties instead of being created again, so that 
+    only the changed properties are sent to the browser rather than
+    new models.
+    """
+
+    def __init__(self):
+        self._models = {}
+
+    def get(self, key, factory, **props):
+        """
+        Returns the model stored under the key, updated with the properties,
+        or a new one created with factory(**props).
+        """
+        model = self._models.get((key, factory))
+        if model is None:
+            model = self._models[(key, factory)] = factory(**props)
+        else:
+            model.update(**props)
+        return model
+
+    def get_widget(self, key, factory, callbacks=None, **props):
+        """
+        Same as get, but the on_change and JS callbacks of a reused widget
+        are removed before it is updated, and the new callbacks are added.
+
+        Parameters
+        ----------
+        callbacks : dict
+            The callbacks to add, e.g. {'value_throttled': [callback, ...]}.
+        """
+        widget = self._models.get((key, factory))
+        if widget is None:
+            widget = self._models[(key, factory)] = factory(**props)
+        else:
+            for attr, attr_callbacks in list(widget._callbacks.items()):
+                for callback in list(attr_callbacks):
+                    widget.remove_on_change(attr, callback)
+            widget.js_property_callbacks = {}
+            widget.update(**props)
+        for attr, attr_callbacks in (callbacks or {}).items():
+            for callback in attr_callbacks:
+                widget.on_change(attr, callback)
+        return widget
+
+    def clear(self):
+        self._models = {}
+
 
 class remove_callbacks:
     def __init__(self, widget):
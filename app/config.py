@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+App configuration. The config files are parsed once per server process,
+as main.py runs for every new session, and each session gets its own copy.
+"""
+
+import os
+import json
+import copy
+from functools import lru_cache
+
+PATH_TO_DEFAULT_CONFIG = 'app/default_config.json'
+PATH_TO_USER_CONFIG = 'app/static/data/user_config.json'
+
+
+@lru_cache(maxsize=None)
+def _read_config():
+    with open(PATH_TO_DEFAULT_CONFIG, 'r') as f:
+        config = json.load(f)
+
+    with open(PATH_TO_USER_CONFIG, 'r') as f:
+        user_config = json.load(f)
+
+    for key, value in user_config.items():
+        if isinstance(value, dict) and key in config:
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+def load_config():
+    """
+    Returns the default config updated with the user config.
+    """
+    return copy.deepcopy(_read_config())
+
+
+def save_user_config(user_config):
+    """
+    Write the user config, which applies to the sessions created next.
+    """
+    with open(PATH_TO_USER_CONFIG, 'w') as f:
+        json.dump(user_config, f, indent=4)
+    _read_config.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def ensure_example_data(path_to_data):
+    """
+    Download the example models if the data directory is empty.
+    """
+    if not os.path.exists(path_to_data) or not os.listdir(path_to_data):
+        os.makedirs(path_to_data, exist_ok=True)
+        import dendrotweaks as dd
+        dd.download_example_data(path_to_data)
@@ -0,0 +1,273 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Tornado request handlers served next to the Bokeh app (see serve.py).
+
+The files are exchanged through a temporary directory rather than the
+Bokeh document, so that large files are streamed in chunks instead of
+being held in the server and browser memory at once. Each file lives
+in a directory named after a random token, which identifies it.
+
+Uploads are only accepted with the upload key of an open session, which
+is passed to the browser through the session's document, and the keys,
+the uploads in progress and the total size of the uploads are limited.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import tempfile
+
+from tornado.web import RequestHandler, HTTPError, stream_request_body
+from tornado.iostream import StreamClosedError
+
+from logger import logger
+
+PATH_TO_EXPORTS = os.path.join(tempfile.gettempdir(), 'dendrotweaks', 'exports')
+PATH_TO_UPLOADS = os.path.join(tempfile.gettempdir(), 'dendrotweaks', 'uploads')
+
+CHUNK_SIZE = 1024**2
+
+UPLOAD_EXTENSIONS = ['.swc', '.mod']
+MAX_UPLOAD_SIZE_MB = 500
+# Limits of the uploads in progress and of the uploads on disk
+MAX_CONCURRENT_UPLOADS = 4
+MAX_TOTAL_UPLOAD_SIZE_MB = 2000
+# Uploads not registered by a session within this time (s) are removed
+UPLOAD_TTL_S = 3600
+# How often (ms) the stale uploads are removed
+UPLOAD_CHECK_INTERVAL_MS = 600_000
+
+TOKEN_PATTERN = '[0-9a-f]{32}'
+
+# Set when the handlers are added to the server
+_enabled = False
+
+# Upload keys of the open sessions, with the tokens of their uploads
+_upload_keys = {}
+# Upload keys with an upload in progress, and its reserved size in bytes
+_uploads_in_progress = {}
+
+
+def handlers_enabled():
+    return _enabled
+
+
+def get_patterns(max_upload_size_mb=MAX_UPLOAD_SIZE_MB):
+    """
+    Returns the URL patterns to be passed as extra_patterns to the Bokeh Server.
+    """
+    global _enabled
+    _enabled = True
+    return [
+        (rf'/export/({TOKEN_PATTERN})', TraceExportHandler),
+        (r'/upload', UploadHandler, {'max_size': max_upload_size_mb * 1024**2}),
+    ]
+
+
+# ==============================================================================
+# EXPORT
+# ==============================================================================
+
+def create_export_dir():
+    """
+    Returns the token and the path to a new export directory.
+    """
+    token = uuid.uuid4().hex
+    path_to_dir = os.path.join(PATH_TO_EXPORTS, token)
+    os.makedirs(path_to_dir)
+    return token, path_to_dir
+
+
+def remove_export_dir(token):
+    shutil.rmtree(os.path.join(PATH_TO_EXPORTS, token), ignore_errors=True)
+
+
+def get_export_url(token):
+    return f'/export/{token}'
+
+
+class TraceExportHandler(RequestHandler):
+    """
+    Streams an exported file in chunks.
+    """
+
+    async def get(self, token):
+        path_to_dir = os.path.join(PATH_TO_EXPORTS, token)
+        file_names = os.listdir(path_to_dir) if os.path.isdir(path_to_dir) else []
+        if len(file_names) != 1:
+            raise HTTPError(404)
+        file_name = file_names[0]
+        path_to_file = os.path.join(path_to_dir, file_name)
+
+        self.set_header('Content-Type', 'application/octet-stream')
+        self.set_header('Content-Disposition', f'attachment; filename="{file_name}"')
+        self.set_header('Content-Length', os.path.getsize(path_to_file))
+
+        logger.info(f'Streaming {file_name}')
+        with open(path_to_file, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                self.write(chunk)
+                try:
+                    # Wait for the chunk to be sent before reading the next one
+                    await self.flush()
+                except StreamClosedError:
+                    logger.warning(f'Download of {file_name} interrupted')
+                    return
+
+
+# ==============================================================================
+# UPLOAD
+# ==============================================================================
+
+def create_upload_key():
+    """
+    Returns a new upload key, to be passed to the browser of a session.
+    """
+    key = uuid.uuid4().hex
+    _upload_keys[key] = set()
+    return key
+
+
+def revoke_upload_key(key):
+    """
+    Refuse the further uploads with the key and remove its uploads.
+    """
+    # An upload in progress is discarded on its next chunk
+    _uploads_in_progress.pop(key, None)
+    for token in _upload_keys.pop(key, set()):
+        remove_upload(token)
+
+
+def get_upload_path(token, key):
+    """
+    Returns the path to a file uploaded with the key, or None if there is none.
+    """
+    if token not in _upload_keys.get(key, set()):
+        return None
+    path_to_dir = os.path.join(PATH_TO_UPLOADS, token)
+    file_names = os.listdir(path_to_dir) if os.path.isdir(path_to_dir) else []
+    if len(file_names) != 1:
+        return None
+    return os.path.join(path_to_dir, file_names[0])
+
+
+def remove_upload(token):
+    for tokens in _upload_keys.values():
+        tokens.discard(token)
+    shutil.rmtree(os.path.join(PATH_TO_UPLOADS, token), ignore_errors=True)
+
+
+def remove_stale_uploads():
+    """
+    Remove the uploads not registered by a session within UPLOAD_TTL_S.
+    Called periodically (see app_hooks.py).
+    """
+    if not os.path.isdir(PATH_TO_UPLOADS):
+        return
+    for token in os.listdir(PATH_TO_UPLOADS):
+        path_to_dir = os.path.join(PATH_TO_UPLOADS, token)
+        try:
+            if time.time() - os.path.getmtime(path_to_dir) > UPLOAD_TTL_S:
+                remove_upload(token)
+        except OSError:
+            # Removed meanwhile
+            continue
+
+
+def _get_uploads_size():
+    """
+    Returns the size in bytes of the uploads on disk and in progress.
+    """
+    size = sum(_uploads_in_progress.values())
+    if os.path.isdir(PATH_TO_UPLOADS):
+        for root, _, file_names in os.walk(PATH_TO_UPLOADS):
+            for file_name in file_names:
+                try:
+                    size += os.path.getsize(os.path.join(root, file_name))
+                except OSError:
+                    continue
+    return size
+
+
+@stream_request_body
+class UploadHandler(RequestHandler):
+    """
+    Receives a file as the raw body of a POST request to
+    /upload?filename=<name>&key=<upload key> and streams it to disk 
+    chunk by chunk. Replies with the token under which the file is stored,
+    to be registered by the session (see IOMixin.upload_file_callback).
+    Each session uploads one file at a time.
+    """
+
+    def initialize(self, max_size):
+        self.max_size = max_size
+        self._file = None
+        self._token = None
+        self._key = None
+        self._received = 0
+
+    def prepare(self):
+        key = self.get_query_argument('key', '')
+        if key not in _upload_keys:
+            raise HTTPError(403, 'Uploads are only accepted from an open session')
+        file_name = os.path.basename(self.get_query_argument('filename', ''))
+        if os.path.splitext(file_name)[1] not in UPLOAD_EXTENSIONS:
+            raise HTTPError(400, f'Only {", ".join(UPLOAD_EXTENSIONS)} files can be uploaded')
+        if 'Content-Length' not in self.request.headers:
+            raise HTTPError(411)
+        content_length = int(self.request.headers['Content-Length'])
+        if content_length > self.max_size:
+            raise HTTPError(413, f'The file exceeds {self.max_size // 1024**2} MB')
+        if key in _uploads_in_progress:
+            raise HTTPError(429, 'Another file is being uploaded')
+        if len(_uploads_in_progress) >= MAX_CONCURRENT_UPLOADS:
+            raise HTTPError(503, 'Too many uploads in progress')
+        if _get_uploads_size() + content_length > MAX_TOTAL_UPLOAD_SIZE_MB * 1024**2:
+            raise HTTPError(503, 'Not enough space for uploads')
+        # The default limit applies to the whole body, 
+        # the streamed chunks are counted in data_received
+        self.request.connection.set_max_body_size(self.max_size)
+
+        self._key = key
+        _uploads_in_progress[key] = content_length
+        self._token = uuid.uuid4().hex
+        _upload_keys[key].add(self._token)
+        path_to_dir = os.path.join(PATH_TO_UPLOADS, self._token)
+        os.makedirs(path_to_dir)
+        self._file = open(os.path.join(path_to_dir, file_name), 'wb')
+        logger.info(f'Receiving {file_name} ({content_length / 1024**2:.1f} MB)')
+
+    def data_received(self, chunk):
+        self._received += len(chunk)
+        if self._received > _uploads_in_progress.get(self._key, 0):
+            # More than announced, or the session was closed meanwhile
+            self._discard()
+            raise HTTPError(413, 'The file exceeds its Content-Length')
+        self._file.write(chunk)
+
+    def post(self):
+        self._file.close()
+        self._file = None
+        _uploads_in_progress.pop(self._key, None)
+        self.write({'token': self._token})
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._token is not None:
+            remove_upload(self._token)
+        _uploads_in_progress.pop(self._key, None)
+
+    def on_finish(self):
+        # Failed upload
+        if self._file is not None:
+            self._discard()
+        _uploads_in_progress.pop(self._key, None)
+
+    def on_connection_close(self):
+        # Interrupted upload
+        self._discard()
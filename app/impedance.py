@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Frequency-domain maps of the input resistance, the transfer resistance
+to the soma and the voltage attenuation for every segment.
+
+NEURON's Impedance class linearizes the cell around its initial state
+and solves for the input and transfer impedance at all locations at
+once, so a whole-cell map takes one solve per frequency instead of a
+simulation per recording site (cf. calculate_voltage_attenuation).
+"""
+
+import numpy as np
+
+# Graph parameters at DC and at the chosen frequency
+IMPEDANCE_PARAMS = {
+    'Rin': 'Input resistance at DC (MΩ)',
+    'Rtransfer': 'Transfer resistance to the soma at DC (MΩ)',
+    'attenuation': 'Voltage attenuation to the soma at DC',
+    'Zin': 'Input impedance at the frequency (MΩ)',
+    'Ztransfer': 'Transfer impedance to the soma at the frequency (MΩ)',
+    'attenuation_f': 'Voltage attenuation to the soma at the frequency',
+}
+
+
+def _calculate_maps(imp, segments, freq, extended):
+    imp.compute(freq, int(extended))
+    n = len(segments)
+    z_in, z_transfer, ratio = np.empty(n), np.empty(n), np.empty(n)
+    for seg in segments:
+        sec, x = seg._section._ref, seg.x
+        z_in[seg.idx] = imp.input(x, sec=sec)
+        z_transfer[seg.idx] = imp.transfer(x, sec=sec)
+        # |v(soma) / v(x)| for a current injected at x
+        ratio[seg.idx] = imp.ratio(x, sec=sec)
+    return z_in, z_transfer, ratio
+
+
+def calculate_impedance_maps(model, freq=100, extended=True):
+    """
+    Calculate the impedance maps of all segments at DC and at freq.
+
+    Parameters
+    ----------
+    model : Model
+        The neuron model.
+    freq : float
+        The frequency in Hz.
+    extended : bool
+        Whether to include the gating dynamics of the active
+        conductances (quasi-active) or only their conductance.
+
+    Returns
+    -------
+    dict
+        The IMPEDANCE_PARAMS as arrays indexed by seg.idx.
+    """
+    from neuron import h
+
+    simulator = model.simulator
+    h.celsius = simulator.temperature
+    # Linearize around the initial state
+    h.finitialize(simulator.v_init)
+
+    imp = h.Impedance()
+    imp.loc(0.5, sec=model.sec_tree.soma._ref)
+
+    segments = model.seg_tree.segments
+    r_in, r_transfer, attenuation = _calculate_maps(imp, segments, 0, extended)
+    z_in, z_transfer, attenuation_f = _calculate_maps(imp, segments, freq, extended)
+
+    return {
+        'Rin': r_in,
+        'Rtransfer': r_transfer,
+        'attenuation': attenuation,
+        'Zin': z_in,
+        'Ztransfer': z_transfer,
+        'attenuation_f': attenuation_f,
+    }
@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Instant preview of the voltage response to the current clamps.
+
+Around its resting state the cell behaves as a linear time-invariant
+system, so the response at every recording site is the response without
+stimulation plus the sum of the current waveforms convolved with the
+impulse responses from each stimulation site. The impulse responses are
+measured once per fingerprint of the model (one run without stimulation
+and one run with a small current step per clamp), after which changing
+the amplitude or the timing of the clamps costs an FFT convolution
+instead of a simulation.
+"""
+
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Amplitude of the current step (nA) used to measure the responses,
+# hyperpolarizing and small enough to stay in the linear regime
+PROBE_AMP = -0.01
+
+# Time (ms) longer than any simulation
+FOREVER = 1e9
+
+
+def get_fingerprint(model, duration):
+    """
+    Returns a hash of everything but the current clamp waveforms
+    that determines the response of the model.
+    """
+    simulator = model.simulator
+    state = {
+        'biophys': model.to_dict(),
+        'mechanisms': {name: mech.to_dict() for name, mech in model.mechanisms.items()},
+        'geometry': [(sec._ref.nseg, sec._ref.L, sec._ref.Ra, [seg.diam for seg in sec._ref])
+                     for sec in model.sec_tree.sections],
+        'simulation': {**simulator.to_dict(), 'duration': duration},
+        'cvode': simulator._cvode,
+        'iclamps': [seg.idx for seg in model.iclamps],
+        'recordings': {var: sorted(seg.idx for seg in recs)
+                       for var, recs in simulator._recordings.items()},
+        'populations': [pop.to_dict() for pop in model.populations.values()],
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _next_pow2(n):
+    return 1 << (int(n) - 1).bit_length()
+
+
+class LinearResponse():
+    """
+    The responses of the model measured for one fingerprint.
+
+    Attributes
+    ----------
+    stimulus_segments : list
+        The segments of the current clamps.
+    recorded_segments : list
+        The segments in which the voltage is recorded.
+    t : np.ndarray
+        The time points of the simulation.
+    v0 : np.ndarray
+        The voltage without stimulation, (n_recorded, n_t).
+    """
+
+    def __init__(self, model, duration):
+        simulator = model.simulator
+        self.stimulus_segments = list(model.iclamps)
+        self.recorded_segments = sorted(simulator.recordings['v'], key=lambda seg: seg.idx)
+        self.dt = simulator.dt
+
+        iclamps = list(model.iclamps.values())
+        saved = [(iclamp.amp, iclamp.delay, iclamp.dur) for iclamp in iclamps]
+        try:
+            for iclamp in iclamps:
+                iclamp.amp = 0
+            simulator.run(duration)
+            self.t = np.asarray(simulator.t)
+            self.v0 = self._get_voltages(simulator)
+
+            n_t = len(self.t)
+            self._n_fft = _next_pow2(2 * n_t)
+            # The FFTs of the impulse responses, (n_stimuli, n_recorded, n_freq)
+            self._responses = np.empty(
+                (len(iclamps), len(self.recorded_segments), self._n_fft // 2 + 1),
+                dtype=complex)
+            for i, iclamp in enumerate(iclamps):
+                iclamp.amp, iclamp.delay, iclamp.dur = PROBE_AMP, 0, FOREVER
+                simulator.run(duration)
+                step_response = (self._get_voltages(simulator) - self.v0) / PROBE_AMP
+                impulse_response = np.diff(step_response, axis=1, prepend=0)
+                self._responses[i] = np.fft.rfft(impulse_response, n=self._n_fft, axis=1)
+                iclamp.amp = 0
+        finally:
+            for iclamp, (amp, delay, dur) in zip(iclamps, saved):
+                iclamp.amp, iclamp.delay, iclamp.dur = amp, delay, dur
+
+    def to_dict(self):
+        """
+        Returns the responses with the segments as seg.idx,
+        to be sent from a worker process (see neuron_worker.py).
+        """
+        return {
+            'stimulus_segments': [seg.idx for seg in self.stimulus_segments],
+            'recorded_segments': [seg.idx for seg in self.recorded_segments],
+            'dt': self.dt,
+            't': self.t,
+            'v0': self.v0,
+            'n_fft': self._n_fft,
+            'responses': self._responses,
+        }
+
+    @classmethod
+    def from_dict(cls, data, segments):
+        """
+        Create the responses measured in a worker process
+        for the session's segments, indexed by seg.idx.
+        """
+        # The responses are not measured again
+        response = cls.__new__(cls)
+        response.stimulus_segments = [segments[idx] for idx in data['stimulus_segments']]
+        response.recorded_segments = [segments[idx] for idx in data['recorded_segments']]
+        response.dt = data['dt']
+        response.t = data['t']
+        response.v0 = data['v0']
+        response._n_fft = data['n_fft']
+        response._responses = data['responses']
+        return response
+
+    def _get_voltages(self, simulator):
+        recordings = simulator.recordings['v']
+        return np.array([recordings[seg] for seg in self.recorded_segments])
+
+    def get_currents(self, model):
+        """
+        Returns the current waveforms of the clamps sampled
+        at the time points of the simulation, (n_stimuli, n_t).
+        """
+        currents = np.zeros((len(self.stimulus_segments), len(self.t)))
+        for i, seg in enumerate(self.stimulus_segments):
+            iclamp = model.iclamps[seg]
+            start = int(round(iclamp.delay / self.dt))
+            stop = int(round((iclamp.delay + iclamp.dur) / self.dt))
+            currents[i, max(start, 0):max(stop, 0)] = iclamp.amp
+        return currents
+
+    def predict(self, model):
+        """
+        Predict the voltage at the recorded segments
+        for the current clamps of the model.
+
+        Returns
+        -------
+        np.ndarray
+            The voltages, (n_recorded, n_t).
+        """
+        currents = np.fft.rfft(self.get_currents(model), n=self._n_fft, axis=1)
+        spectrum = np.einsum('sf,srf->rf', currents, self._responses)
+        dv = np.fft.irfft(spectrum, n=self._n_fft, axis=1)[:, :len(self.t)]
+        return self.v0 + dv
+
+
+class LinearResponseCache():
+    """
+    Keeps the linear responses of the latest fingerprints of a session.
+    """
+
+    def __init__(self, max_entries=2):
+        self.max_entries = max_entries
+        self._responses = OrderedDict()
+
+    def get(self, fingerprint):
+        response = self._responses.get(fingerprint)
+        if response is not None:
+            self._responses.move_to_end(fingerprint)
+        return response
+
+    def add(self, fingerprint, response):
+        self._responses[fingerprint] = response
+        while len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+
+    def clear(self):
+        self._responses.clear()
@@ -1,8 +1,8 @@
 # SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
 # SPDX-License-Identifier: MPL-2.0
 
-import os
-import json
+import sys
+
 import numpy as np
 
 from bokeh.plotting import figure
@@ -12,7 +12,7 @@ from bokeh.io import curdoc
 
 from logger import logger
 
-import dendrotweaks as dd
+from config import load_config, ensure_example_data
 
 # =================================================================
 # CONSTANTS
@@ -30,18 +30,7 @@ AVAILABLE_DOMAINS = [
 # LOAD CONFIG
 # =================================================================
 
-with open('app/default_config.json', 'r') as f:
-    default_config = json.load(f)
-
-with open('app/static/data/user_config.json', 'r') as f:
-    user_config = json.load(f)
-
-for key, value in user_config.items():
-    if isinstance(value, dict) and key in default_config:
-        default_config[key].update(value)
-    else:
-        default_config[key] = value
-config = default_config
+config = load_config()
 
 logger.debug(f'Config: {config}')
 
@@ -49,9 +38,17 @@ theme_name = config['appearance']['theme']
 path_to_data = config['data']['path_to_data']
 simulator = config['simulation']['simulator']
 
-if not os.path.exists(path_to_data) or not os.listdir(path_to_data):
-    os.makedirs(path_to_data, exist_ok=True)
-    dd.download_example_data(path_to_data)
+ensure_example_data(path_to_data)
+
+if config['simulation']['use_workers'] and sys.platform.startswith('win'):
+    # The workers are forked from a fork server, not available on Windows
+    logger.warning('Simulation workers are not supported on Windows')
+    config['simulation']['use_workers'] = False
+
+if config['simulation']['use_workers']:
+    # Pre-warm the simulation workers of this server process
+    from worker_pool import get_pool
+    get_pool(config['simulation']['n_workers'], config['simulation'].get('max_workers', 0))
 
 # =================================================================
 # INITIALIZATION
@@ -88,24 +85,9 @@ curdoc().add_root(settings_panel)
 # FIGURE ADJUSTMENTS
 # ====================================================================================
 
+# The figures of the right menu tab panels are adjusted when the panels are built
 for name, fig in view.figures.items():
-    fig.toolbar.logo = None
-    # fig.background_fill_color = None
-    # logger.info(f'Background color: {fig.background_fill_color}')
-    fig.border_fill_color = None
-    # if name == 'graph':
-    fig.output_backend = "svg"
-    # else:
-    #     fig.output_backend = "webgl"
-    
-
-    if name in ['cell', 'graph']:
-        fig.toolbar.logo = None
-        fig.grid.visible = False
-        
-        fig.axis.visible = False
-        
-        fig.outline_line_color = None
+    view._adjust_figure(name, fig)
 
 # for slider in view.widgets.sliders.values():
 #     slider.background = None
@@ -115,8 +97,24 @@ for name, fig in view.figures.items():
 # ====================================================================================
 
 curdoc().theme = theme_name
+
+# ====================================================================================
+# SESSION LIFECYCLE
+# ====================================================================================
+
+from session_manager import sessions
+sessions.configure(config['server'])
+sessions.register(curdoc(), p)
+
+doc = curdoc()
+doc.on_change(lambda event: p.touch())
+
+def release_session(session_context):
+    p.release_resources()
+    sessions.unregister(doc)
+
+doc.on_session_destroyed(release_session)
 curdoc().on_event('document_ready', lambda event: setattr(view.widgets.selectors['theme'], 'value', theme_name))
-curdoc().on_event('document_ready', lambda event: setattr(view.widgets.selectors['protocol'], 'value', 'Somatic spikes'))
 
 
 curdoc().js_on_event('document_ready', CustomJS(code="""
@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Compilation cache for MOD files.
+
+Each MOD file is compiled once per content and NEURON version into
+`<path_to_cache>/mod/<hash>/` and shared between models and sessions.
+The compiled library is then linked into the mechanism directory
+where the dendrotweaks MODFileLoader expects it, so that the loader
+finds it and skips the compilation (i.e. the mechanism must be loaded
+with recompile=False).
+"""
+
+import os
+import sys
+import uuid
+import shutil
+import hashlib
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import logger
+
+# The architecture directory created by nrnivmodl
+# and checked by the dendrotweaks MODFileLoader
+ARCH_DIR = 'x86_64'
+
+
+def get_mod_hash(path_to_mod_file):
+    """
+    Hash of the MOD file content and the NEURON version.
+    """
+    import neuron
+
+    with open(path_to_mod_file, 'rb') as f:
+        content = f.read()
+    key = b'\0'.join([content, neuron.__version__.encode(), platform.machine().encode()])
+    return hashlib.sha256(key).hexdigest()
+
+
+def _compile(path_to_mod_file, path_to_build):
+    """
+    Compile a MOD file into the cache. The build is done in a temporary
+    directory and moved in place, so concurrent builds of the same
+    file do not interfere.
+    """
+    path_to_tmp = f'{path_to_build}.{uuid.uuid4().hex}.tmp'
+    os.makedirs(path_to_tmp)
+    try:
+        shutil.copy(path_to_mod_file, path_to_tmp)
+        subprocess.run(['nrnivmodl'], cwd=path_to_tmp, check=True,
+                       capture_output=True, text=True)
+        try:
+            os.rename(path_to_tmp, path_to_build)
+        except OSError:
+            # Built by another session in the meantime
+            pass
+    finally:
+        if os.path.exists(path_to_tmp):
+            shutil.rmtree(path_to_tmp, ignore_errors=True)
+
+
+def _get_mechanism_dir(path_to_mod_file):
+    """
+    Returns the mechanism directory used by the MODFileLoader.
+    """
+    mechanism_name = os.path.basename(path_to_mod_file).replace('.mod', '')
+    return os.path.join(os.path.dirname(path_to_mod_file), mechanism_name)
+
+
+def _link(path_to_mod_file, path_to_build):
+    """
+    Link the compiled library into the mechanism directory used by the
+    MODFileLoader. The mechanism directories are shared by the sessions,
+    so nothing in them is deleted: the link is left alone if it already
+    points to the build, and is otherwise replaced atomically.
+    A library compiled there by the MODFileLoader is moved aside.
+    """
+    mechanism_dir = _get_mechanism_dir(path_to_mod_file)
+    path_to_link = os.path.join(mechanism_dir, ARCH_DIR)
+    target = os.path.relpath(os.path.join(path_to_build, ARCH_DIR), mechanism_dir)
+    if os.path.islink(path_to_link) and os.readlink(path_to_link) == target:
+        return
+
+    os.makedirs(mechanism_dir, exist_ok=True)
+    suffix = f'.{uuid.uuid4().hex}.tmp'
+    shutil.copy(path_to_mod_file, path_to_link + suffix)
+    os.replace(path_to_link + suffix, os.path.join(mechanism_dir, os.path.basename(path_to_mod_file)))
+    if os.path.isdir(path_to_link) and not os.path.islink(path_to_link):
+        # May be loaded by a running session, so it is not removed
+        os.rename(path_to_link, f'{path_to_link}.{uuid.uuid4().hex}.old')
+    os.symlink(target, path_to_link + suffix)
+    os.replace(path_to_link + suffix, path_to_link)
+
+
+def _unlink(path_to_mod_file):
+    """
+    Remove a link to a build from the mechanism directory,
+    so that the MODFileLoader compiles the file itself.
+    """
+    path_to_link = os.path.join(_get_mechanism_dir(path_to_mod_file), ARCH_DIR)
+    if os.path.islink(path_to_link):
+        try:
+            os.remove(path_to_link)
+        except FileNotFoundError:
+            pass
+
+
+def prepare_mechanisms(paths_to_mod_files, path_to_cache, rebuild=False):
+    """
+    Make the compiled MOD files available to the MODFileLoader.
+    Files missing from the cache are compiled in parallel.
+
+    Parameters
+    ----------
+    paths_to_mod_files : list[str]
+        The paths to the MOD files.
+    path_to_cache : str
+        The root directory of the cache.
+    rebuild : bool
+        Whether to compile the files even if they are cached.
+
+    Returns
+    -------
+    list[str]
+        The paths to the MOD files that could not be prepared.
+        These are left to be compiled by the MODFileLoader.
+    """
+    if sys.platform.startswith('win'):
+        return list(paths_to_mod_files)
+
+    builds = {path: os.path.join(path_to_cache, 'mod', get_mod_hash(path))
+              for path in paths_to_mod_files if os.path.exists(path)}
+
+    to_compile = {}
+    for path, path_to_build in builds.items():
+        if rebuild and os.path.exists(path_to_build):
+            shutil.rmtree(path_to_build)
+        if not os.path.exists(os.path.join(path_to_build, ARCH_DIR)):
+            to_compile[path] = path_to_build
+
+    failed = [path for path in paths_to_mod_files if path not in builds]
+    if to_compile:
+        logger.info(f'Compiling {len(to_compile)} MOD files')
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {path: executor.submit(_compile, path, path_to_build)
+                       for path, path_to_build in to_compile.items()}
+        for path, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f'Could not compile {path}: {e}')
+
+    for path, path_to_build in builds.items():
+        if os.path.exists(os.path.join(path_to_build, ARCH_DIR)):
+            _link(path, path_to_build)
+        else:
+            # Let the MODFileLoader compile it from scratch
+            _unlink(path)
+            failed.append(path)
+
+    return failed
@@ -0,0 +1,306 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+NEURON side of the simulation workers (see worker_pool.py).
+
+NEURON's `h` is a process-wide singleton, so each session runs its
+simulations in a dedicated worker process. The worker rebuilds the
+session's model from a snapshot (see SimulationMixin.get_simulation_snapshot)
+and keeps it between runs, impedance maps, linear responses and validation
+protocols: the model is rebuilt only when the morphology,
+segmentation or inserted mechanisms change, the parameters are redistributed
+when only their distributions change, and the stimuli are replaced when
+they change.
+
+This module runs in the worker processes and is preloaded by the pool's
+fork server, so it must not import the app logger, which truncates
+app.log on import. Errors are sent back to the session instead.
+"""
+
+import os
+import pickle
+import shutil
+import hashlib
+import tempfile
+import traceback
+
+import numpy as np
+
+import dendrotweaks as dd
+from dendrotweaks.biophys.distributions import Distribution
+from dendrotweaks.stimuli.populations import Population
+from neuron import h
+
+from spike_trains import load_spike_trains
+from impedance import calculate_impedance_maps
+from linear_response import LinearResponse
+from protocols import run_protocol, LAST_RUN_PROTOCOLS
+
+# Mechanisms loaded with the default mechanisms or defined in Python
+DEFAULT_MECHS = ['Leak', 'CaDyn', 'Independent']
+
+# The loader of the default mechanisms, set by the fork server (see worker_preload.py)
+DEFAULT_MOD_LOADER = None
+
+
+def _get_key(*parts):
+    return hashlib.sha256(pickle.dumps(parts)).hexdigest()
+
+
+class SimulationWorker():
+    """
+    Holds the model of a session in a worker process.
+    """
+
+    def __init__(self):
+        self.model = None
+        # Shared between the rebuilt models, as NEURON
+        # loads each compiled mechanism once per process
+        self._mod_loader = DEFAULT_MOD_LOADER
+        self._path_to_tmp = tempfile.mkdtemp(prefix='dendrotweaks_worker_')
+        self._keys = {}
+
+    # ==========================================================================
+    # MODEL
+    # ==========================================================================
+
+    def _create_model_dir(self, path_to_model, model_name):
+        """
+        Create a model directory that shares the biophysics (and thus
+        the compiled MOD files) with the session's model.
+        """
+        path_to_copy = os.path.join(self._path_to_tmp, model_name)
+        if os.path.exists(path_to_copy):
+            shutil.rmtree(path_to_copy)
+        os.makedirs(os.path.join(path_to_copy, 'morphology'))
+        os.symlink(os.path.abspath(os.path.join(path_to_model, 'biophys')),
+                   os.path.join(path_to_copy, 'biophys'))
+        return path_to_copy
+
+    def _build_model(self, snapshot):
+        """
+        Build the model from scratch.
+        """
+        path_to_model = snapshot['path_to_model']
+        model_name = os.path.basename(os.path.normpath(path_to_model))
+        self._clear_model()
+        path_to_copy = self._create_model_dir(path_to_model, model_name)
+
+        with open(os.path.join(path_to_copy, 'morphology', 'cell.swc'), 'w') as f:
+            f.write(snapshot['morphology'])
+
+        model = dd.Model(path_to_model=path_to_copy)
+        if self._mod_loader is None:
+            self._mod_loader = model.mod_loader
+        model.mod_loader = self._mod_loader
+        model.load_morphology('cell', align=False)
+
+        # Domain names are not stored in the SWC file
+        for domain in list(model.domains.values()):
+            name = snapshot['domains'].get(domain.type_idx, domain.name)
+            if name != domain.name:
+                model.update_domain_name(domain.name, name)
+
+        biophys = snapshot['biophys']
+        model.add_default_mechanisms(recompile=False)
+        for mech_name in {mech for mechs in biophys['domains'].values() for mech in mechs}:
+            if mech_name not in DEFAULT_MECHS:
+                model.add_mechanism(mech_name, dir_name='mod', recompile=False)
+        biophys = {**biophys, 'metadata': {**biophys['metadata'], 'name': model.name}}
+        model.from_dict(biophys)
+
+        self._set_nseg(model, snapshot['nseg'])
+        self.model = model
+        self._keys.pop('stimuli', None)
+
+    def _clear_model(self):
+        """
+        Remove the previous model from NEURON. The worker serves
+        a single session, so all sections can be deleted.
+        """
+        if self.model is not None:
+            self.model.remove_all_stimuli()
+            self.model.remove_all_recordings()
+            self.model = None
+        for sec in h.allsec():
+            h.delete_section(sec=sec)
+
+    @staticmethod
+    def _set_nseg(model, nseg):
+        """
+        Apply the segmentation of the session, which may differ
+        from the d_lambda rule for manually edited sections.
+        """
+        if [sec.nseg for sec in model.sec_tree.sections] == nseg:
+            return
+        for sec, n in zip(model.sec_tree.sections, nseg):
+            if sec.nseg != n:
+                sec.nseg = n
+        model.distribute_all()
+
+    def _update_params(self, snapshot):
+        self.model.params = {
+            param_name: {
+                group_name: (distribution if isinstance(distribution, str)
+                             else Distribution.from_dict(distribution))
+                for group_name, distribution in distributions.items()
+            }
+            for param_name, distributions in snapshot['biophys']['params'].items()
+        }
+        self.model.distribute_all()
+
+    # ==========================================================================
+    # STIMULI
+    # ==========================================================================
+
+    def _update_stimuli(self, snapshot):
+        model = self.model
+        stimuli = snapshot['stimuli']
+        sections = model.sec_tree.sections
+
+        model.remove_all_stimuli()
+        model.remove_all_recordings()
+        model.simulator.from_dict(stimuli['simulation'])
+        model.simulator._cvode = stimuli['cvode']
+
+        for sec_idx, loc, amp, delay, dur in stimuli['iclamps']:
+            model.add_iclamp(sections[sec_idx], loc, amp, delay, dur)
+
+        for pop_data in stimuli['populations']:
+            syn_locs = [(sections[sec_idx], loc) for sec_idx, loc in pop_data['syn_locs']]
+            pop = Population(name=pop_data['name'],
+                             segments=[sec(loc) for sec, loc in syn_locs],
+                             N=pop_data['N'],
+                             syn_type=pop_data['syn_type'])
+            pop.allocate_synapses(syn_locs=syn_locs)
+            pop.update_kinetic_params(**pop_data['kinetic_params'])
+            pop.input_params.update(pop_data['input_params'])
+            # Play the spike times of the session's synapses
+            load_spike_trains(pop, pop_data['spike_times'], pop_data['spike_counts'])
+            model._add_population(pop)
+
+        for sec_idx, loc, var in stimuli['recordings']:
+            model.add_recording(sections[sec_idx], loc, var=var)
+
+    # ==========================================================================
+    # RUN
+    # ==========================================================================
+
+    def update(self, snapshot):
+        """
+        Bring the model up to date with the snapshot.
+        """
+        biophys = snapshot['biophys']
+        keys = {
+            'model': _get_key(snapshot['path_to_model'], snapshot['morphology'],
+                              snapshot['domains'], snapshot['nseg'], biophys['d_lambda'],
+                              biophys['domains'], biophys['groups']),
+            'params': _get_key(biophys['params']),
+            'stimuli': _get_key(snapshot['stimuli']),
+        }
+        if self.model is None or keys['model'] != self._keys.get('model'):
+            self._build_model(snapshot)
+        elif keys['params'] != self._keys.get('params'):
+            self._update_params(snapshot)
+        if keys['stimuli'] != self._keys.get('stimuli'):
+            self._update_stimuli(snapshot)
+        self._keys = keys
+
+    def run(self, snapshot, duration):
+        """
+        Run the simulation and return the time vector and the recordings
+        as {var: {seg.idx: values}}.
+        """
+        self.update(snapshot)
+        simulator = self.model.simulator
+        simulator.run(duration)
+        recordings = {
+            var: {seg.idx: np.array(vec) for seg, vec in recs.items()}
+            for var, recs in simulator.recordings.items()
+        }
+        return {'t': np.array(simulator.t), 'recordings': recordings}
+
+    def calculate_impedance_maps(self, snapshot, freq):
+        """
+        Calculate the impedance maps (see impedance.py), 
+        or return None if the impedance can not be calculated.
+        """
+        self.update(snapshot)
+        try:
+            return calculate_impedance_maps(self.model, freq=freq)
+        except RuntimeError:
+            return None
+
+    def measure_linear_response(self, snapshot, duration):
+        """
+        Measure the linear responses (see linear_response.py).
+        """
+        self.update(snapshot)
+        return LinearResponse(self.model, duration).to_dict()
+
+    def run_protocol(self, snapshot, protocol, kwargs, duration):
+        """
+        Run a validation protocol (see protocols.py) and return its data
+        with the NEURON vectors converted to arrays. The protocols that
+        analyse the latest run are run after a simulation of the duration.
+        """
+        self.update(snapshot)
+        if protocol in LAST_RUN_PROTOCOLS:
+            self.model.simulator.run(duration)
+        try:
+            return _to_plain(run_protocol(self.model, protocol, **kwargs))
+        finally:
+            # The protocols leave their last stimulus in the model
+            self._keys.pop('stimuli', None)
+
+    def close(self):
+        shutil.rmtree(self._path_to_tmp, ignore_errors=True)
+
+
+def _to_plain(value):
+    """
+    Convert the NEURON vectors in the value to arrays, to be pickled.
+    """
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_plain(item) for item in value)
+    if hasattr(value, 'as_numpy'):
+        return np.array(value)
+    return value
+
+
+def serve(conn):
+    """
+    The main loop of a worker process. Receives (command, args)
+    and replies with ('ok', result) or ('error', traceback).
+    """
+    worker = SimulationWorker()
+    try:
+        while True:
+            try:
+                command, args = conn.recv()
+            except EOFError:
+                break
+            if command == 'close':
+                break
+            try:
+                if command == 'ping':
+                    result = os.getpid()
+                elif command == 'run':
+                    result = worker.run(*args)
+                elif command == 'impedance_maps':
+                    result = worker.calculate_impedance_maps(*args)
+                elif command == 'linear_response':
+                    result = worker.measure_linear_response(*args)
+                elif command == 'protocol':
+                    result = worker.run_protocol(*args)
+                else:
+                    raise ValueError(f'Unknown command: {command}')
+                conn.send(('ok', result))
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+    finally:
+        worker.close()
+        conn.close()
@@ -9,6 +9,13 @@ from bokeh_utils import log
 from logger import logger
 
 from utils import get_seg_name, get_sec_type, get_sec_name, get_sec_id
+from utils import simplify_polyline
+
+# Maximum deviation (in pixels) of the displayed section polylines
+# from the original points
+DECIMATION_TOLERANCE_PX = 0.5
+# Below this level (tolerance of 2**level μm) the points are shown as is
+MIN_DECIMATION_LEVEL = -3
 
 class CellMixin():
 
@@ -17,19 +24,45 @@ class CellMixin():
         super().__init__()
         self.selected_secs = set()
         self.selected_segs = []
+        self._applied_rotation = 0
+        self._cell_points_cache = {}
+        self._cell_level = None
+        self._cell_units_per_px = None
 
     @property
     def selected_sec(self):
         return list(self.selected_secs)[0] if len(self.selected_secs) == 1 else None
 
-    @property
-    def xs(self):
-        return [[pt.x for pt in sec.points] for sec in self.model.sec_tree]
+    def get_points(self, level=None):
+        """
+        Returns the 3D coordinates of the section points as flat arrays
+        together with the offsets of each section in these arrays.
+
+        If level is given, the section polylines are simplified for display
+        with a tolerance of 2**level μm. The simplification is done in 3D,
+        so it remains valid for any rotation of the cell. The results are 
+        cached per level until the cell renderer is recreated.
+        """
+        if level in self._cell_points_cache:
+            return self._cell_points_cache[level]
+
+        xs, ys, zs, offsets = [], [], [], [0]
+        for sec in self.model.sec_tree:
+            coords = np.column_stack((sec.xs, sec.ys, sec.zs))
+            if level is not None:
+                coords = coords[simplify_polyline(coords, 2.0**level)]
+            xs.extend(coords[:, 0])
+            ys.extend(coords[:, 1])
+            zs.extend(coords[:, 2])
+            offsets.append(len(xs))
+
+        points = (np.array(xs, dtype=np.float32), 
+                  np.array(ys, dtype=np.float32), 
+                  np.array(zs, dtype=np.float32), 
+                  np.array(offsets, dtype=np.int32))
+        self._cell_points_cache[level] = points
+        return points
 
-    @property
-    def ys(self):
-        return [[pt.y for pt in sec.points] for sec in self.model.sec_tree]
-            
     @property
     def colors(self):
         return [sec.domain_color for sec in self.model.sec_tree]
@@ -51,17 +84,37 @@ class CellMixin():
     def _create_cell_renderer(self):
         """
         Create the cell renderer.
+        The coordinates are sent once as flat arrays, the rotation 
+        and projection are done on the client side.
         """
-        self.view.sources['cell'].data = self.get_cell_data()
+        self._cell_points_cache = {}
+        units_per_px = self._cell_units_per_px or self._get_cell_extent_per_px()
+        self._cell_level = self._get_decimation_level(units_per_px)
+        x, y, z, offsets = self.get_points(self._cell_level)
+        self.view.sources['cell_points'].data = {'x': x, 'y': y, 'z': z}
+        self.view.sources['cell'].data = self.get_cell_data(offsets)
+        self._update_cell_rotation_data()
         # self.view.sources['soma'].data = self.get_soma_data()
 
-    def get_cell_data(self):
-        return {'xs': self.xs, 
-                'ys': self.ys, 
+    def get_cell_data(self, offsets):
+        return {'start': offsets[:-1], 
+                'stop': offsets[1:], 
                 'line_color': self.colors, 
                 'line_width': self.line_widths, 
                 'label': self.labels}
 
+    def _update_cell_rotation_data(self):
+        """
+        Update the angle already applied to the model point tree 
+        and the center of rotation used by the client-side transform.
+        """
+        cx, cy, cz = self.model.point_tree.soma_center
+        self.view.sources['cell_rotation'].data = {
+            'angle': [self._applied_rotation],
+            'cx': [cx],
+            'cz': [cz]
+        }
+
     def get_soma_data(self):
         x, y, z = self.model.sec_tree.soma_center
         return {'x': [x],
@@ -81,9 +134,68 @@ class CellMixin():
             logger.debug(f'Indices: {indices}')
             self.view.figures['cell'].renderers[0].data_source.selected.indices = indices
 
-    def rotate_cell_renderer_callback(self, attr, old, new):
+    def _reset_cell_view(self):
+        """
+        Treat the current slider angle as the orientation of a newly 
+        loaded morphology and fit the level of detail to its extent.
+        """
+        self._applied_rotation = self.view.widgets.sliders['rotate_cell'].value
+        self._cell_units_per_px = None
+
+    @log
+    def _apply_cell_rotation(self):
         """
-        Rotate the cell renderer around the XY axis. Attaches to the rotation slider.
+        Apply the rotation shown in the browser to the model point tree. 
+        Call before operations that depend on the actual point coordinates
+        (e.g., exporting the morphology).
         """
-        self.model.point_tree.rotate(new - old)
-        self.view.sources['cell'].data = self.get_cell_data()
+        angle = self.view.widgets.sliders['rotate_cell'].value
+        if angle == self._applied_rotation:
+            return
+        self.model.point_tree.rotate(angle - self._applied_rotation)
+        self._applied_rotation = angle
+        self._create_cell_renderer()
+
+    # ==========================================================================
+    # LEVEL OF DETAIL
+    # ==========================================================================
+
+    def _get_cell_extent_per_px(self):
+        """
+        Estimate the data units per pixel when the whole cell is shown.
+        """
+        x, y, z, _ = self.get_points()
+        if len(x) == 0:
+            return None
+        fig = self.view.figures['cell']
+        width = max(np.ptp(x), np.ptp(z))
+        return max(width / fig.width, np.ptp(y) / fig.height)
+
+    @staticmethod
+    def _get_decimation_level(units_per_px):
+        """
+        Quantize the display tolerance to a power of 2 so that 
+        the simplified points can be cached and reused.
+        Returns None if the points should be shown at full resolution.
+        """
+        if not units_per_px or not np.isfinite(units_per_px):
+            return None
+        level = int(np.floor(np.log2(DECIMATION_TOLERANCE_PX * units_per_px)))
+        return level if level >= MIN_DECIMATION_LEVEL else None
+
+    def cell_ranges_callback(self, event):
+        """
+        Update the level of detail of the cell renderer on zoom.
+        """
+        fig = self.view.figures['cell']
+        self._cell_units_per_px = max((event.x1 - event.x0) / fig.width, 
+                                      (event.y1 - event.y0) / fig.height)
+        level = self._get_decimation_level(self._cell_units_per_px)
+        if level == self._cell_level or len(self.view.sources['cell'].data['start']) == 0:
+            return
+        
+        x, y, z, offsets = self.get_points(level)
+        self.view.sources['cell_points'].data = {'x': x, 'y': y, 'z': z}
+        self.view.sources['cell'].data.update(start=offsets[:-1], stop=offsets[1:])
+        self._cell_level = level
+        logger.debug(f'Cell level of detail: {level}, points: {len(x)}')
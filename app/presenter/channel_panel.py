@@ -1,8 +1,18 @@
 # SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
 # SPDX-License-Identifier: MPL-2.0
 
+import os
+import json
+import asyncio
+import hashlib
+import multiprocessing
 import numpy as np
 import pprint
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from bokeh.document import without_document_lock
+from bokeh.io import curdoc
 
 from bokeh_utils import remove_callbacks
 from bokeh_utils import log
@@ -16,10 +26,19 @@ from bokeh.layouts import row, column
 from bokeh.models import Div
 from bokeh.palettes import Bokeh
 
+from standardization import fit_standard_channel
+
 # from model.mechanisms.channels import StandardIonChannel
 
 # from model.mechanisms.distributions import Distribution
 
+# Temperature (°C) at which the kinetics curves are shown
+KINETICS_TEMPERATURE = 37
+# Maximum number of cached kinetics curves
+KINETICS_CACHE_SIZE = 256
+# Mechanisms without kinetics
+NON_KINETIC_MECHS = ['Independent', 'Leak', 'CaDyn']
+
 
 class ChannelMixin():
     """ This class is a mixin for the Presenter class. 
@@ -29,26 +48,229 @@ class ChannelMixin():
     def __init__(self):
         logger.debug('ChannelMixin init')
         super().__init__()
-  
+        self._kinetics_cache = {}
+        self._kinetics_lock = threading.Lock()
+
+    # -----------------------------------------------------------------
+    # KINETICS
+    # -----------------------------------------------------------------
+
+    def get_kinetics_data(self, mech, temperature=KINETICS_TEMPERATURE):
+        """
+        Returns the inf/tau curves of the mechanism, cached by 
+        the mechanism name, its parameter values and the temperature.
+        """
+        key = (mech.name, tuple(sorted(mech.params.items())), temperature)
+        with self._kinetics_lock:
+            data = self._kinetics_cache.get(key)
+        if data is None:
+            data = mech.get_data(temperature=temperature, verbose=False)
+            with self._kinetics_lock:
+                if len(self._kinetics_cache) >= KINETICS_CACHE_SIZE:
+                    self._kinetics_cache.pop(next(iter(self._kinetics_cache)))
+                self._kinetics_cache[key] = data
+        # Shallow copy, callers pop the 'x' key
+        return dict(data)
+
+    def precompute_kinetics(self):
+        """
+        Compute the kinetics curves of all loaded channels 
+        in a background thread.
+        """
+        mechs = [mech for mech_name, mech in self.model.mechanisms.items()
+                 if mech_name not in NON_KINETIC_MECHS]
+
+        def target():
+            for mech in mechs:
+                try:
+                    self.get_kinetics_data(mech)
+                except Exception as e:
+                    logger.warning(f'Could not precompute kinetics for {mech.name}: {e}')
+            logger.info(f'Precomputed kinetics for {len(mechs)} mechanisms')
+
+        threading.Thread(target=target, daemon=True).start()
+
+
+    # -----------------------------------------------------------------
+    # STANDARDIZATION
+    # -----------------------------------------------------------------
+
+    @property
+    def standardizable_channels(self):
+        from dendrotweaks.biophys import StandardIonChannel
+        from dendrotweaks.biophys.mechanisms import FallbackChannel
+
+        return [mech_name for mech_name, mech in self.model.mechanisms.items()
+                if mech_name not in NON_KINETIC_MECHS 
+                and not mech_name.startswith('std')
+                and not isinstance(mech, (StandardIonChannel, FallbackChannel))]
+
+    def _get_fit_cache_path(self, channel):
+        """
+        Returns the path to the cached fit of a channel, keyed by the hash 
+        of its MOD file content and of the params, the temperature and the 
+        state powers that determine the fitted data.
+        """
+        path_to_mod_file = self.model.path_manager.get_abs_path(f'mod/{channel.name}.mod')
+        with open(path_to_mod_file, 'rb') as f:
+            content = f.read()
+        state = json.dumps({
+            'params': channel.params,
+            'temperature': channel.params.get('temp'),
+            'state_powers': channel._state_powers,
+        }, sort_keys=True, default=str)
+        fit_hash = hashlib.sha256(content + state.encode()).hexdigest()
+        path_to_cache = self.config['data'].get('path_to_cache', 'app/.cache')
+        return os.path.join(path_to_cache, 'standardization', f'{fit_hash}.json')
 
     @log
-    def standardize_callback(self, event):
+    def fit_standard_channels(self, ch_names, callback):
+        """
+        Fit the standard kinetics to the channels and pass the fitted 
+        parameters by channel name to the callback. Cached fits are read 
+        from disk, the rest are fitted in parallel in a process pool 
+        without blocking the server, and written to the cache.
+        """
+        fits = {}
+        to_fit = {}
+        for ch_name in ch_names:
+            channel = self.model.mechanisms[ch_name]
+            path_to_fit = self._get_fit_cache_path(channel)
+            if os.path.exists(path_to_fit):
+                with open(path_to_fit, 'r') as f:
+                    fits[ch_name] = json.load(f)
+                logger.info(f'Using cached fit for {ch_name}')
+            else:
+                data = channel.get_data(temperature=channel.params.get('temp'), verbose=False)
+                args = (ch_name, channel._state_powers, channel.ion, dict(channel.params), data)
+                to_fit[ch_name] = (path_to_fit, args)
 
-        ch_name = self.view.widgets.selectors['mechanism'].value
-        
-        self.model.standardize_channel(ch_name)
+        if not to_fit:
+            callback(fits)
+            return
+
+        # Not forked from the server, which runs threads and has NEURON loaded
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(start_method)
+        doc = curdoc()
+
+        @without_document_lock
+        async def fit():
+            loop = asyncio.get_running_loop()
+            executor = ProcessPoolExecutor(max_workers=min(len(to_fit), os.cpu_count() or 1),
+                                           mp_context=context)
+            try:
+                futures = [loop.run_in_executor(executor, fit_standard_channel, *args)
+                           for _, args in to_fit.values()]
+                results = await asyncio.gather(*futures)
+            except Exception as e:
+                logger.error(f'Standardization failed: {e}')
+                doc.add_next_tick_callback(
+                    lambda: self.update_status_message('Standardization failed.', status='error'))
+                return
+            finally:
+                # Do not block the event loop on the shutdown of the processes
+                executor.shutdown(wait=False, cancel_futures=True)
+            for ch_name, result in zip(to_fit, results):
+                fits[ch_name] = result
+                path_to_fit = to_fit[ch_name][0]
+                os.makedirs(os.path.dirname(path_to_fit), exist_ok=True)
+                with open(path_to_fit, 'w') as f:
+                    json.dump(result, f, indent=4)
+            doc.add_next_tick_callback(lambda: callback(fits))
+
+        doc.add_next_tick_callback(fit)
+
+    def _standardize_channel(self, ch_name, fitted_params):
+        """
+        Replace the channel with its standardized version.
+        Same as Model.standardize_channel, but the fit is taken 
+        from fitted_params instead of being done again.
+        """
+        from dendrotweaks.biophys import StandardIonChannel
+        from dendrotweaks.biophys.io.code_generators import NMODLCodeGenerator
+
+        model = self.model
+        channel = model.mechanisms[ch_name]
+        channel_domain_names = [domain_name for domain_name, mech_names 
+            in model.domains_to_mechs.items() if ch_name in mech_names]
+        gbar_distributions = model.params[f'gbar_{ch_name}']
 
+        for domain_name in model.domains:
+            if ch_name in model.domains_to_mechs[domain_name]:
+                model.uninsert_mechanism(ch_name, domain_name)
+        model.mechanisms.pop(ch_name)
+
+        standard_channel = StandardIonChannel(name=f'std{ch_name}', 
+                                              state_powers=channel._state_powers, 
+                                              ion=channel.ion)
+        for param in ['q10', 'temp']:
+            if param in channel.params:
+                standard_channel.params[param] = channel.params[param]
+        standard_channel.set_tadj(channel.params.get('temp'))
+        standard_channel.params.update(fitted_params)
+        standard_channel.range_params.update(fitted_params)
+
+        paths = model.path_manager.get_standard_channel_paths(ch_name)
+        generator = NMODLCodeGenerator()
+        generator.generate(standard_channel, paths['path_to_mod_template'])
+        generator.write_file(paths['path_to_standard_mod_file'])
+
+        model.mechanisms[standard_channel.name] = standard_channel
+        self.prepare_mechanisms([standard_channel.name])
+        model.load_mechanism(standard_channel.name, recompile=False)
+
+        for domain_name in channel_domain_names:
+            model.insert_mechanism(standard_channel.name, domain_name)
+
+        for group_name, distribution in gbar_distributions.items():
+            model.set_param(f'gbar_{standard_channel.name}', group_name, 
+                distribution.function_name, **distribution.parameters)
+
+    def _update_widgets_on_standardize(self):
         self._update_multichoice_domain_widget()
         self._update_mechs_to_insert_widget()
         self._update_multichoice_mechanisms_widget()
-        
         self._update_mechanism_selector_widget()
         self._update_recording_variable_selector_widget()
+
+    @log
+    def standardize_all_callback(self, event):
+
+        ch_names = self.standardizable_channels
+        if not ch_names:
+            self.update_status_message('No channels to standardize.', status='warning')
+            return
+
+        self.fit_standard_channels(ch_names, self._standardize_all)
+
+    def _standardize_all(self, fits):
+        if self.model is None:
+            return
+        for ch_name, fitted_params in fits.items():
+            self._standardize_channel(ch_name, fitted_params)
+
+        self._update_widgets_on_standardize()
+        self.update_status_message(f'Standardized {len(fits)} channels.', status='success')
+
+    @log
+    def standardize_callback(self, event):
+
+        ch_name = self.view.widgets.selectors['mechanism'].value
+        self.fit_standard_channels([ch_name], 
+                                   lambda fits: self._standardize_selected(ch_name, fits[ch_name]))
+
+    def _standardize_selected(self, ch_name, fitted_params):
+        if self.model is None:
+            return
+        self._standardize_channel(ch_name, fitted_params)
+
+        self._update_widgets_on_standardize()
         self._select_mechanism(f'std{ch_name}')
         self.view.widgets.buttons['standardize'].visible = False
         
         standard_ch = self.model.mechanisms[f'std{ch_name}']
-        data = standard_ch.get_data()
+        data = self.get_kinetics_data(standard_ch)
         x = data.pop('x')
         # data is of the form {'state_var': {'inf': [], 'tau': []}}
 
@@ -14,14 +14,12 @@ from bokeh.plotting import from_networkx
 from bokeh.models import Circle, MultiLine
 from bokeh.models import CategoricalColorMapper, LinearColorMapper
 
+from impedance import IMPEDANCE_PARAMS, calculate_impedance_maps
+from spike_features import SPIKE_PARAMS, calculate_spike_maps
+
 from utils import timeit
 from utils import get_seg_name, get_sec_type, get_sec_name, get_sec_id
 
-import networkx as nx
-from networkx.drawing.nx_agraph import graphviz_layout 
-import numpy as np
-from neuron import h
-
 from logger import logger
 
 from bokeh.palettes import Spectral11
@@ -35,6 +33,8 @@ class GraphMixin():
         logger.debug('GraphMixin init')
         super().__init__()
         self.G = None
+        self._impedance_maps = {}
+        self._spike_maps = {}
 
     # ========================================================================================================
     # CREATE GRAPH
@@ -49,6 +49,8 @@ class GraphMixin():
         # self.G = neuron_to_seg_graph(self.model.cell)
         self.G = nx.Graph()
         total_nseg = len(self.model.seg_tree)
+        distances = self.get_path_distances()
+        domain_distances = self.get_path_distances(within_domain=True)
         for seg in self.model.seg_tree:
             radius = int(200/np.sqrt(total_nseg)) if seg.domain_name == 'soma' else int(150/np.sqrt(total_nseg))
             self.G.add_node(seg.idx, 
@@ -61,8 +63,8 @@ class GraphMixin():
                             section_diam = seg._section.diam,
                             area = seg.area,
                             subtree_size = seg.subtree_size,
-                            distance = seg.path_distance(),
-                            domain_distance = seg.path_distance(within_domain=True),
+                            distance = distances[seg.idx],
+                            domain_distance = domain_distances[seg.idx],
                             length=seg._section.length,
                             rec_v='None',
                             iclamps=0,
@@ -88,6 +90,8 @@ class GraphMixin():
         if graph_layout == 'kamada-kawai':
             pos = nx.kamada_kawai_layout(self.G, scale=1, center=(0, 0), dim=2)
         elif graph_layout in ['dot', 'neato', 'twopi']:
+            # Loads the graphviz bindings
+            from networkx.drawing.nx_agraph import graphviz_layout
             pos = graphviz_layout(self.G, 
                 prog=graph_layout,
                 root=0)
@@ -136,6 +140,32 @@ class GraphMixin():
         self.add_lasso_callback()
 
 
+    def _get_domain_color_mapper(self):
+        return self.view.pool.get(
+            'domain', CategoricalColorMapper,
+            palette=[domain.color for domain in self.model.domains.values()], 
+            factors=[domain.name for domain in self.model.domains.values()]
+        )
+
+    def _get_traces_color_mapper(self):
+        labels = [str(seg.idx) for seg in self._recorded_segments]
+        return self.view.pool.get(
+            'traces', CategoricalColorMapper,
+            palette=cc.glasbey_light, 
+            factors=labels, 
+            nan_color=self.view.theme.graph_colors['node_fill']
+        )
+
+    def _get_param_color_mapper(self, palette, low=None, high=None, nan_color='gray'):
+        # All the properties are set, as the mapper is shared by the parameters
+        return self.view.pool.get(
+            'param', LinearColorMapper,
+            palette=palette, 
+            low=low, 
+            high=high, 
+            nan_color=nan_color
+        )
+
     def _update_glyph(self, graph_renderer):
 
         graph_renderer.node_renderer.glyph = Circle(radius='radius',
@@ -146,8 +176,7 @@ class GraphMixin():
                                                     line_width='line_width')
         # fill
         graph_renderer.node_renderer.glyph.fill_alpha = 0.8
-        color_mapper = CategoricalColorMapper(palette=[domain.color for domain in self.model.domains.values()],
-                                              factors=[domain for domain in self.model.domains])
+        color_mapper = self._get_domain_color_mapper()
         graph_renderer.node_renderer.glyph.fill_color = {'field': 'domain', 'transform': color_mapper}
         # line
         graph_renderer.node_renderer.glyph.line_color = self.view.theme.graph_colors['edge']
@@ -170,8 +199,7 @@ class GraphMixin():
                                                               line_width='line_width')
         # fill
         graph_renderer.node_renderer.selection_glyph.fill_alpha = 1
-        color_mapper = CategoricalColorMapper(palette=[domain.color for domain in self.model.domains.values()],
-                                              factors=[domain for domain in self.model.domains])
+        color_mapper = self._get_domain_color_mapper()
         graph_renderer.node_renderer.selection_glyph.fill_color = {'field': 'domain', 'transform': color_mapper}
         # line 
         graph_renderer.node_renderer.selection_glyph.line_color = self.view.theme.graph_colors['edge']
@@ -189,8 +217,7 @@ class GraphMixin():
                                                             line_width='line_width')
         # fill
         graph_renderer.node_renderer.nonselection_glyph.fill_alpha = 0.3
-        color_mapper = CategoricalColorMapper(palette=[domain.color for domain in self.model.domains.values()],
-                                              factors=[domain for domain in self.model.domains])
+        color_mapper = self._get_domain_color_mapper()
         graph_renderer.node_renderer.nonselection_glyph.fill_color = {'field': 'domain', 'transform': color_mapper}
         # line
         graph_renderer.node_renderer.nonselection_glyph.line_alpha = 0.2 #0.7
@@ -241,8 +268,26 @@ class GraphMixin():
         """
         logger.info(f'Updating graph parameter {param_name}')
 
-        self.view.figures['graph'].renderers[0].node_renderer.data_source.data[param_name] = \
-            [self._get_param_value(seg, param_name) for seg in self.model.seg_tree]
+        self.view.widgets.numeric['impedance_freq'].visible = param_name in IMPEDANCE_PARAMS
+        if param_name in IMPEDANCE_PARAMS and self.worker is not None:
+            # The maps are shown when the worker has calculated them
+            self._update_impedance_maps_in_worker(param_name, update_colors)
+            return
+        if param_name in IMPEDANCE_PARAMS:
+            # All the maps come from the same solve
+            self._update_impedance_maps()
+            values = self._impedance_maps[param_name].tolist()
+        elif param_name in SPIKE_PARAMS:
+            self._update_spike_maps()
+            values = self._spike_maps[param_name].tolist()
+        elif param_name in self.model.populations:
+            values = self._get_population_counts(param_name).tolist()
+        else:
+            values = [self._get_param_value(seg, param_name) for seg in self.model.seg_tree]
+        self._set_graph_param_values(param_name, values, update_colors)
+
+    def _set_graph_param_values(self, param_name, values, update_colors=True):
+        self.view.figures['graph'].renderers[0].node_renderer.data_source.data[param_name] = values
         # self.view.figures['graph'].renderers[0].node_renderer.data_source.data[param_name] = [self.G.nodes[n][param_name][0] for n in self.G.nodes]
 
         if update_colors: self._update_graph_colors(param_name)
@@ -250,6 +295,70 @@ class GraphMixin():
         self.update_section_param_data(param_name)
 
 
+    @log
+    @timeit
+    def _update_impedance_maps(self):
+        """
+        Calculate the input and transfer impedance and the attenuation
+        of all segments (see impedance.py).
+        """
+        freq = self.view.widgets.numeric['impedance_freq'].value or 0
+        try:
+            self._impedance_maps = calculate_impedance_maps(self.model, freq=freq)
+        except RuntimeError as e:
+            # E.g. a singular matrix at DC without membrane conductances
+            logger.error(f'Error calculating impedance: {e}')
+            n = len(self.model.seg_tree)
+            self._impedance_maps = {name: np.full(n, np.nan) for name in IMPEDANCE_PARAMS}
+            self.update_status_message('Error calculating impedance. Check the membrane mechanisms.', 
+                                       status='error')
+
+    def _update_impedance_maps_in_worker(self, param_name, update_colors=True):
+        """
+        Calculate the impedance maps in the session's worker, as the
+        NEURON initialization would reset the state of the other sessions.
+        """
+        freq = self.view.widgets.numeric['impedance_freq'].value or 0
+
+        def callback(maps, runtime):
+            if maps is None:
+                n = len(self.model.seg_tree)
+                maps = {name: np.full(n, np.nan) for name in IMPEDANCE_PARAMS}
+                self.update_status_message('Error calculating impedance. Check the membrane mechanisms.', 
+                                           status='error')
+            self._impedance_maps = maps
+            if self.view.widgets.selectors['graph_param'].value == param_name:
+                self._set_graph_param_values(param_name, maps[param_name].tolist(), update_colors)
+
+        snapshot = self.get_simulation_snapshot()
+        self._call_in_worker('impedance_maps', snapshot, freq, 
+                             callback=callback, error_message='Error calculating impedance.')
+
+    @log
+    @timeit
+    def _update_spike_maps(self):
+        """
+        Extract the spike features of all the segments
+        recorded in the latest run (see spike_features.py).
+        """
+        t, recordings = self._last_run or ([], {})
+        self._spike_maps = calculate_spike_maps(self.model, t, recordings.get('v', {}))
+
+    def impedance_freq_callback(self, attr, old, new):
+        param_name = self.view.widgets.selectors['graph_param'].value
+        if param_name in IMPEDANCE_PARAMS:
+            self._update_graph_param(param_name, update_colors=True)
+
+    def _get_population_counts(self, population_name):
+        """
+        Returns the number of synapses of a population on each segment,
+        counted in one pass over the synapses instead of per segment.
+        """
+        counts = np.zeros(len(self.model.seg_tree), dtype=int)
+        for (sec, x), syns in self.model.populations[population_name].synapses.items():
+            counts[sec(x).idx] += len(syns)
+        return counts
+
     def _remove_graph_param(self, param_name):
         """
         Removes the parameter from the graph data source.
@@ -292,9 +401,9 @@ class GraphMixin():
         elif param_name == 'Ra':
             return seg._section._ref.Ra
         elif param_name == 'domain_distance':
-            return seg.path_distance(within_domain=True)
+            return self.get_path_distances(within_domain=True)[seg.idx]
         elif param_name == 'distance':
-            return seg.path_distance()
+            return self.get_path_distances()[seg.idx]
         elif param_name == 'section_diam':
             return seg._section._ref.diam
         elif param_name == 'domain':
@@ -332,41 +441,33 @@ class GraphMixin():
         self.view.widgets.sliders['graph_param_high'].visible = False
 
         if param == 'domain': 
-            color_mapper = CategoricalColorMapper(
-                palette=[domain.color for domain in self.model.domains.values()], 
-                factors=[domain.name for domain in self.model.domains.values()]
-            )
+            color_mapper = self._get_domain_color_mapper()
             self.view.widgets.sliders['graph_param_high'].visible = False
         elif param.startswith('rec_'):
-            labels = [str(seg.idx) for seg in self._recorded_segments]
-            color_mapper = CategoricalColorMapper(
-                palette=cc.glasbey_light, 
-                factors=labels, 
-                nan_color=self.view.theme.graph_colors['node_fill']
-            )
+            color_mapper = self._get_traces_color_mapper()
             self.view.widgets.sliders['graph_param_high'].visible = False
         # elif param == 'voltage':
         #     color_mapper = LinearColorMapper(palette=cc.bmy, low=-70, high=40)
         #     self.view.widgets.sliders['time_slice'].visible = True
         else:
             if param == 'iclamps':
-                color_mapper = LinearColorMapper(palette=['red'], high=1, nan_color=self.view.theme.graph_colors['node_fill'])
+                color_mapper = self._get_param_color_mapper(palette=['red'], high=1, nan_color=self.view.theme.graph_colors['node_fill'])
             elif param in self.model.populations:
                 pop = self.model.populations[param]
                 syn_type = pop.syn_type
                 if syn_type == 'AMPA':
-                    color_mapper = LinearColorMapper(palette=['gray'] + cc.kr[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
+                    color_mapper = self._get_param_color_mapper(palette=['gray'] + cc.kr[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
                 elif syn_type == 'GABAa':
-                    color_mapper = LinearColorMapper(palette=['gray'] + cc.kb[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
+                    color_mapper = self._get_param_color_mapper(palette=['gray'] + cc.kb[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
                 elif syn_type == 'NMDA':
-                    color_mapper = LinearColorMapper(palette=['gray'] + cc.kg[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
+                    color_mapper = self._get_param_color_mapper(palette=['gray'] + cc.kg[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
                 elif syn_type == 'AMPA_NMDA':
-                    color_mapper = LinearColorMapper(palette=['gray'] + cc.fire[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
+                    color_mapper = self._get_param_color_mapper(palette=['gray'] + cc.fire[100:-10], low=0, nan_color=self.view.theme.graph_colors['node_fill'])
             elif param == 'weights':
                 low = min(graph_renderer.node_renderer.data_source.data[param])
                 high = max(graph_renderer.node_renderer.data_source.data[param])
                 v = max(abs(low), abs(high))
-                color_mapper = LinearColorMapper(palette=cc.bjy, low=-v, high=v)
+                color_mapper = self._get_param_color_mapper(palette=cc.bjy, low=-v, high=v)
             else:
                 values = [v for v in graph_renderer.node_renderer.data_source.data[param]
                           if v is not np.nan]
@@ -377,7 +478,7 @@ class GraphMixin():
                 if low >= 0: low = 0
                 if high <= 0: high = 0
                 # val = max(abs(low), abs(high))
-                color_mapper = LinearColorMapper(
+                color_mapper = self._get_param_color_mapper(
                     palette=self.view.theme.palettes['params'] + null_color,
                     low=low, 
                     high=high, 
@@ -411,16 +512,14 @@ class GraphMixin():
         if param_name == 'domain':
             return
         graph_renderer = self.view.figures['graph'].renderers[0]
-        palette = graph_renderer.node_renderer.glyph.fill_color.transform.palette
+        color_mapper = graph_renderer.node_renderer.glyph.fill_color.transform
+        if not isinstance(color_mapper, LinearColorMapper):
+            return
+        # The mapper is shared by the glyphs, so it is enough to update it
         if new > 0:
-            new_color_mapper = LinearColorMapper(palette=palette, low=0, high=new)
+            color_mapper.update(low=0, high=new)
         else:
-            new_color_mapper = LinearColorMapper(palette=palette, low=new, high=0)
-        param_name = graph_renderer.node_renderer.glyph.fill_color.field
-        graph_renderer.node_renderer.glyph.fill_color = {'field': param_name, 'transform': new_color_mapper}
-        graph_renderer.node_renderer.selection_glyph.fill_color = {'field': param_name, 'transform': new_color_mapper}
-        graph_renderer.node_renderer.nonselection_glyph.fill_color = {'field': param_name, 'transform': new_color_mapper}
-        self.view.figures['graph'].renderers[0] = graph_renderer
+            color_mapper.update(low=new, high=0)
 
     @log
     @timeit
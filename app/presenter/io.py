@@ -9,16 +9,23 @@ from bokeh_utils import log
 
 from bokeh.models.callbacks import CustomJS
 
-import dendrotweaks as dd
-
 import os
 import json
+import shutil
+import numpy as np
+
+from utils import timeit, calculate_nseg
+
+from mod_cache import prepare_mechanisms
+from handlers import create_upload_key, get_upload_path, remove_upload
 
 class IOMixin():
 
     def __init__(self):
         logger.debug('IOMixin init')
         super().__init__()
+        # Passed to the browser to authorize its uploads (see handlers.py)
+        self.upload_key = create_upload_key()
 
     def list_models(self):
         path_to_data = self.path_to_data
@@ -32,6 +39,15 @@ class IOMixin():
         """
         Callback for the selectors['model'] widget.
         """
+        if not self.has_capacity() or (self.config['simulation']['use_workers'] 
+                                       and not self.acquire_worker()):
+            with remove_callbacks(self.view.widgets.selectors['model']):
+                self.view.widgets.selectors['model'].value = old
+            self.update_status_message('The server is busy. Please try again later.', status='warning')
+            return
+
+        import dendrotweaks as dd
+
         path_to_model = os.path.join(self.path_to_data, new)
         self.model = dd.Model(path_to_model=path_to_model, simulator_name=self._simulator)
 
@@ -67,7 +83,13 @@ class IOMixin():
             return
 
         try:
-            self.model.load_biophys(new, recompile=self.view.widgets.switches['recompile'].active)
+            path_to_json = self.model.path_manager.get_abs_path(f'biophys/{new}.json')
+            with open(path_to_json, 'r') as f:
+                domains = json.load(f)['domains']
+            self.prepare_mechanisms({mech for mechs in domains.values() for mech in mechs
+                                     if mech not in ['Leak', 'CaDyn', 'Independent']})
+            self.prepare_mechanisms(dir_name='default_mod')
+            self.model.load_biophys(new, recompile=False)
         except Exception as e:
             logger.error(f'Error loading biophys: {e}')
             with remove_callbacks(self.view.widgets.selectors['biophys']):
@@ -96,6 +118,8 @@ class IOMixin():
         self.view.widgets.buttons['add_default_mechanisms'].disabled = True
         self.view.widgets.selectors['biophys'].options = self.model.list_biophys()
 
+        self.precompute_kinetics()
+
         self.update_status_message('Biophysical configuration loaded.', status='success')
         
         
@@ -179,6 +203,7 @@ class IOMixin():
             self.update_status_message('Error loading morphology.', status='error')
             return
 
+        self.build_visible_tab_panel()
         self.view.layout_elements['workspace'].visible = True
         self.view.layout_elements['right_menu'].visible = True
         self.update_status_message('Morphology loaded.', status='success')
@@ -194,7 +219,9 @@ class IOMixin():
         # MORPHOLOGY --------------------------------------------
         
         self.model.load_morphology(file_name)
+        self.invalidate_segment_data()
 
+        self._reset_cell_view()
         self._create_cell_renderer()
         self._init_cell_widgets()
 
@@ -247,17 +274,38 @@ class IOMixin():
     # MECHANISMS
     # =========================================================================
 
-    def add_mechanism_callback(self, attr, old, new):
+    @log
+    def prepare_mechanisms(self, mech_names=None, dir_name='mod'):
         """
+        Compile the MOD files of the mechanisms, or all the MOD files 
+        in the directory, using the compilation cache (see mod_cache).
+        The mechanisms should then be loaded with recompile=False.
+        The recompile switch forces a rebuild of the cached libraries.
         """
-        recompile = self.view.widgets.switches['recompile'].active
+        if mech_names is None:
+            mech_names = self.model.path_manager.list_files(dir_name, extension='mod')
+        paths_to_mod_files = [
+            self.model.path_manager.get_abs_path(f'{dir_name}/{mech_name}.mod')
+            for mech_name in mech_names
+        ]
+        failed = prepare_mechanisms(
+            paths_to_mod_files, 
+            path_to_cache=self.config['data'].get('path_to_cache', 'app/.cache'),
+            rebuild=self.view.widgets.switches['recompile'].active
+        )
+        if failed:
+            logger.warning(f'Not cached, compiling on load: {failed}')
 
+    def add_mechanism_callback(self, attr, old, new):
+        """
+        """
         mechs_to_add = list(set(new).difference(set(old)))
         mechs_to_remove = list(set(old).difference(set(new)))
         
         if mechs_to_add:
             mech_name = mechs_to_add[0]
-            self.model.add_mechanism(mech_name, load=True, recompile=recompile)
+            self.prepare_mechanisms([mech_name])
+            self.model.add_mechanism(mech_name, load=True, recompile=False)
             self.update_status_message(f'Mechanism "{mech_name}" added.', status='success')
         if mechs_to_remove:
             self.update_status_message(f'Mechanisms cannot be removed from NEURON.', status='warning')
@@ -275,8 +323,8 @@ class IOMixin():
         """
         Creates the cell and the renderers.
         """     
-        recompile = self.view.widgets.switches['recompile'].active
-        self.model.add_default_mechanisms(recompile=recompile)
+        self.prepare_mechanisms(dir_name='default_mod')
+        self.model.add_default_mechanisms(recompile=False)
 
         self.view.widgets.buttons['add_default_mechanisms'].disabled = True
 
@@ -290,11 +338,39 @@ class IOMixin():
     # SEGMENTATION
     # -------------------------------------------------------------------------
 
+    def calculate_nseg(self, d_lambda):
+        """
+        Returns the number of segments of each section for the d_lambda
+        as an array indexed by sec.idx, without changing the model.
+        """
+        sections = self.model.sec_tree.sections
+        Ra = np.array([sec._ref.Ra for sec in sections])
+        cm = np.array([sec._ref.cm for sec in sections])
+        return calculate_nseg(self.get_section_frusta(), Ra, cm, d_lambda, f=100)
+
+    def d_lambda_callback(self, attr, old, new):
+        """
+        Preview the segmentation while the d_lambda slider is dragged.
+        """
+        if self.model is None or not self.model.sec_tree:
+            return
+        nseg = self.calculate_nseg(new)
+        current_nseg = np.array([sec._ref.nseg for sec in self.model.sec_tree.sections])
+        total, current_total = int(nseg.sum()), int(current_nseg.sum())
+        n_changed = int(np.count_nonzero(nseg != current_nseg))
+
+        text = f'{total} segments ({total - current_total:+d}), {n_changed} sections to rebuild'
+        if self._last_runtime is not None:
+            runtime, n_segments = self._last_runtime
+            text += f'<br>Estimated runtime: {runtime * total / n_segments:.2f} s'
+        self.view.DOM_elements['segmentation_preview'].text = text
+
     @log
     def build_seg_tree_callback(self, event):
 
         d_lambda = self.view.widgets.sliders['d_lambda'].value
-        self.build_seg_tree(d_lambda)
+        self.update_seg_tree(d_lambda)
+        self.view.DOM_elements['segmentation_preview'].text = ''
         self._recorded_segments = self.get_recorded_segments()
         self._update_traces_renderers()
         self.update_status_message(f'Segmentation resulted in {len(self.model.seg_tree)} segments.', status='success')
@@ -309,15 +385,52 @@ class IOMixin():
         #     raise ValueError('Capacitance is not set for any group.')
         logger.info(f'Aimed for {1/d_lambda} segments per length constant at {100} Hz')
         self.model.set_segmentation(d_lambda=d_lambda, f=100)
+        self.invalidate_segment_data()
         logger.info(f'Total nseg: {len(self.model.seg_tree)}')
 
         self._create_graph_renderer()
+
+    @log
+    @timeit
+    def update_seg_tree(self, d_lambda):
+        """
+        Updates the segmentation for the d_lambda rebuilding only the
+        sections whose nseg changes. The parameters are redistributed
+        only in the segments of these sections, the others keep theirs.
+        """
+        from dendrotweaks.morphology.io import create_segment_tree
+
+        model = self.model
+        model.d_lambda = d_lambda
+        nseg = self.calculate_nseg(d_lambda)
+        changed = {sec: int(n) for sec, n in zip(model.sec_tree.sections, nseg) 
+                   if sec._ref.nseg != n}
+        logger.info(f'Sections with changed nseg: {len(changed)}')
+        if not changed:
+            return
+
+        # The stimuli refer to the segments, which are recreated
+        model._temp_clear_stimuli()
+        for sec, n in changed.items():
+            sec._nseg = sec._ref.nseg = n
+        model.seg_tree = create_segment_tree(model.sec_tree)
+        self.invalidate_segment_data()
+
+        groups_to_segments = {group_name: [seg for seg in segments if seg._section in changed]
+                              for group_name, segments in self.get_groups_to_segments().items()}
+        for param_name in model.params:
+            model.distribute(param_name, precomputed_groups=groups_to_segments)
+        model._temp_reload_stimuli()
+        logger.info(f'Total nseg: {len(model.seg_tree)}')
+
+        self._create_graph_renderer()
         
 
     def _update_group_selector_widget(self):
         with remove_callbacks(self.view.widgets.selectors['group']):
             self.view.widgets.selectors['group'].options = list(self.model.groups.keys())
             self.view.widgets.selectors['group'].value = 'all'
+        self.mark_dirty('synapses')
 
     def _update_graph_param_widget(self):
         with remove_callbacks(self.view.widgets.selectors['graph_param']):
@@ -328,39 +441,50 @@ class IOMixin():
     # FILE IMPORT
     # =========================================================================
 
-    def import_file_callback(self, attr, old, new):
-        import base64
-        import os
-        import io
-
-        if attr == 'value':
-            self.view._file_content = base64.b64decode(new)
-        elif attr == 'filename':
-            self.view._filename = new
-
-        if self.view._file_content is not None and self.view._filename is not None:
-
-            file_content = self.view._file_content
-            self.view._file_content = None
-            filename = self.view._filename
-            self.view._filename = None
+    @log
+    def upload_file_callback(self, attr, old, new):
+        """
+        Registers a file streamed to the UploadHandler with the model:
+        morphologies are added to the morphology selector and
+        MOD files to the mechanisms that can be added.
+        """
+        if not new:
+            return
+        with remove_callbacks(self.view.widgets.text['uploaded_file']):
+            self.view.widgets.text['uploaded_file'].value = ''
 
-            logger.info(f'Importing file {filename}')
+        upload = json.loads(new)
+        path_to_upload = get_upload_path(upload['token'], self.upload_key)
+        if path_to_upload is None:
+            self.update_status_message('Uploaded file not found.', status='error')
+            return
+        if self.model is None:
+            remove_upload(upload['token'])
+            self.update_status_message('Please select a model first.', status='warning')
+            return
 
-            if filename.endswith('.swc') or filename.endswith('.asc'):
-                with open(f'app/model/swc/{filename}', 'wb') as file:
-                    file.write(file_content)
-                logger.info(f'File {filename} saved to app/model/swc')
-                self.view.widgets.selectors['swc'].options = [f for f in os.listdir('app/model/swc') if f.endswith('.swc') or f.endswith('.asc')]
+        file_name = os.path.basename(path_to_upload)
+        if file_name.endswith('.swc'):
+            path_to_file = self.model.path_manager.get_abs_path(f'morphology/{file_name}', create_dirs=True)
+        else:
+            path_to_file = self.model.path_manager.get_abs_path(f'biophys/mod/{file_name}', create_dirs=True)
+        if os.path.exists(path_to_file):
+            # The model folder is shared by the sessions, and the name of
+            # a MOD file must match its mechanism, so the file is not renamed
+            remove_upload(upload['token'])
+            self.update_status_message(f'File {file_name} already exists in the model. '
+                                       'Please rename it and upload again.', status='warning')
+            return
+        shutil.move(path_to_upload, path_to_file)
+        remove_upload(upload['token'])
+        logger.info(f'File {file_name} saved to {path_to_file}')
 
-            elif filename.endswith('.mod'):
-                mod_folder = 'mod_cadyn' if 'cadyn' in filename else 'mod'
-                widget_name = 'mod_files_cadyn' if 'cadyn' in filename else 'mod_files'
-                os.makedirs(f'app/model/mechanisms/{mod_folder}/{filename.replace(".mod", "")}', exist_ok=True)
-                with open(f'app/model/mechanisms/{mod_folder}/{filename.replace(".mod", "")}/{filename}', 'wb') as file:
-                    file.write(file_content)
-                logger.info(f'File {filename} saved to app/model/mechanisms/{mod_folder}/{filename.replace(".mod", "")}')
-                self.view.widgets.multichoice[widget_name].options = self.model.list_mod_files(mod_folder=mod_folder)
+        if file_name.endswith('.swc'):
+            morphologies = self.model.path_manager.list_morphologies()
+            self.view.widgets.selectors['morphology'].options = ['Select a morphology'] + morphologies
+        else:
+            self.view.widgets.multichoice['mechanisms'].options = self.model.list_mechanisms()
+        self.update_status_message(f'File {file_name} uploaded.', status='success')
 
     # =========================================================================
     # EXPORT METHODS
@@ -376,6 +500,7 @@ class IOMixin():
             self.update_status_message('Cannot overwrite the original model.', status='warning')
             return
         if event.item == 'morphology':
+            self._apply_cell_rotation()
             self.model.export_morphology(file_name)
             self.update_status_message('Morphology exported.', status='success')
         elif event.item == 'biophys':
@@ -37,16 +37,11 @@ class NavigationMixin():
         # update cell selection
         self.update_cell_renderer_selection()
         
-        self.update_section_panel()
+        # the section selector and navigation are always visible
+        self.update_section_widgets()
         
-        # update switches
-        self.update_iclamp_switch()
-        self.update_record_switch()
-
-        if self.view.widgets.buttons['switch_right_menu'].active == 1:
-            if self.view.widgets.tabs['biophys'].active == 2:
-                logger.debug('Updating distribution plot')
-                self._update_distribution_plot()
+        # the rest is recomputed only if visible (see PanelMixin)
+        self.mark_dirty('section', 'record', 'iclamp', 'distribution')
         
 
     @log
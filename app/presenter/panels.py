@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+from bokeh_utils import log
+from logger import logger
+
+# Right menu tabs in the order of the buttons['switch_right_menu'] labels
+RIGHT_MENU_TABS = ['morphology', 'biophys', 'stimuli']
+
+# Location of each panel as (switch_right_menu index, tab index)
+PANEL_LOCATIONS = {
+    'section': (0, 0),
+    'distribution': (1, 2),
+    'record': (2, 0),
+    'iclamp': (2, 1),
+    'synapses': (2, 2),
+}
+
+class PanelMixin():
+    """
+    Defers the recomputation of the right menu panels until they are visible.
+    Callbacks mark the affected panels as dirty, the visible ones
+    are refreshed right away and the hidden ones when they are revealed.
+    """
+
+    def __init__(self):
+        logger.debug('PanelMixin init')
+        super().__init__()
+        self._dirty_panels = set()
+
+    @property
+    def visible_panels(self):
+        menu_idx = self.view.widgets.buttons['switch_right_menu'].active
+        tab_idx = self.view.widgets.tabs[RIGHT_MENU_TABS[menu_idx]].active
+        return {panel for panel, location in PANEL_LOCATIONS.items()
+                if location == (menu_idx, tab_idx)}
+
+    def build_visible_tab_panel(self):
+        """
+        Build the content of the visible right menu tab panel on first display.
+        """
+        menu_idx = self.view.widgets.buttons['switch_right_menu'].active
+        tabs = self.view.widgets.tabs[RIGHT_MENU_TABS[menu_idx]]
+        self.view.build_tab_panel(tabs.tabs[tabs.active].name)
+
+    def mark_dirty(self, *panels):
+        """
+        Mark the panels as dirty and refresh the visible ones.
+        """
+        self._dirty_panels.update(panels)
+        self.refresh_visible_panels()
+
+    @log
+    def refresh_visible_panels(self):
+        panels = self._dirty_panels & self.visible_panels
+        for panel in panels:
+            logger.debug(f'Refreshing {panel} panel')
+            self._dirty_panels.discard(panel)
+            self._refresh_panel(panel)
+
+    def _refresh_panel(self, panel):
+        if panel == 'section':
+            self.update_section_data()
+            self.update_section_message()
+        elif panel == 'distribution':
+            self._update_distribution_plot()
+        elif panel == 'record':
+            self.update_record_switch()
+        elif panel == 'iclamp':
+            self.update_iclamp_switch()
+        elif panel == 'synapses':
+            self._update_syn_placement_options()
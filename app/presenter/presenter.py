@@ -3,12 +3,11 @@
 
 import numpy as np
 
-from utils import get_seg_name, get_sec_type, get_sec_name, get_sec_id
+from utils import get_seg_name, get_sec_type, get_sec_name, get_sec_id, timeit
 
 from logger import logger, decorator_logger
 
 from bokeh.models import RangeSlider, Slider, Select
-from bokeh.layouts import row, column
 
 
 
@@ -21,19 +20,23 @@ from bokeh.models import ColumnDataSource
 
 from bokeh.models import Slider, TabPanel, Tabs, Button, Spinner
 
-from symfit import variables, parameters, Model, Fit, exp
 from typing import List, Dict, Tuple
 from bokeh.events import ButtonClick
 
 from bokeh.palettes import Bokeh
-import colorcet as cc
 
-from bokeh.models import CategoricalColorMapper
+from bokeh.models import Row, Column
 
 from bokeh_utils import log
 
 from bokeh.models import Div
 
+from dendrotweaks.stimuli.populations import Population
+from spike_trains import create_population_inputs, update_population_inputs
+from synapse_placement import place_synapses, exponential_density, build_population
+from synapse_placement import calculate_expected_counts
+from config import save_user_config
+
 from presenter.io import IOMixin
 from presenter.navigation import NavigationMixin
 from presenter.validation import ValidationMixin
@@ -42,13 +45,15 @@ from presenter.cell_panel import CellMixin
 from presenter.section_panel import SectionMixin
 from presenter.graph_panel import GraphMixin
 from presenter.simulation_panel import SimulationMixin
-from presenter.channel_panel import ChannelMixin
-
-from dendrotweaks.biophys import StandardIonChannel
+from presenter.channel_panel import ChannelMixin, NON_KINETIC_MECHS
+from presenter.panels import PanelMixin
+from presenter.scheduler import SchedulerMixin
+from presenter.segment_data import SegmentDataMixin, CACHED_COLUMNS
+from presenter.session import SessionMixin
 
-class Presenter(IOMixin, NavigationMixin, 
-                CellMixin, SectionMixin, GraphMixin, SimulationMixin, ChannelMixin, 
-                ValidationMixin):
+class Presenter(IOMixin, NavigationMixin, PanelMixin, SchedulerMixin, SegmentDataMixin,
+                SessionMixin, CellMixin, SectionMixin, GraphMixin, SimulationMixin, 
+                ChannelMixin, ValidationMixin):
 
     def __init__(self, path_to_data, view=None, model=None, simulator='NEURON'):
         logger.debug('Initializing Presenter')
@@ -140,6 +145,7 @@ class Presenter(IOMixin, NavigationMixin,
     
     def _refresh_domain_views(self, domain_name):
         """Helper to update all domain-related widgets"""
+        self.invalidate_segment_data()
         # self._update_graph_param('domain')
         self._create_graph_renderer()
         self._create_cell_renderer()
@@ -153,6 +159,7 @@ class Presenter(IOMixin, NavigationMixin,
         with remove_callbacks(self.view.widgets.selectors['group']):
             self.view.widgets.selectors['group'].options = list(self.model.groups.keys())
             self.view.widgets.selectors['group'].value = domain_name
+        self.mark_dirty('synapses')
         # TODO: make this a property of the model
         domains_to_sec_ids = {domain.name: sorted([str(sec.idx) for sec in domain.sections], key=lambda x: int(x)) 
                              for domain in self.model.domains.values()}
@@ -232,25 +239,9 @@ class Presenter(IOMixin, NavigationMixin,
         max_val = self.view.widgets.spinners['condition_max'].value
 
         # GET MODEL
-        if select_by == 'distance':
-            condition = lambda seg: seg.domain_name in domains and \
-                        (min_val is None or seg.path_distance() >= min_val) and \
-                        (max_val is None or seg.path_distance() <= max_val)
-        elif select_by == 'domain_distance':
-            condition = lambda seg: seg.domain_name in domains and \
-                        (min_val is None or seg.path_distance(within_domain=True) >= min_val) and \
-                        (max_val is None or seg.path_distance(within_domain=True) <= max_val)
-        elif select_by == 'diam':
-            condition = lambda seg: seg.domain_name in domains and \
-                        (min_val is None or seg.diam >= min_val) and \
-                        (max_val is None or seg.diam <= max_val)
-        elif select_by == 'section_diam':
-            condition = lambda seg: seg.domain_name in domains and \
-                        (min_val is None or seg._section.diam >= min_val) and \
-                        (max_val is None or seg._section.diam <= max_val)
-        
-        segs = [seg for seg in self.model.seg_tree.segments if condition(seg)]
-        seg_ids = [seg.idx for seg in segs]
+        conditions = [(select_by, min_val, max_val)] if select_by in CACHED_COLUMNS else []
+        mask = self.query_segments(domains, conditions)
+        seg_ids = np.flatnonzero(mask).tolist()
         
         # SET VIEW
         self.view.figures['graph'].renderers[0].node_renderer.data_source.selected.indices = seg_ids
@@ -296,6 +287,7 @@ class Presenter(IOMixin, NavigationMixin,
         options = list(self.model.groups.keys())
         self.view.widgets.selectors['group'].options = options
         self.view.widgets.selectors['group'].value = group_name or (options[-1] if options else None)
+        self.mark_dirty('synapses')
 
     # -----------------------------------------------------------------
     # SELECT / REMOVE GROUP
@@ -314,9 +306,8 @@ class Presenter(IOMixin, NavigationMixin,
         Selects the segments in the graph that belong to group sections.
         """
         # GET MODEL
-        group_segments = self.model.get_segments([group_name])
-        logger.debug(f'Group {group_name} segments: {len(group_segments)}')
-        seg_ids = [seg.idx for seg in group_segments]
+        seg_ids = np.flatnonzero(self.get_group_mask(group_name)).tolist()
+        logger.debug(f'Group {group_name} segments: {len(seg_ids)}')
         logger.debug(f'Selected segments: {seg_ids}')
 
         # SET VIEW
@@ -464,8 +455,9 @@ class Presenter(IOMixin, NavigationMixin,
     
     @log
     def _toggle_kinetic_plots(self, mech_name):
+        from dendrotweaks.biophys import StandardIonChannel
 
-        if mech_name in ['Independent', 'Leak', 'CaDyn']:
+        if mech_name in NON_KINETIC_MECHS:
             self.view.widgets.buttons['standardize'].visible = False
             self.view.figures['inf_log'].visible = False
             self.view.figures['inf'].visible = False
@@ -506,8 +498,8 @@ class Presenter(IOMixin, NavigationMixin,
             self.view.figures['tau_log'].visible = True
 
         # 5. Get the data for the mechanism
-        data = mech.get_data()
-        logger.debug(f'Updating kinetic plots for {mech.name} with data: {data}')
+        data = self.get_kinetics_data(mech)
+        logger.debug(f'Updating kinetic plots for {mech.name}')
         x = data.pop('x').tolist()
 
 
@@ -665,27 +657,37 @@ class Presenter(IOMixin, NavigationMixin,
             def slider_callback(attr, old, new):
                 logger.debug(f'Group name: {group_name}, param name: {param_name}, slider title: {slider_title}, new value: {new}')
                 self.model.params[param_name][group_name].update_parameters(**{slider_title: new})
-                self.model.distribute(param_name)
+                self.schedule_distribute(param_name)
                 mech_name = self.selected_mech_name
                 if mech_name not in ['Independent', 'Leak']:
                     mech = self.model.mechanisms[mech_name]
                     mech.params[param_name.replace(f'_{mech.name}', '')] = round(new, 10) # TODO: actually should take the seg value, but which seg
                     logger.debug(f'Updating {mech_name} {param_name} to {new}')
                     if self.view.widgets.switches['show_kinetics'].active:
-                        self._toggle_kinetic_plots(mech.name)
-                self._update_graph_param(param_name)
-                self._update_distribution_plot()
+                        self.schedule('kinetics', lambda: self._toggle_kinetic_plots(mech.name))
+                self.schedule_graph_update(param_name)
+                self.schedule('distribution_plot', self._update_distribution_plot)
             return slider_callback
 
-        sliders = []
+        sliders = {}
         for k, v in self.model.params[param_name][group_name].parameters.items():
             logger.info(f'Adding slider for {k} with value {v}')
-            slider = AdjustableSpinner(title=k, value=v)
-            slider_callback = make_slider_callback(slider.title)
-            slider.on_change('value_throttled', slider_callback)
-            slider.on_change('value_throttled', self.voltage_callback_on_change)
-            sliders.append(slider.get_widget())
-        self.view.DOM_elements['distribution_widgets_panel'].children = sliders
+            # Reused across groups and parameters with the same distribution parameter
+            sliders[k] = self.view.pool.get_widget(
+                ('distribution', k), AdjustableSpinner,
+                callbacks={'value_throttled': [make_slider_callback(k), self.voltage_callback_on_change]},
+                title=k, value=v
+            )
+
+        self.view.add_distribution_preview(
+            spinners=sliders,
+            function_name=self.model.params[param_name][group_name].function_name,
+            param_name=param_name,
+            segment_ids=np.flatnonzero(self.get_group_mask(group_name)).tolist()
+        )
+        self.view.DOM_elements['distribution_widgets_panel'].children = [
+            slider.get_widget() for slider in sliders.values()
+        ]
         
 
     def add_distribution_callback(self, event):
@@ -733,7 +735,8 @@ class Presenter(IOMixin, NavigationMixin,
         param_name = self.selected_param_name
         selected_segs = self.selected_segs
 
-        data = {'x': [seg.path_distance() for seg in selected_segs],
+        distances = self.get_path_distances()
+        data = {'x': [distances[seg.idx] for seg in selected_segs],
                 'y': [seg.get_param_value(param_name) for seg in selected_segs],
                 'color': [seg.domain_color for seg in selected_segs],
                 'label': [str(seg.idx) for seg in selected_segs]}
@@ -747,7 +750,8 @@ class Presenter(IOMixin, NavigationMixin,
         param_name = 'diam'
         selected_segs = self.selected_segs
 
-        data = {'x': [seg.path_distance() for seg in selected_segs],
+        distances = self.get_path_distances()
+        data = {'x': [distances[seg.idx] for seg in selected_segs],
                 'y': [seg.diam for seg in selected_segs],
                 'color': [seg.domain_color for seg in selected_segs],
                 'label': [str(seg.idx) for seg in selected_segs]}
@@ -787,11 +791,7 @@ class Presenter(IOMixin, NavigationMixin,
         """
         labels = [str(seg.idx) for seg in self._recorded_segments]
         if not labels: return
-        color_mapper = CategoricalColorMapper(
-            palette=cc.glasbey_light, 
-            factors=labels, 
-            nan_color=self.view.theme.graph_colors['node_fill']
-        )
+        color_mapper = self._get_traces_color_mapper()
         self.view.figures['sim'].renderers[0].glyph.line_color = {'field': 'labels', 'transform': color_mapper}
         self.view.figures['sim'].renderers[0].selection_glyph.line_color = {'field': 'labels', 'transform': color_mapper}
         self.view.figures['sim'].renderers[0].nonselection_glyph.line_color = {'field': 'labels', 'transform': color_mapper}
@@ -849,17 +849,21 @@ class Presenter(IOMixin, NavigationMixin,
     @log
     def add_population_callback(self, event):
         
-        segments = self.selected_segs[:]
         population_name = self.view.widgets.text['population_name'].value
         syn_type = self.view.widgets.selectors['syn_type'].value
         N_syn = self.view.widgets.spinners['N_syn'].value
+        placement = self.view.widgets.selectors['syn_placement'].value
         
-        self.model.add_population(
-            name=population_name,
-            segments=segments,
-            N=N_syn,
-            syn_type=syn_type
-            )
+        if placement == 'selection':
+            segments = self.selected_segs[:]
+            population = Population(population_name, segments, N_syn, syn_type)
+            population.allocate_synapses()
+        else:
+            population = self._place_population(population_name, placement, N_syn, syn_type)
+            if population is None:
+                return
+        create_population_inputs(population)
+        self.model._add_population(population)
 
         # Update graph param selector options
         self.view.params.update({'Synapses': list(self.model.populations.keys())})
@@ -873,7 +877,64 @@ class Presenter(IOMixin, NavigationMixin,
 
         # Reset population name text box
         self.view.widgets.text['population_name'].value = ''
-        self.update_status_message(f'{syn_type} population added.', status='success')
+        max_synapses = self.config['simulation'].get('max_synapses', 0)
+        if placement != 'selection' and max_synapses and population.N == max_synapses:
+            self.update_status_message(f'{syn_type} population added, limited to '
+                                       f'{max_synapses} synapses.', status='warning')
+        else:
+            self.update_status_message(f'{syn_type} population added.', status='success')
+
+
+    @timeit
+    def _place_population(self, population_name, group_name, N_syn, syn_type):
+        """
+        Create a population on the segments of a group according to the
+        density of the synapses (see synapse_placement.py). The number of 
+        synapses is limited to simulation.max_synapses of the config, and
+        the placement uses the seed of the population, drawn here if the
+        population has none, so that it can be reproduced.
+        """
+        density_per = self.view.widgets.selectors['syn_density_per'].value
+        density = self.view.widgets.spinners['syn_density'].value
+        length_constant = self.view.widgets.spinners['syn_length_constant'].value
+
+        mask = self.get_group_mask(group_name)
+        segments = self.model.seg_tree.segments
+        group_segments = [segments[i] for i in np.flatnonzero(mask)]
+        measures = self.get_segment_column(density_per)[mask]
+        distances = self.get_path_distances()[mask]
+
+        # Without a density, N_syn synapses are distributed by length or area
+        N = None if density else N_syn
+        density = density or 1
+        if length_constant:
+            density = exponential_density(density, length_constant)
+        if N is None:
+            N = int(round(calculate_expected_counts(measures, distances, density).sum()))
+
+        max_synapses = self.config['simulation'].get('max_synapses', 0)
+        if max_synapses and N > max_synapses:
+            logger.warning(f'{N} synapses requested on {group_name}, limited to {max_synapses}')
+            N = max_synapses
+
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+        syn_locs = place_synapses(group_segments, measures, distances, density, N=N, seed=seed)
+        if not syn_locs:
+            self.update_status_message('No synapses to place.', status='warning')
+            return None
+        logger.info(f'Placed {len(syn_locs)} synapses on {len(group_segments)} segments of {group_name}')
+        population = build_population(population_name, syn_locs, syn_type)
+        population.input_params['seed'] = seed
+        return population
+
+
+    def _update_syn_placement_options(self):
+        options = [('selection', 'Selected segments')]
+        options += [(group_name, f'Group: {group_name}') for group_name in self.model.groups]
+        selector = self.view.widgets.selectors['syn_placement']
+        selector.options = options
+        if selector.value not in [value for value, _ in options]:
+            selector.value = 'selection'
 
 
     def remove_population_callback(self, event):
@@ -935,114 +996,96 @@ class Presenter(IOMixin, NavigationMixin,
 
         def make_input_param_slider_callback(slider_title):
             def slider_callback(attr, old, new):
-                population.update_input_params(**{slider_title: new})
+                update_population_inputs(population, **{slider_title: new})
             return slider_callback
 
-        seed_spinner = Spinner(title='Seed', value=population.input_params['seed'], step=1, width=100)
-        seed_spinner.on_change('value_throttled', make_input_param_slider_callback('seed'))
-        seed_spinner.on_change('value_throttled', self.voltage_callback_on_change)
+        # The widgets are reused across populations and rebound to the selected one
+        def get_widget(name, factory, slider_callback, **props):
+            return self.view.pool.get_widget(
+                ('population', name), factory,
+                callbacks={'value_throttled': [slider_callback, self.voltage_callback_on_change]},
+                **props
+            )
+
+        def get_layout(name, factory, children):
+            return self.view.pool.get(('population', name), factory, children=children)
+
+        def get_input_param_widget(factory, title, name, **props):
+            return get_widget(name, factory, make_input_param_slider_callback(name),
+                              title=title, value=population.input_params[name], **props)
+
+        def get_kinetic_param_widget(factory, title, name, **props):
+            return get_widget(name, factory, make_kinetic_param_slider_callback(name),
+                              title=title, value=population.kinetic_params[name], **props)
+
+        seed_spinner = get_input_param_widget(Spinner, 'Seed', 'seed', step=1, width=100)
 
         syn_type = population.syn_type
-        syn_type_div = Div(text=f'<b>Synapse type:</b><br> {syn_type}', width=150)
+        syn_type_div = self.view.pool.get(('population', 'syn_type'), Div, 
+                                          text=f'<b>Synapse type:</b><br> {syn_type}', width=150)
 
         N = population.N
-        N_div = Div(text=f'<b>Number of synapses:</b><br> {N}', width=150)
+        N_div = self.view.pool.get(('population', 'N'), Div, 
+                                   text=f'<b>Number of synapses:</b><br> {N}', width=150)
         
-        rate_spinner = Spinner(title='Rate', value=population.input_params['rate'], step=0.1, low=0, high=100, width=100)
-        rate_spinner.on_change('value_throttled', make_input_param_slider_callback('rate'))
-        rate_spinner.on_change('value_throttled', self.voltage_callback_on_change)
-
-        noise_spinner = Spinner(title='Noise', value=population.input_params['noise'], step=0.01, low=0, high=1, width=100)
-        noise_spinner.on_change('value_throttled', make_input_param_slider_callback('noise'))
-        noise_spinner.on_change('value_throttled', self.voltage_callback_on_change)
-
-        weight_slider = Slider(title='Weight', value=population.input_params['weight'], start=0, end=100, step=1, width=300)
-        weight_slider.on_change('value_throttled', make_input_param_slider_callback('weight'))
-        weight_slider.on_change('value_throttled', self.voltage_callback_on_change)
+        rate_spinner = get_input_param_widget(Spinner, 'Rate', 'rate', step=0.1, low=0, high=100, width=100)
+        noise_spinner = get_input_param_widget(Spinner, 'Noise', 'noise', step=0.01, low=0, high=1, width=100)
+        weight_slider = get_input_param_widget(Slider, 'Weight', 'weight', start=0, end=100, step=1, width=300)
 
         if population.syn_type == 'AMPA_NMDA':
             logger.debug(f'gmax AMPA: {population.kinetic_params["gmax_AMPA"]}, gmax NMDA: {population.kinetic_params["gmax_NMDA"]}')
-            gmax_ampa_slider = Slider(title='gmax_AMPA', value=population.kinetic_params['gmax_AMPA'], start=0, end=0.01, step=0.0001, width=300, format='0.00000')
-            gmax_ampa_slider.on_change('value_throttled', make_kinetic_param_slider_callback('gmax_AMPA'))
-            gmax_ampa_slider.on_change('value_throttled', self.voltage_callback_on_change)
-
-            gmax_nmda_slider = Slider(title='gmax_NMDA', value=population.kinetic_params['gmax_NMDA'], start=0, end=0.01, step=0.0001, width=300, format='0.00000')
-            gmax_nmda_slider.on_change('value_throttled', make_kinetic_param_slider_callback('gmax_NMDA'))
-            gmax_nmda_slider.on_change('value_throttled', self.voltage_callback_on_change)
-
-            gmax_sliders = [gmax_ampa_slider, gmax_nmda_slider]
-
-            tau_rise_ampa_slider = Slider(title='tau_rise_AMPA', value=population.kinetic_params['tau_rise_AMPA'], start=0, end=10, step=0.01, width=150)
-            tau_rise_ampa_slider.on_change('value_throttled', make_kinetic_param_slider_callback('tau_rise_AMPA'))
-            tau_rise_ampa_slider.on_change('value_throttled', self.voltage_callback_on_change)
-
-            tau_decay_ampa_slider = Slider(title='tau_decay_AMPA', value=population.kinetic_params['tau_decay_AMPA'], start=0, end=10, step=0.01, width=150)
-            tau_decay_ampa_slider.on_change('value_throttled', make_kinetic_param_slider_callback('tau_decay_AMPA'))
-            tau_decay_ampa_slider.on_change('value_throttled', self.voltage_callback_on_change)
-
-            tau_rise_nmda_slider = Slider(title='tau_rise_NMDA', value=population.kinetic_params['tau_rise_NMDA'], start=0, end=10, step=0.01, width=150)
-            tau_rise_nmda_slider.on_change('value_throttled', make_kinetic_param_slider_callback('tau_rise_NMDA'))
-            tau_rise_nmda_slider.on_change('value_throttled', self.voltage_callback_on_change)
+            gmax_sliders = [
+                get_kinetic_param_widget(Slider, name, name, start=0, end=0.01, step=0.0001, width=300, format='0.00000')
+                for name in ['gmax_AMPA', 'gmax_NMDA']
+            ]
 
-            tau_decay_nmda_slider = Slider(title='tau_decay_NMDA', value=population.kinetic_params['tau_decay_NMDA'], start=0, end=100, step=0.1, width=150)
-            tau_decay_nmda_slider.on_change('value_throttled', make_kinetic_param_slider_callback('tau_decay_NMDA'))
-            tau_decay_nmda_slider.on_change('value_throttled', self.voltage_callback_on_change)
+            tau_rise_ampa_slider = get_kinetic_param_widget(Slider, 'tau_rise_AMPA', 'tau_rise_AMPA', start=0, end=10, step=0.01, width=150)
+            tau_decay_ampa_slider = get_kinetic_param_widget(Slider, 'tau_decay_AMPA', 'tau_decay_AMPA', start=0, end=10, step=0.01, width=150)
+            tau_rise_nmda_slider = get_kinetic_param_widget(Slider, 'tau_rise_NMDA', 'tau_rise_NMDA', start=0, end=10, step=0.01, width=150)
+            tau_decay_nmda_slider = get_kinetic_param_widget(Slider, 'tau_decay_NMDA', 'tau_decay_NMDA', start=0, end=100, step=0.1, width=150)
 
-            tau_sliders = column(row(tau_rise_ampa_slider, tau_decay_ampa_slider), row(tau_rise_nmda_slider, tau_decay_nmda_slider))
+            tau_sliders = get_layout('tau_AMPA_NMDA', Column, [
+                get_layout('tau_AMPA', Row, [tau_rise_ampa_slider, tau_decay_ampa_slider]),
+                get_layout('tau_NMDA', Row, [tau_rise_nmda_slider, tau_decay_nmda_slider]),
+            ])
 
         else:
             logger.debug(f'gmax: {population.kinetic_params["gmax"]}')
-            gmax_slider = Slider(title='gmax', value=population.kinetic_params['gmax'], start=0, end=0.01, step=0.0001, width=300, format='0.00000')
-            gmax_slider.on_change('value_throttled', make_kinetic_param_slider_callback('gmax'))
-            gmax_slider.on_change('value_throttled', self.voltage_callback_on_change)
+            gmax_slider = get_kinetic_param_widget(Slider, 'gmax', 'gmax', start=0, end=0.01, step=0.0001, width=300, format='0.00000')
             gmax_sliders = [gmax_slider]
 
-            tau_rise_slider = Slider(title='tau_rise', value=population.kinetic_params['tau_rise'], start=0, end=10, step=0.01, width=150)
-            tau_rise_slider.on_change('value_throttled', make_kinetic_param_slider_callback('tau_rise'))
-            tau_rise_slider.on_change('value_throttled', self.voltage_callback_on_change)
-
-            tau_decay_slider = Slider(title='tau_decay', value=population.kinetic_params['tau_decay'], start=0, end=10, step=0.01, width=150)
-            tau_decay_slider.on_change('value_throttled', make_kinetic_param_slider_callback('tau_decay'))
-            tau_decay_slider.on_change('value_throttled', self.voltage_callback_on_change)
+            tau_rise_slider = get_kinetic_param_widget(Slider, 'tau_rise', 'tau_rise', start=0, end=10, step=0.01, width=150)
+            tau_decay_slider = get_kinetic_param_widget(Slider, 'tau_decay', 'tau_decay', start=0, end=10, step=0.01, width=150)
 
-            tau_sliders = row(tau_rise_slider, tau_decay_slider)
+            tau_sliders = get_layout('tau', Row, [tau_rise_slider, tau_decay_slider])
 
-        e_spinner = Spinner(title='E_syn', value=population.kinetic_params['e'], low=-100, high=100, step=1, width=50)
-        e_spinner.on_change('value_throttled', make_kinetic_param_slider_callback('e'))
-        e_spinner.on_change('value_throttled', self.voltage_callback_on_change)
+        e_spinner = get_kinetic_param_widget(Spinner, 'E_syn', 'e', low=-100, high=100, step=1, width=50)
         spinners = [e_spinner]
 
         if 'NMDA' in population.syn_type:
-            gamma_spinner = Spinner(title='Gamma', value=population.kinetic_params['gamma'], low=0, high=1, step=0.001, width=100)
-            gamma_spinner.on_change('value_throttled', make_kinetic_param_slider_callback('gamma'))
-            gamma_spinner.on_change('value_throttled', self.voltage_callback_on_change)
-            mu_spinner = Spinner(title='Mu', value=population.kinetic_params['mu'], low=0, high=1, step=0.001, width=100)
-            mu_spinner.on_change('value_throttled', make_kinetic_param_slider_callback('mu'))
-            mu_spinner.on_change('value_throttled', self.voltage_callback_on_change)
+            gamma_spinner = get_kinetic_param_widget(Spinner, 'Gamma', 'gamma', low=0, high=1, step=0.001, width=100)
+            mu_spinner = get_kinetic_param_widget(Spinner, 'Mu', 'mu', low=0, high=1, step=0.001, width=100)
 
             spinners += [gamma_spinner, mu_spinner]
 
-        range_slider = RangeSlider(title=f'Range', 
-                                   start=0, 
-                                   end=self.view.widgets.sliders['duration'].value, 
-                                   value=(population.input_params['start'], population.input_params['end']), 
-                                   step=1, 
-                                   width=300)
-
         def range_slider_callback(attr, old, new):
-            population.update_input_params(**{'start': new[0], 'end': new[1]})
-
-        range_slider.on_change('value_throttled', range_slider_callback)
-        range_slider.on_change('value_throttled', self.voltage_callback_on_change)
-
+            update_population_inputs(population, start=new[0], end=new[1])
+
+        range_slider = get_widget('range', RangeSlider, range_slider_callback,
+                                  title=f'Range', 
+                                  start=0, 
+                                  end=self.view.widgets.sliders['duration'].value, 
+                                  value=(population.input_params['start'], population.input_params['end']), 
+                                  step=1, 
+                                  width=300)
         
-        self.view.DOM_elements['population_panel'].children = [row(syn_type_div, N_div),
-                                                               row(rate_spinner, noise_spinner, seed_spinner),
+        self.view.DOM_elements['population_panel'].children = [get_layout('info', Row, [syn_type_div, N_div]),
+                                                               get_layout('input', Row, [rate_spinner, noise_spinner, seed_spinner]),
                                                                range_slider, 
                                                                weight_slider, 
                                                                *gmax_sliders,
                                                                tau_sliders,
-                                                               row(spinners)]
+                                                               get_layout('kinetic', Row, spinners)]
                                                               
                                                               
     # def select_population_segs_in_graph(self):
@@ -1068,6 +1111,7 @@ class Presenter(IOMixin, NavigationMixin,
         sec = self.selected_secs.pop()
 
         self.model.remove_subtree(sec)
+        self.invalidate_segment_data()
         
         self.selected_secs = set()
         self.selected_segs = []
@@ -1089,6 +1133,7 @@ class Presenter(IOMixin, NavigationMixin,
         
         sec = next(iter(self.selected_secs))
         self.model.reduce_subtree(sec)
+        self.invalidate_segment_data()
 
         self._create_cell_renderer()
         self._init_cell_widgets()
@@ -1139,6 +1184,7 @@ class Presenter(IOMixin, NavigationMixin,
 
     def switch_tab_callback(self, attr, old, new):
 
+        self.build_visible_tab_panel()
         self.select_graph_param_based_on_tab()
         if self.view.widgets.tabs['morphology'].visible:
             if self.view.widgets.tabs['morphology'].active == 0:
@@ -1148,9 +1194,11 @@ class Presenter(IOMixin, NavigationMixin,
                 self.view.widgets.selectors['domain'].value = 'soma'
             else:
                 self.view.widgets.selectors['section'].value = None
+        self.refresh_visible_panels()
 
   
     def switch_right_menu_tab_callback(self, attr, old, new):
+        self.build_visible_tab_panel()
         if new == 0:
             logger.debug('Switching to Morphology Tabs')
             self.view.widgets.tabs['stimuli'].visible = False
@@ -1173,11 +1221,10 @@ class Presenter(IOMixin, NavigationMixin,
             self.view.widgets.tabs['stimuli'].visible = True
             self.view.widgets.selectors['section'].value = '0'
         self.select_graph_param_based_on_tab()
+        self.refresh_visible_panels()
 
     def save_preferences_callback(self, event):
 
-        import json
-        
         preferences = {
             "appearance": {
                 "theme": self.view.theme.name,
@@ -1201,8 +1248,7 @@ class Presenter(IOMixin, NavigationMixin,
             }
         }
 
-        with open('app/static/data/user_config.json', 'w') as f:
-            json.dump(preferences, f, indent=4)
+        save_user_config(preferences)
 
         self.update_status_message('Preferences saved.', status='success')
         
@@ -0,0 +1,76 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+from bokeh.io import curdoc
+
+from bokeh_utils import log
+from logger import logger
+
+# Time window (ms) in which the scheduled updates are collected
+COALESCE_WINDOW_MS = 50
+
+# The pending updates are run in the order of their stages:
+# model updates first, then the views that depend on them,
+# and the simulation last
+STAGES = {
+    'model': 0,
+    'view': 1,
+    'simulation': 2,
+}
+
+class SchedulerMixin():
+    """
+    Coalesces bursts of widget changes within a session.
+    Callbacks schedule the derived work instead of running it,
+    repeated requests for the same work are merged and everything
+    is run once under a held document, so that the browser
+    receives a single batched update.
+    """
+
+    def __init__(self):
+        logger.debug('SchedulerMixin init')
+        super().__init__()
+        self._pending_updates = {}
+        self._flush_doc = None
+
+    def schedule(self, key, func, stage='view'):
+        """
+        Schedule a function to be run at the end of the current window.
+        Functions scheduled under the same key run only once.
+        """
+        self._pending_updates[(STAGES[stage], key)] = func
+        if self._flush_doc is None:
+            self._flush_doc = curdoc()
+            self._flush_doc.add_timeout_callback(self.flush_updates, COALESCE_WINDOW_MS)
+
+    def schedule_distribute(self, param_name):
+        self.schedule(('distribute', param_name),
+                      lambda: self.model.distribute(
+                          param_name, 
+                          precomputed_groups=self.get_groups_to_segments()),
+                      stage='model')
+
+    def schedule_graph_update(self, param_name):
+        self.schedule(('graph', param_name),
+                      lambda: self._update_graph_param(param_name))
+
+    def schedule_simulation(self):
+        self.schedule('simulation', self.update_voltage, stage='simulation')
+
+    @log
+    def flush_updates(self):
+        """
+        Run the pending updates once under a held document.
+        """
+        doc = self._flush_doc or curdoc()
+        pending = self._pending_updates
+        self._pending_updates = {}
+        self._flush_doc = None
+
+        doc.hold('combine')
+        try:
+            for (_, key), func in sorted(pending.items(), key=lambda item: item[0][0]):
+                logger.debug(f'Running scheduled update: {key}')
+                func()
+        finally:
+            doc.unhold()
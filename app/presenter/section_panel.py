@@ -85,9 +85,11 @@ class SectionMixin():
         if len(self.selected_secs) == 1:
             selected_sec = self.selected_sec
             if param_name == 'distance':
-                yp = [seg.path_distance() for seg in selected_sec.segments]
+                distances = self.get_path_distances()
+                yp = [distances[seg.idx] for seg in selected_sec.segments]
             elif param_name == 'domain_distance':
-                yp = [seg.path_distance(within_domain=True) for seg in selected_sec.segments]
+                distances = self.get_path_distances(within_domain=True)
+                yp = [distances[seg.idx] for seg in selected_sec.segments]
             elif param_name == 'subtree_size':
                 yp = [seg.subtree_size for seg in selected_sec.segments]
             elif param_name == 'section_diam':
@@ -98,6 +100,10 @@ class SectionMixin():
                 yp = [seg._ref.area() for seg in selected_sec.segments]
             elif param_name == 'voltage':
                 yp = [0 for seg in selected_sec]
+            elif param_name in self._impedance_maps:
+                yp = [self._impedance_maps[param_name][seg.idx] for seg in selected_sec.segments]
+            elif param_name in self._spike_maps:
+                yp = [self._spike_maps[param_name][seg.idx] for seg in selected_sec.segments]
             else:
                 if hasattr(selected_sec._ref, param_name):
                     yp = [seg.get_param_value(param_name) for seg in selected_sec.segments]
@@ -208,6 +214,7 @@ class SectionMixin():
 
         for sec in selected_secs:
             sec.nseg = int(new)
+        self.invalidate_segment_data()
 
         # Reload stimuli and clean up temporary files
         self.model._temp_reload_stimuli()
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+import numpy as np
+
+from bokeh_utils import log
+from logger import logger
+
+from utils import timeit
+
+# Segment attributes that depend only on the morphology and segmentation.
+# These columns, and the masks computed from them, are cached.
+CACHED_COLUMNS = ['domain', 'distance', 'domain_distance', 
+                  'diam', 'section_diam', 'length', 'area', 'subtree_size']
+
+class SegmentDataMixin():
+    """
+    Caches per-segment arrays indexed by seg.idx (the position in the seg_tree).
+    The arrays are computed on first access and kept until the
+    segment tree or the domains change (see invalidate_segment_data).
+    """
+
+    def __init__(self):
+        logger.debug('SegmentDataMixin init')
+        super().__init__()
+        self._path_distances = None
+        self._segment_columns = {}
+        self._segment_masks = {}
+        self._section_frusta = None
+
+    @log
+    def invalidate_segment_data(self):
+        """
+        Drop the cached arrays. Call after segmentation, subtree
+        deletion or reduction, and domain edits.
+        """
+        self._path_distances = None
+        self._segment_columns = {}
+        self._segment_masks = {}
+        self._section_frusta = None
+
+    def get_section_frusta(self):
+        """
+        Returns the sum of length / sqrt(d1 + d2) over the frusta of each
+        section (see utils.calculate_nseg) as an array indexed by sec.idx.
+        """
+        if self._section_frusta is None:
+            frusta = []
+            for sec in self.model.sec_tree.sections:
+                lengths = np.diff(sec.distances)
+                diameters = np.asarray(sec.diameters)
+                frusta.append(np.sum(lengths / np.sqrt(diameters[:-1] + diameters[1:])))
+            self._section_frusta = np.array(frusta)
+        return self._section_frusta
+
+    def get_path_distances(self, within_domain=False):
+        """
+        Returns the path distances of all segments to the root
+        (or to the start of their domain) as an array indexed by seg.idx.
+        """
+        if self._path_distances is None:
+            self._path_distances = self._calculate_path_distances()
+        return self._path_distances['domain_distance' if within_domain else 'distance']
+
+    @timeit
+    def _calculate_path_distances(self):
+        """
+        Compute the distances to the root and within the domain
+        for all segments in a single traversal of the section tree.
+        Follows the definition of Segment.path_distance in dendrotweaks:
+        the root section is at 0 and its length is not counted.
+        """
+        distances = np.zeros(len(self.model.seg_tree))
+        domain_distances = np.zeros(len(self.model.seg_tree))
+
+        # Distance from the start of each section to the root and to the domain start
+        to_root = {}
+        to_domain = {}
+
+        stack = [sec for sec in self.model.sec_tree if sec.parent is None]
+        while stack:
+            sec = stack.pop()
+            parent = sec.parent
+            if parent is None or parent.parent is None:
+                to_root[sec.idx] = to_domain[sec.idx] = 0
+            else:
+                to_root[sec.idx] = to_root[parent.idx] + parent.length
+                to_domain[sec.idx] = (to_domain[parent.idx] + parent.length
+                                      if parent.domain_name == sec.domain_name else 0)
+            stack.extend(sec.children)
+
+            if parent is None:
+                continue
+            for seg in sec.segments:
+                distances[seg.idx] = to_root[sec.idx] + seg.x * sec.length
+                domain_distances[seg.idx] = to_domain[sec.idx] + seg.x * sec.length
+
+        return {'distance': distances, 'domain_distance': domain_distances}
+
+    # ==========================================================================
+    # SEGMENT QUERIES
+    # ==========================================================================
+
+    def get_segment_column(self, name):
+        """
+        Returns the values of a segment attribute as an array indexed by seg.idx.
+        Besides the CACHED_COLUMNS, any parameter of the model can be used.
+        """
+        if name == 'distance':
+            return self.get_path_distances()
+        if name == 'domain_distance':
+            return self.get_path_distances(within_domain=True)
+        if name in self._segment_columns:
+            return self._segment_columns[name]
+
+        segments = self.model.seg_tree.segments
+        if name == 'domain':
+            column = np.array([seg.domain_name for seg in segments])
+        elif name == 'diam':
+            column = np.array([seg.diam for seg in segments], dtype=float)
+        elif name == 'section_diam':
+            column = np.array([seg._section._ref.diam for seg in segments], dtype=float)
+        elif name == 'length':
+            column = np.array([seg._section._ref.L / seg._section._ref.nseg for seg in segments], dtype=float)
+        elif name == 'area':
+            column = np.array([seg.area for seg in segments], dtype=float)
+        elif name == 'subtree_size':
+            column = np.array([seg.subtree_size for seg in segments], dtype=float)
+        else:
+            # Parameter values change on every distribution update, not cached
+            return np.array([seg.get_param_value(name) for seg in segments], dtype=float)
+
+        self._segment_columns[name] = column
+        return column
+
+    def query_segments(self, domains, conditions=()):
+        """
+        Select segments by domain and a conjunction of range conditions.
+
+        Parameters
+        ----------
+        domains : list[str]
+            The domains of the segments to select.
+        conditions : list[tuple]
+            The (column, min_value, max_value) conditions, all of which 
+            must hold. As in dendrotweaks.biophys.groups.SegmentGroup, 
+            the range is (min_value, max_value] and None means no bound.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean mask indexed by seg.idx.
+        """
+        key = (tuple(sorted(domains)), tuple(conditions))
+        cacheable = all(name in CACHED_COLUMNS for name, _, _ in conditions)
+        if cacheable and key in self._segment_masks:
+            return self._segment_masks[key]
+
+        mask = np.isin(self.get_segment_column('domain'), list(domains))
+        for name, min_value, max_value in conditions:
+            values = self.get_segment_column(name)
+            if min_value is not None:
+                mask &= values > min_value
+            if max_value is not None:
+                mask &= values <= max_value
+
+        if cacheable:
+            self._segment_masks[key] = mask
+        return mask
+
+    def get_group_mask(self, group_name):
+        """
+        Returns the membership of the segments in a group of the model
+        as a boolean mask indexed by seg.idx.
+        """
+        group = self.model.groups[group_name]
+        conditions = []
+        if group.select_by is not None:
+            conditions.append((group.select_by, group.min_value, group.max_value))
+        return self.query_segments(group.domains, conditions)
+
+    def get_group_segments(self, group_name):
+        segments = self.model.seg_tree.segments
+        return [segments[i] for i in np.flatnonzero(self.get_group_mask(group_name))]
+
+    def get_groups_to_segments(self):
+        """
+        Returns the segments of all groups, to be passed as 
+        precomputed_groups to model.distribute.
+        """
+        return {group_name: self.get_group_segments(group_name) 
+                for group_name in self.model.groups}
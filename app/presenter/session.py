@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+import gc
+import time
+
+from bokeh_utils import log
+from logger import logger
+
+from session_manager import sessions
+from handlers import revoke_upload_key
+
+EVICTION_MESSAGES = {
+    'idle': 'The session was closed after a period of inactivity. '
+            'Reload the page to continue.',
+    'memory': 'The session was closed to free memory for other users '
+              'after a period of inactivity. Reload the page to continue.',
+}
+
+class SessionMixin():
+    """
+    Releases the resources of the session when it is destroyed
+    or evicted (see session_manager.py).
+    """
+
+    def __init__(self):
+        logger.debug('SessionMixin init')
+        super().__init__()
+        self.last_activity = time.time()
+
+    def touch(self):
+        self.last_activity = time.time()
+
+    def has_capacity(self):
+        """
+        Whether the server has memory for a new model. Only sessions 
+        idle for long are evicted to make room, and their memory is 
+        released on later ticks, so the model is rejected meanwhile.
+        """
+        if not sessions.is_over_watermark():
+            return True
+        sessions.reclaim()
+        return False
+
+    @log
+    def release_resources(self):
+        """
+        Free the model, its NEURON sections and the derived data.
+        Does not touch the document, so that it is safe to call
+        when the session is destroyed.
+        """
+        self.release_worker()
+        self._remove_export()
+        revoke_upload_key(self.upload_key)
+        self._last_run = None
+        self._remove_kept_runs()
+        model = self.model
+        self.model = None
+        if model is not None and model.sec_tree is not None:
+            from neuron import h
+            model.remove_all_stimuli()
+            model.remove_all_recordings()
+            for sec in model.sec_tree.sections:
+                if sec._ref is not None:
+                    h.delete_section(sec=sec._ref)
+                    sec._ref = None
+        self.G = None
+        self._impedance_maps = {}
+        self._spike_maps = {}
+        self._linear_responses.clear()
+        self._last_fingerprint = None
+        self._last_runtime = None
+        self._spike_rows = {}
+        self.invalidate_segment_data()
+        self._cell_points_cache = {}
+        with self._kinetics_lock:
+            self._kinetics_cache = {}
+        self._pending_updates = {}
+        # The reused widgets hold callbacks bound to the model
+        self.view.pool.clear()
+        gc.collect()
+
+    @log
+    def evict(self, reason='idle'):
+        """
+        Release the resources of a session that is still open
+        and clear its plots. The reason is 'idle' or 'memory'.
+        """
+        self.release_resources()
+        for source in self.view.sources.values():
+            source.data = {key: [] for key in source.data}
+        self.view.layout_elements['workspace'].visible = False
+        self.view.layout_elements['right_menu'].visible = False
+        self.update_status_message(EVICTION_MESSAGES[reason], status='warning')
@@ -5,17 +5,38 @@ from bokeh_utils import remove_callbacks
 from bokeh_utils import log
 from logger import logger
 
+import os
 import time
+import asyncio
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from utils import timeit
 
 from utils import get_seg_name, get_sec_type, get_sec_name, get_sec_id
 
 from bokeh.models import CategoricalColorMapper
+from bokeh.document import without_document_lock
+from bokeh.io import curdoc
+
+from handlers import create_export_dir, remove_export_dir, get_export_url
+from trace_export import export_traces, spool_run, load_spooled_runs
+from linear_response import LinearResponse, LinearResponseCache, get_fingerprint
+from spike_features import SPIKE_PARAMS
+from spike_trains import get_population_spike_trains
 import colorcet as cc
-from matplotlib import cm
 import numpy as np
 from bokeh.palettes import Blues6, Oranges6, Greens6, Reds6, Purples6
 
+# Synapses above which the raster is labeled by population
+MAX_LABELED_ROWS = 20
+
+# Populations with fewer synapses are left out of the PSTH
+PSTH_MIN_SYNAPSES = 50
+
+# Bin width of the PSTH in ms
+PSTH_BIN_MS = 5
+
 class SimulationMixin():
     """ This class is a mixin for the Presenter class.
     It provides methods for handling the Simulation panel of the View.
@@ -25,6 +46,24 @@ class SimulationMixin():
         logger.debug('BiophysMixin init')
         super().__init__()
         self._recorded_segments = []
+        self.worker = None
+        self._worker_run_id = 0
+        self._last_run = None
+        # The files of the runs kept for export (see trace_export.py)
+        self._kept_runs = []
+        self._path_to_spool = None
+        self._n_spooled = 0
+        # Writes and removes the spooled runs in order, off the document lock
+        self._spool_executor = None
+        # Number of exports reading each spool directory
+        self._spool_readers = {}
+        self._export_token = None
+        self._linear_responses = LinearResponseCache()
+        self._last_fingerprint = None
+        # The runtime of the latest simulation and its number of segments
+        self._last_runtime = None
+        # The first and last + 1 rows of each population in the raster
+        self._spike_rows = {}
         
     def get_recorded_segments(self, var=None):
         """ Returns the segments in which the variable is recorded. """
@@ -37,25 +76,129 @@ class SimulationMixin():
 
     @log
     @timeit
-    def update_voltage(self):
+    def update_voltage(self, preview=True):
         if not self.model.simulator.recordings:
             logger.warning('No recordings selected, interrupting simulation')
             return
 
         duration = self.view.widgets.sliders['duration'].value
+        if preview and self._preview_voltage(duration):
+            return
+
+        if self.worker is not None:
+            self._run_in_worker(duration)
+            return
+
         start = time.time()
         self.model.simulator.run(duration)
         runtime = time.time() - start
+        self._last_runtime = (runtime, len(self.model.seg_tree))
+        self._update_simulation_data(self.model.simulator.t, 
+                                     self.model.simulator.recordings, 
+                                     runtime)
+
+
+    # ==========================================================================
+    # LINEAR PREVIEW
+    # ==========================================================================
+
+    def _can_preview_voltage(self):
+        """
+        Whether the voltage is determined by the current clamps alone,
+        i.e. there are clamps and no synaptic input, only the voltage
+        is recorded and the time step is fixed.
+        """
+        model = self.model
+        return (self.view.widgets.switches['linear_preview'].active
+                and bool(model.iclamps)
+                and not any(model.populations.values())
+                and set(model.simulator._recordings) == {'v'}
+                and not model.simulator._cvode)
+
+    def _is_passive(self):
+        mechs = {mech for mechs in self.model.domains_to_mechs.values() for mech in mechs}
+        return mechs <= {'Leak'}
+
+    @log
+    @timeit
+    def _preview_voltage(self, duration):
+        """
+        Show the voltage predicted from the linear responses of the model
+        instead of running the simulation. The responses are measured
+        once the clamps are changed without changing anything else
+        since the last run. Returns whether the prediction was shown.
+        """
+        if not self._can_preview_voltage():
+            return False
+
+        start = time.time()
+        fingerprint = get_fingerprint(self.model, duration)
+        response = self._linear_responses.get(fingerprint)
+        if response is None:
+            if fingerprint != self._last_fingerprint:
+                self._last_fingerprint = fingerprint
+                return False
+            logger.info('Measuring the linear responses')
+            if self.worker is not None:
+                self._measure_linear_response_in_worker(fingerprint, duration)
+                return False
+            response = LinearResponse(self.model, duration)
+            self._linear_responses.add(fingerprint, response)
+
+        voltages = response.predict(self.model)
+        max_dv = self.config['simulation']['linear_preview_max_dv']
+        if not self._is_passive() and np.abs(voltages - response.v0).max() > max_dv:
+            logger.info(f'Deviation above {max_dv} mV, running the simulation')
+            return False
+
+        recordings = {'v': {seg: v.tolist() 
+                            for seg, v in zip(response.recorded_segments, voltages)}}
+        runtime = time.time() - start
+        self._update_simulation_data(response.t.tolist(), recordings, runtime, preview=True)
+        self.view.DOM_elements['runtime'].text = f'⚡ Linear preview: {runtime * 1000:.1f} ms'
+        return True
+
+    def _measure_linear_response_in_worker(self, fingerprint, duration):
+        """
+        Measure the linear responses in the worker, while this change
+        is simulated, so that the next changes of the clamps are previewed.
+        """
+        def callback(data, runtime):
+            segments = self.model.seg_tree.segments
+            self._linear_responses.add(fingerprint, LinearResponse.from_dict(data, segments))
+
+        snapshot = self.get_simulation_snapshot()
+        self._call_in_worker('linear_response', snapshot, duration, 
+                             callback=callback, error_message='Linear preview failed.')
+
+    def linear_preview_callback(self, attr, old, new):
+        if not new:
+            self._linear_responses.clear()
+            self._last_fingerprint = None
+
+    def _update_simulation_data(self, t, recordings, runtime, preview=False):
+        """
+        Push the results of a simulation to the view.
+        The recordings are given as {var: {seg: values}}.
+        A linear preview is only shown: it is not kept for export
+        and the spike maps are left to the simulated runs.
+        """
         self.view.DOM_elements['runtime'].text = f'✅ Runtime: {runtime:.2f} s'
+        if not preview:
+            self._store_run(t, recordings)
 
-        if self.model.simulator.recordings.get('v'):
-            self._update_voltage_data()
+            graph_param = self.view.widgets.selectors['graph_param'].value
+            if graph_param in SPIKE_PARAMS:
+                self._update_graph_param(graph_param)
+
+        if recordings.get('v'):
+            self._update_voltage_data(t, recordings)
         else:
             self.view.sources['sim'].data = {'xs': [], 'ys': [], 'labels': []}
         
-        current_names = [k for k in self.model.simulator.recordings.keys() if k not in ['v']]
+        current_names = [k for k in recordings.keys() if k not in ['v']]
         if current_names:
-            self._update_current_data(current_names)
+            self._update_current_data(t, recordings, current_names)
         else:
             self.view.sources['curr'].data = {'xs': [], 'ys': [], 'labels': [], 'names': []}
         
@@ -63,14 +206,14 @@ class SimulationMixin():
             self.update_spike_times_data()
 
         
-    def _update_voltage_data(self):
+    def _update_voltage_data(self, t, recordings):
 
         segments = self.get_recorded_segments('v')
         labels = [str(seg.idx) for seg in segments]
-        voltages = [list(self.model.simulator.recordings['v'].get(seg, []))
+        voltages = [list(recordings['v'].get(seg, []))
                 for seg in segments]
 
-        ts = [self.model.simulator.t for _ in range(len(voltages))]
+        ts = [t for _ in range(len(voltages))]
 
         self.view.sources['sim'].data = {
             'xs': ts, 
@@ -79,7 +222,7 @@ class SimulationMixin():
         }
 
 
-    def _update_current_data(self, current_names):
+    def _update_current_data(self, t, recordings, current_names):
 
         currents = []
         labels = []
@@ -89,14 +232,15 @@ class SimulationMixin():
             
             _segments = self.get_recorded_segments(current_name)
             _labels = [str(seg.idx) for seg in _segments]
-            _currents = list(self.model.simulator.recordings[current_name].values())
+            _currents = [list(recordings[current_name].get(seg, [])) 
+                         for seg in _segments]
 
             currents.extend(_currents)
             labels.extend(_labels)
             names.extend([current_name] * len(_currents))
 
         # Time series: same time vector for each trace
-        ts = [self.model.simulator.t for _ in range(len(currents))]
+        ts = [t for _ in range(len(currents))]
 
         # Push to the Bokeh data source
         self.view.sources['curr'].data = {
@@ -107,27 +251,341 @@ class SimulationMixin():
         }
 
 
+    # ==========================================================================
+    # TRACE EXPORT
+    # ==========================================================================
+
+    def _store_run(self, t, recordings):
+        """
+        Keep the results of the run for export, with the recordings
+        as {var: {seg.idx: values}}. Only the last run is kept in memory, 
+        the runs to be kept are spooled to disk (see trace_export.py).
+        """
+        run = (t, {var: {seg.idx: values for seg, values in recs.items()}
+                   for var, recs in recordings.items()})
+        self._last_run = run
+        if self.view.widgets.switches['keep_runs'].active:
+            self._spool_run(run)
+
+    def _get_spool_executor(self):
+        if self._spool_executor is None:
+            self._spool_executor = ThreadPoolExecutor(max_workers=1)
+        return self._spool_executor
+
+    def _spool_run(self, run):
+        """
+        Write the run to the spool in the background and add it
+        to the kept runs once it is written.
+        """
+        if self._path_to_spool is None:
+            self._path_to_spool = tempfile.mkdtemp(prefix='dendrotweaks_runs_')
+            self._n_spooled = 0
+        path_to_spool = self._path_to_spool
+        path_to_file = os.path.join(path_to_spool, f'run_{self._n_spooled}.npz')
+        self._n_spooled += 1
+        executor = self._get_spool_executor()
+        doc = curdoc()
+
+        def keep():
+            # The kept runs may have been removed meanwhile
+            if self._path_to_spool == path_to_spool:
+                self._kept_runs.append(path_to_file)
+                self.view.DOM_elements['export_link'].text = f'{len(self._kept_runs)} runs kept'
+
+        @without_document_lock
+        async def spool():
+            loop = asyncio.get_running_loop()
+            try:
+                # A single thread, so that the runs are written in order
+                await loop.run_in_executor(executor, spool_run, path_to_file, run)
+            except Exception as e:
+                logger.error(f'Spooling the run failed: {e}')
+                return
+            doc.add_next_tick_callback(keep)
+
+        doc.add_next_tick_callback(spool)
+
+    def _remove_kept_runs(self):
+        self._kept_runs = []
+        path_to_spool = self._path_to_spool
+        self._path_to_spool = None
+        if path_to_spool is not None and not self._spool_readers.get(path_to_spool):
+            self._remove_spool(path_to_spool)
+
+    def _remove_spool(self, path_to_spool):
+        # After the pending writes, so that no file is written to a removed directory
+        self._get_spool_executor().submit(shutil.rmtree, path_to_spool, ignore_errors=True)
+
+    def _release_spool(self, path_to_spool):
+        """
+        Called when an export is done reading the spool, 
+        which is removed if the kept runs were removed meanwhile.
+        """
+        self._spool_readers[path_to_spool] -= 1
+        if not self._spool_readers[path_to_spool]:
+            del self._spool_readers[path_to_spool]
+            if path_to_spool != self._path_to_spool:
+                self._remove_spool(path_to_spool)
+
+    def keep_runs_callback(self, attr, old, new):
+        if not new:
+            self._remove_kept_runs()
+            self.view.DOM_elements['export_link'].text = ''
+
+    def _remove_export(self):
+        if self._export_token is not None:
+            remove_export_dir(self._export_token)
+            self._export_token = None
+
+    @log
+    def export_traces_callback(self, event):
+        """
+        Write the kept runs (or the last run) to a file in the background
+        and show a link to download it from the TraceExportHandler.
+        """
+        path_to_spool = None
+        if self._kept_runs:
+            # The spool is not removed while the runs are read from it
+            path_to_spool = self._path_to_spool
+            self._spool_readers[path_to_spool] = self._spool_readers.get(path_to_spool, 0) + 1
+            runs = load_spooled_runs(list(self._kept_runs))
+        elif self._last_run is not None:
+            runs = [self._last_run]
+        else:
+            self.update_status_message('Run a simulation first.', status='warning')
+            return
+
+        self._remove_export()
+        token, path_to_dir = create_export_dir()
+        self._export_token = token
+        format_name = self.view.widgets.selectors['export_format'].value
+        file_name = f'{self.model.name}_traces'
+        self.view.DOM_elements['export_link'].text = 'Exporting traces...'
+        doc = curdoc()
+
+        @without_document_lock
+        async def export():
+            loop = asyncio.get_running_loop()
+            try:
+                path_to_file = await loop.run_in_executor(
+                    None, export_traces, path_to_dir, file_name, runs, format_name)
+            except Exception as e:
+                logger.error(f'Trace export failed: {e}')
+                doc.add_next_tick_callback(
+                    lambda: self.update_status_message('Trace export failed.', status='error'))
+                return
+            finally:
+                # Not on the next tick, which does not come if the session is closed
+                if path_to_spool is not None:
+                    self._release_spool(path_to_spool)
+            size_mb = os.path.getsize(path_to_file) / 1024**2
+            link = (f'<a href="{get_export_url(token)}" download>'
+                    f'{os.path.basename(path_to_file)}</a> ({size_mb:.1f} MB)')
+            doc.add_next_tick_callback(
+                lambda: setattr(self.view.DOM_elements['export_link'], 'text', link))
+
+        doc.add_next_tick_callback(export)
+
+
+    # ==========================================================================
+    # SIMULATION WORKER
+    # ==========================================================================
+
+    @log
+    def acquire_worker(self):
+        """
+        Take a simulation worker from the pool for this session.
+        Returns False if all the workers are in use.
+        """
+        if self.worker is None:
+            from worker_pool import get_pool
+            self.worker = get_pool().acquire()
+        return self.worker is not None
+
+    @log
+    def release_worker(self):
+        if self.worker is not None:
+            from worker_pool import get_pool
+            get_pool().release(self.worker)
+            self.worker = None
+
+    def get_simulation_snapshot(self):
+        """
+        Returns the state of the model needed to reproduce
+        the simulation in a worker process (see neuron_worker.py).
+        Sections are referred to by their index in the sec_tree.
+        """
+        model = self.model
+
+        with tempfile.TemporaryDirectory() as path_to_tmp:
+            path_to_swc = os.path.join(path_to_tmp, 'cell.swc')
+            model.point_tree.to_swc(path_to_swc)
+            with open(path_to_swc, 'r') as f:
+                morphology = f.read()
+
+        populations = []
+        for pop in model.populations.values():
+            spike_times, spike_counts = get_population_spike_trains(pop)
+            populations.append({
+                **pop.to_dict(),
+                'syn_locs': [(syn.sec.idx, syn.loc) for syn in pop.flat_synapses],
+                'spike_times': spike_times,
+                'spike_counts': spike_counts,
+            })
+
+        return {
+            'path_to_model': model.path_to_model,
+            'morphology': morphology,
+            'domains': {domain.type_idx: name for name, domain in model.domains.items()},
+            'nseg': [sec.nseg for sec in model.sec_tree.sections],
+            'biophys': model.to_dict(),
+            'stimuli': {
+                # The duration is passed with each run
+                'simulation': {**model.simulator.to_dict(), 'duration': None},
+                'cvode': model.simulator._cvode,
+                'iclamps': [(seg._section.idx, seg.x, iclamp.amp, iclamp.delay, iclamp.dur) 
+                            for seg, iclamp in model.iclamps.items()],
+                'populations': populations,
+                'recordings': [(seg._section.idx, seg.x, var) 
+                               for var, recs in model.simulator.recordings.items() 
+                               for seg in recs],
+            },
+        }
+
+    def _call_in_worker(self, command, *args, callback, error_message):
+        """
+        Call a command of the session's worker without blocking the server,
+        and pass the result and the runtime to the callback on the next tick
+        of the session, unless the session was evicted in the meantime.
+        """
+        worker = self.worker
+        doc = curdoc()
+
+        def apply(result, runtime):
+            if self.model is not None:
+                callback(result, runtime)
+
+        @without_document_lock
+        async def call():
+            loop = asyncio.get_running_loop()
+            start = time.time()
+            try:
+                result = await loop.run_in_executor(None, worker.call, command, *args)
+            except Exception as e:
+                logger.error(f'Worker command {command} failed: {e}')
+                doc.add_next_tick_callback(
+                    lambda: self.update_status_message(error_message, status='error'))
+                return
+            runtime = time.time() - start
+            doc.add_next_tick_callback(lambda: apply(result, runtime))
+
+        doc.add_next_tick_callback(call)
+
+    def _run_in_worker(self, duration):
+        """
+        Run the simulation in the session's worker without blocking
+        the server. Only the results of the latest run are shown.
+        """
+        snapshot = self.get_simulation_snapshot()
+        self._worker_run_id += 1
+        run_id = self._worker_run_id
+
+        def callback(result, runtime):
+            if run_id == self._worker_run_id:
+                self._apply_worker_result(result, runtime)
+
+        self._call_in_worker('run', snapshot, duration, 
+                             callback=callback, error_message='Simulation failed.')
+
+    def _apply_worker_result(self, result, runtime):
+        segments = self.model.seg_tree.segments
+        self._last_runtime = (runtime, len(segments))
+        recordings = {
+            var: {segments[idx]: values for idx, values in recs.items()}
+            for var, recs in result['recordings'].items()
+        }
+        self._update_simulation_data(result['t'], recordings, runtime)
+
+
     @log
     @timeit
     def update_spike_times_data(self):
-        data = {'x': [], 'y': [], 'color': []}
+        """
+        Show the spike times of the synapses as a raster with one row per
+        synapse. The spikes are sent as columns of the time, the row and
+        whether the synapse is inhibitory, the labels once per row as ticks,
+        or once per population if there are more than MAX_LABELED_ROWS.
+        """
+        times, rows, inhibitory = [], [], []
+        populations = {}
+        n_rows = 0
         for pop_name, pop in self.model.populations.items():
             if not pop: continue
-            for seg_idx, synapses in pop.synapses.items():
-                for i, syn in enumerate(synapses):
-                    label = f'Pop_{pop_name}_seg_{seg_idx}_syn_{i}'
-                    color = 'blue' if pop.syn_type in ['GABAa', 'GABAb'] else 'orange'
-                    data['x'].extend(syn.spike_times)
-                    data['y'].extend([label] * len(syn.spike_times))
-                    data['color'].extend([color] * len(syn.spike_times))
-        
-        if data['y']:
-            synapse_names = sorted(set(data['y']))
-            self.view.figures['spikes'].y_range.factors = synapse_names
-            if len(synapse_names) > 20:
-                self.view.figures['spikes'].yaxis.ticker = []
+            pop_times = [np.asarray(syn.spike_times, dtype=float)
+                         for synapses in pop.synapses.values() for syn in synapses]
+            counts = [len(spike_times) for spike_times in pop_times]
+            times.extend(pop_times)
+            rows.append(np.repeat(np.arange(n_rows, n_rows + len(pop_times), dtype=np.int32), counts))
+            inhibitory.append(np.full(sum(counts), pop.syn_type in ['GABAa', 'GABAb'], dtype=np.int8))
+            populations[pop_name] = (n_rows, n_rows + len(pop_times))
+            n_rows += len(pop_times)
+
+        if n_rows > MAX_LABELED_ROWS:
+            labels = {(first + last - 1) / 2: name for name, (first, last) in populations.items()}
+        else:
+            labels = dict(enumerate(
+                f'Pop_{pop_name}_seg_{sec(x).idx}_syn_{i}'
+                for pop_name, pop in self.model.populations.items() if pop
+                for (sec, x), synapses in pop.synapses.items() 
+                for i in range(len(synapses))
+            ))
+
+        fig = self.view.figures['spikes']
+        fig.y_range.start, fig.y_range.end = -0.5, max(n_rows, 1) - 0.5
+        fig.yaxis.ticker.ticks = list(labels)
+        fig.yaxis.major_label_overrides = labels
+
+        self.view.sources['spikes'].data = {
+            'x': np.concatenate(times) if times else np.array([]),
+            'y': np.concatenate(rows) if rows else np.array([], dtype=np.int32),
+            'inhibitory': np.concatenate(inhibitory) if inhibitory else np.array([], dtype=np.int8),
+        }
+        self._spike_rows = populations
 
-        self.view.sources['spikes'].data = data
+        if self.view.widgets.switches['psth'].active:
+            self.update_psth_data()
+
+    @log
+    @timeit
+    def update_psth_data(self):
+        """
+        Show the firing rate per synapse of the populations with at least
+        PSTH_MIN_SYNAPSES synapses, binned in PSTH_BIN_MS, computed
+        from the columns of the raster.
+        """
+        data = {'xs': [], 'ys': [], 'color': [], 'label': []}
+        spikes = self.view.sources['spikes'].data
+        if len(spikes['x']):
+            duration = self.view.widgets.sliders['duration'].value
+            edges = np.arange(0, duration + PSTH_BIN_MS, PSTH_BIN_MS)
+            palette = self.view.theme.palettes['trace']
+            rows = np.asarray(spikes['y'])
+            for i, (pop_name, (first, last)) in enumerate(self._spike_rows.items()):
+                n_synapses = last - first
+                if n_synapses < PSTH_MIN_SYNAPSES:
+                    continue
+                in_pop = (rows >= first) & (rows < last)
+                counts, _ = np.histogram(np.asarray(spikes['x'])[in_pop], bins=edges)
+                data['xs'].append(edges[:-1] + PSTH_BIN_MS / 2)
+                data['ys'].append(counts / n_synapses / PSTH_BIN_MS * 1000)
+                data['color'].append(palette[i % len(palette)])
+                data['label'].append(pop_name)
+        self.view.sources['psth'].data = data
+
+    def psth_callback(self, attr, old, new):
+        self.view.figures['psth'].visible = new
+        if new:
+            self.update_psth_data()
 
 
     def runtime_callback_on_change(self, attr, old, new):
@@ -138,15 +596,15 @@ class SimulationMixin():
     
     def voltage_callback_on_change(self, attr, old, new):
         if self.view.widgets.switches['run_on_interaction'].active:
-            self.update_voltage()
+            self.schedule_simulation()
 
    
     def voltage_callback_on_event(self, event):
         if self.view.widgets.switches['run_on_interaction'].active:
-            self.update_voltage()
+            self.schedule_simulation()
 
     def voltage_callback_on_click(self, event):
-        self.update_voltage()
+        self.update_voltage(preview=False)
 
     def record_current_callback(self, attr, old, new):
         """ Callback for the record current switch. """
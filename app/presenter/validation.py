@@ -8,15 +8,8 @@ from bokeh_utils import remove_callbacks
 from bokeh_utils import log
 from logger import logger
 
-from dendrotweaks.analysis import detect_somatic_spikes
-from dendrotweaks.analysis import calculate_passive_properties
-from dendrotweaks.analysis import calculate_fI_curve
-from dendrotweaks.analysis import calculate_voltage_attenuation
-from dendrotweaks.analysis import calculate_dendritic_nonlinearity
-
-from dendrotweaks.analysis import calculate_cell_statistics
-from dendrotweaks.analysis import calculate_domain_statistics
-from dendrotweaks.analysis.morphometric_analysis import calculate_section_statistics
+from protocols import run_protocol
+from spike_trains import update_population_inputs
 
 PROTOCOL_DESCRIPTIONS = {
     'Input resistance and time constant': """<ol>
@@ -41,6 +34,13 @@ PROTOCOL_DESCRIPTIONS = {
     <li>Specify the number of current amplitudes to test (up to 10)</li>
     <li>Click "Run protocol" button.</li>
     </ol>""",
+    'Adaptive f-I curve': """<ol>
+    <li>Place a recording at the soma.</li>
+    <li>Inject a depolarizing current at the soma.</li>
+    <li>Specify the range of injected current amplitudes to search (minimum and maximum).</li>
+    <li>Specify the accuracy of the firing rate in Hz.</li>
+    <li>Click "Run protocol" button.</li>
+    </ol>""",
     'Dendritic nonlinearity': """<ol>
     <li>Place a recording at a dendritic location.</li>
     <li>Place a single synapse at the same location.</li>
@@ -87,6 +87,16 @@ class ValidationMixin():
             self.view.widgets.numeric['protocol_min'].value = 0.1
             self.view.widgets.numeric['protocol_max'].value = 0.2
             self.view.widgets.numeric['protocol_n'].value = 5
+            self.view.widgets.numeric['protocol_n'].update(title='N steps', low=1, high=10)
+            self.view.widgets.numeric['protocol_max'].title = 'Max current, nA'
+            self.view.widgets.numeric['protocol_min'].title = 'Min current, nA'
+        elif new == 'Adaptive f-I curve':
+            self.view.DOM_elements['protocol_widgets'].visible = True
+            self.view.widgets.numeric['protocol_min'].disabled = False
+            self.view.widgets.numeric['protocol_min'].value = 0
+            self.view.widgets.numeric['protocol_max'].value = 1
+            self.view.widgets.numeric['protocol_n'].update(title='Accuracy, Hz', low=0.1, high=None)
+            self.view.widgets.numeric['protocol_n'].value = 5
             self.view.widgets.numeric['protocol_max'].title = 'Max current, nA'
             self.view.widgets.numeric['protocol_min'].title = 'Min current, nA'
         elif new == 'Dendritic nonlinearity':
@@ -95,6 +105,7 @@ class ValidationMixin():
             self.view.widgets.numeric['protocol_min'].value = 1
             self.view.widgets.numeric['protocol_max'].value = 10
             self.view.widgets.numeric['protocol_n'].value = 10
+            self.view.widgets.numeric['protocol_n'].update(title='N steps', low=1, high=10)
             self.view.widgets.numeric['protocol_max'].title = 'Max weight'
             self.view.widgets.numeric['protocol_min'].title = 'Min weight'
         else:
@@ -107,41 +118,69 @@ class ValidationMixin():
         protocol = self.view.widgets.selectors['protocol'].value
         self.view.figures['stats_ephys'].visible = False
 
+        checks = {
+            'Input resistance and time constant': self._check_passive_protocol,
+            'Somatic spikes': self._check_somatic_spikes_protocol,
+            'Voltage attenuation': self._check_voltage_attenuation_protocol,
+            'f-I curve': self._check_somatic_spikes_protocol,
+            'Adaptive f-I curve': self._check_somatic_spikes_protocol,
+            'Dendritic nonlinearity': self._check_dendritic_nonlinearity_protocol,
+        }
+        if not checks[protocol]():
+            return
+
+        kwargs = self._get_protocol_kwargs(protocol)
+        if self.worker is not None:
+            # The protocol runs on the copy of the model in the worker
+            snapshot = self.get_simulation_snapshot()
+            duration = self.view.widgets.sliders['duration'].value
+            self._call_in_worker('protocol', snapshot, protocol, kwargs, duration,
+                                 callback=lambda data, runtime: self._show_protocol(protocol, kwargs, data),
+                                 error_message='Protocol failed.')
+        else:
+            data = run_protocol(self.model, protocol, **kwargs)
+            self._show_protocol(protocol, kwargs, data)
+
+    def _get_protocol_kwargs(self, protocol):
+        min_value = self.view.widgets.numeric['protocol_min'].value
+        max_value = self.view.widgets.numeric['protocol_max'].value
+        n = self.view.widgets.numeric['protocol_n'].value
+        duration = self.view.widgets.sliders['duration'].value
+        if protocol == 'f-I curve':
+            return {'duration': duration, 'min_amp': min_value, 'max_amp': max_value, 'n': n}
+        if protocol == 'Adaptive f-I curve':
+            return {'duration': duration, 'min_amp': min_value, 'max_amp': max_value, 'rate_tol': n}
+        if protocol == 'Dendritic nonlinearity':
+            return {'max_weight': max_value, 'n': n}
+        return {}
+
+    def _show_protocol(self, protocol, kwargs, data):
+        """
+        Plot the data of the protocol and show the voltage for the
+        last stimulus of the protocol, which is left in the model.
+        """
         if protocol == 'Input resistance and time constant':
-            if self._check_passive_protocol():
-                passive_data = calculate_passive_properties(self.model)
-                self._plot_passive_properties(passive_data)
+            self._plot_passive_properties(data)
 
         elif protocol == 'Somatic spikes':
-            if self._check_somatic_spikes_protocol():
-                spike_data = detect_somatic_spikes(self.model)
-                self._plot_somatic_spikes(spike_data)
+            self._plot_somatic_spikes(data)
 
         elif protocol == 'Voltage attenuation':
-            if self._check_voltage_attenuation_protocol():
-                data = calculate_voltage_attenuation(self.model)
-                self._plot_voltage_attenuation(data)
-
-        elif protocol == 'f-I curve':
-            if self._check_somatic_spikes_protocol():
-                min_amp = self.view.widgets.numeric['protocol_min'].value
-                max_amp = self.view.widgets.numeric['protocol_max'].value
-                n = self.view.widgets.numeric['protocol_n'].value
-                duration = self.view.widgets.sliders['duration'].value
-                data = calculate_fI_curve(self.model, duration=duration, min_amp=min_amp, max_amp=max_amp, n=n)
-                self._plot_fI_curve(data)
-                with remove_callbacks(self.view.widgets.sliders['iclamp_amp']):
-                    self.view.widgets.sliders['iclamp_amp'].value = max_amp
-                self.update_voltage()
-            
-        
+            self._plot_voltage_attenuation(data)
+
+        elif protocol in ['f-I curve', 'Adaptive f-I curve']:
+            self._plot_fI_curve(data)
+            max_amp = kwargs['max_amp']
+            self.model.iclamps[self.model.seg_tree.root].amp = max_amp
+            with remove_callbacks(self.view.widgets.sliders['iclamp_amp']):
+                self.view.widgets.sliders['iclamp_amp'].value = max_amp
+            self.update_voltage()
+
         elif protocol == 'Dendritic nonlinearity':
-            if self._check_dendritic_nonlinearity_protocol():
-                max_weight = self.view.widgets.numeric['protocol_max'].value
-                n = self.view.widgets.numeric['protocol_n'].value
-                data = calculate_dendritic_nonlinearity(self.model, max_weight=max_weight, n=n)
-                self._plot_dendritic_nonlinearity(data)
-                self.update_voltage()
+            self._plot_dendritic_nonlinearity(data)
+            population = list(self.model.populations.values())[0]
+            update_population_inputs(population, weight=int(kwargs['max_weight']))
+            self.update_voltage()
 
     def _check_passive_protocol(self):
         if len(self.model.recordings['v']) != 1:
@@ -324,9 +363,21 @@ class ValidationMixin():
         self.view.figures['stats_ephys'].y_range.start = -1
         self.view.figures['stats_ephys'].y_range.end = max(rates) * 1.1
         self.view.sources['stats_ephys'].data = {'x': amps, 'y': rates}
-        stats = f"<table><tr><th>Current, nA</th><th>Firing rate, Hz</th></tr>"
+        stats = ""
+        if 'rheobase' in data:
+            rheobase = data['rheobase']
+            if rheobase is None:
+                stats += "No spikes within the range.<br>"
+            else:
+                self.view.sources['stats_ephys_extra'].data = {
+                    'x': [rheobase, rheobase], 
+                    'y': [0, max(rates)]
+                }
+                stats += f"Rheobase: {np.round(rheobase, 3)} nA<br>"
+            stats += f"Number of simulations: {data['n_runs']}<br>"
+        stats += f"<table><tr><th>Current, nA</th><th>Firing rate, Hz</th></tr>"
         for amp, rate in zip(amps, rates):
-            stats += f"<tr><td>{np.round(amp,2)}</td><td>{np.round(rate, 2)}</td></tr>"
+            stats += f"<tr><td>{np.round(amp,3)}</td><td>{np.round(rate, 2)}</td></tr>"
         stats += "</table>"
         self.view.DOM_elements['stats_ephys'].text = stats
         self.view.DOM_elements['stats_ephys'].styles['color'] = self.view.theme.status_colors['success']
@@ -391,6 +442,7 @@ class ValidationMixin():
 
     @log
     def morphometric_stats_callback(self, event):
+        from dendrotweaks.analysis.morphometric_analysis import calculate_section_statistics
 
         selected_sections = list(self.selected_secs)
         if not selected_sections:
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Validation protocols of the Ephys analysis tab.
+
+The protocols run on the session's model, or on its copy in the session's
+worker process when the simulations run in workers (see neuron_worker.py).
+This module is imported by the workers, so it must not import Bokeh or
+the app logger.
+"""
+
+
+# Protocols that analyse the latest run instead of running simulations
+LAST_RUN_PROTOCOLS = ['Input resistance and time constant', 'Somatic spikes', 'Voltage attenuation']
+
+
+def run_protocol(model, protocol, **kwargs):
+    """
+    Run a validation protocol on the model.
+
+    Parameters
+    ----------
+    model : Model
+        The neuron model with the stimuli and recordings of the protocol.
+    protocol : str
+        The name of the protocol, as in PROTOCOL_DESCRIPTIONS.
+    **kwargs
+        The arguments of the protocol, e.g. the range of amplitudes.
+
+    Returns
+    -------
+    dict
+        The data of the protocol, as returned by dendrotweaks.analysis.
+    """
+    from dendrotweaks.analysis import detect_somatic_spikes
+    from dendrotweaks.analysis import calculate_passive_properties
+    from dendrotweaks.analysis import calculate_fI_curve
+    from dendrotweaks.analysis import calculate_voltage_attenuation
+    from dendrotweaks.analysis import calculate_dendritic_nonlinearity
+    from adaptive_fI import calculate_adaptive_fI_curve
+
+    functions = {
+        'Input resistance and time constant': calculate_passive_properties,
+        'Somatic spikes': detect_somatic_spikes,
+        'Voltage attenuation': calculate_voltage_attenuation,
+        'f-I curve': calculate_fI_curve,
+        'Adaptive f-I curve': calculate_adaptive_fI_curve,
+        'Dendritic nonlinearity': calculate_dendritic_nonlinearity,
+    }
+    return functions[protocol](model, **kwargs)
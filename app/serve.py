@@ -0,0 +1,50 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Runs the app on a Bokeh server together with the HTTP endpoints
+defined in handlers.py, which `bokeh serve` can not add:
+
+    python app/serve.py --address 0.0.0.0 --port 5006
+
+Otherwise equivalent to `bokeh serve app`.
+"""
+
+import os
+import argparse
+
+from bokeh.command.util import build_single_handler_application
+from bokeh.server.server import Server
+
+from handlers import get_patterns, MAX_UPLOAD_SIZE_MB
+
+PATH_TO_APP = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the DendroTweaks app.')
+    parser.add_argument('--address', default='localhost')
+    parser.add_argument('--port', type=int, default=5006)
+    parser.add_argument('--allow-websocket-origin', action='append', default=None)
+    parser.add_argument('--num-procs', type=int, default=1)
+    parser.add_argument('--max-upload-size-mb', type=int, default=MAX_UPLOAD_SIZE_MB)
+    parser.add_argument('--show', action='store_true')
+    args = parser.parse_args()
+
+    application = build_single_handler_application(PATH_TO_APP)
+    server = Server(
+        {'/app': application},
+        address=args.address,
+        port=args.port,
+        allow_websocket_origin=args.allow_websocket_origin,
+        num_procs=args.num_procs,
+        extra_patterns=get_patterns(args.max_upload_size_mb),
+    )
+    server.start()
+    if args.show:
+        server.io_loop.add_callback(server.show, '/app')
+    server.io_loop.start()
+
+
+if __name__ == '__main__':
+    main()
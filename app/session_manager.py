@@ -0,0 +1,206 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Lifecycle of the sessions served by this server process.
+
+The sessions are registered with their presenters (see main.py).
+Sessions that stay idle longer than the idle timeout are evicted
+and their resources released (see app_hooks.py for the periodic check).
+When the memory of the process and its simulation workers exceeds the 
+high-watermark, the sessions idle for longer than reclaim_idle_min are 
+evicted first, new sessions wait for the memory to be released (and are 
+rejected if it is not released in max_wait_s), and models can not be 
+loaded until it is.
+Sessions in use are never evicted for memory.
+"""
+
+import os
+import gc
+import sys
+import time
+import asyncio
+import resource
+
+from logger import logger
+
+# How often (ms) the sessions are checked for inactivity
+IDLE_CHECK_INTERVAL_MS = 60_000
+
+# How often (s) a new session checks the memory while waiting
+MEMORY_POLL_INTERVAL_S = 1
+
+
+def get_process_memory(pid='self'):
+    """
+    Returns the resident memory of a process in MB, read from /proc.
+    """
+    with open(f'/proc/{pid}/statm', 'r') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+
+
+def get_child_processes(pid):
+    """
+    Returns the pids of the descendants of a process, e.g. the fork
+    server of the simulation workers and the workers forked from it.
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The name in parentheses may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    descendants = []
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            descendants.append(child)
+            stack.append(child)
+    return descendants
+
+
+def get_memory_usage():
+    """
+    Returns the resident memory of this process and of its child 
+    processes, i.e. the simulation workers, in MB.
+    """
+    try:
+        usage = get_process_memory()
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current usage, in kB on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / 1024**2 if sys.platform == 'darwin' else max_rss / 1024
+    for pid in get_child_processes(os.getpid()):
+        try:
+            usage += get_process_memory(pid)
+        except (OSError, ValueError, IndexError):
+            # The process exited meanwhile
+            continue
+    return usage
+
+
+class SessionRegistry():
+    """
+    Keeps track of the presenters of the active sessions.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        # Set from the config of the first session (see configure)
+        self.idle_timeout_min = 0
+        self.max_memory_mb = 0
+        self.max_wait_s = 0
+        self.reclaim_idle_min = 0
+        # Docs of the sessions whose eviction is scheduled
+        self._evicting = set()
+
+    def configure(self, config):
+        self.idle_timeout_min = config.get('idle_timeout_min', 0)
+        self.max_memory_mb = config.get('max_memory_mb', 0)
+        self.max_wait_s = config.get('max_wait_s', 0)
+        self.reclaim_idle_min = config.get('reclaim_idle_min', 10)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def register(self, doc, presenter):
+        self._sessions[doc] = presenter
+        logger.info(f'Session registered ({len(self)} active, {get_memory_usage():.0f} MB)')
+
+    def unregister(self, doc):
+        self._sessions.pop(doc, None)
+        self._evicting.discard(doc)
+        gc.collect()
+        logger.info(f'Session unregistered ({len(self)} active, {get_memory_usage():.0f} MB)')
+
+    # ==========================================================================
+    # IDLE EVICTION
+    # ==========================================================================
+
+    def get_idle_sessions(self, min_idle_s=0):
+        """
+        Returns the (doc, presenter) pairs of the sessions with a loaded
+        model that have been idle for at least min_idle_s and are not 
+        being evicted, the longest idle first.
+        """
+        now = time.time()
+        idle = [(doc, presenter) for doc, presenter in self._sessions.items()
+                if presenter.model is not None
+                and doc not in self._evicting
+                and now - presenter.last_activity >= min_idle_s]
+        return sorted(idle, key=lambda item: item[1].last_activity)
+
+    def evict_idle(self):
+        """
+        Evict the sessions that have exceeded the idle timeout.
+        """
+        if not self.idle_timeout_min:
+            return
+        for doc, presenter in self.get_idle_sessions(self.idle_timeout_min * 60):
+            logger.info(f'Evicting session idle since {time.ctime(presenter.last_activity)}')
+            self._schedule_eviction(doc, presenter, reason='idle')
+
+    def _schedule_eviction(self, doc, presenter, reason):
+        """
+        Evict the session on its own next tick, under its document lock,
+        so that a run or an export in flight is not interrupted.
+        """
+        self._evicting.add(doc)
+
+        def evict():
+            self._evicting.discard(doc)
+            presenter.evict(reason=reason)
+            gc.collect()
+
+        doc.add_next_tick_callback(evict)
+
+    # ==========================================================================
+    # MEMORY HIGH-WATERMARK
+    # ==========================================================================
+
+    def is_over_watermark(self):
+        return bool(self.max_memory_mb) and get_memory_usage() > self.max_memory_mb
+
+    def reclaim(self):
+        """
+        Schedule the eviction of the sessions idle for longer than
+        reclaim_idle_min, the longest idle first, if the memory is over
+        the high-watermark. The memory is released on the next ticks 
+        of the evicted sessions, so the callers check the memory later.
+        """
+        if not self.is_over_watermark():
+            return
+        # Without a per-session memory estimate, all the sessions 
+        # that qualify are evicted at once
+        for doc, presenter in self.get_idle_sessions(self.reclaim_idle_min * 60):
+            logger.info(f'Memory over {self.max_memory_mb} MB, evicting a session '
+                        f'idle since {time.ctime(presenter.last_activity)}')
+            self._schedule_eviction(doc, presenter, reason='memory')
+
+    async def wait_for_memory(self):
+        """
+        Wait, without blocking the server, until the memory drops
+        below the high-watermark or max_wait_s passes.
+
+        Returns
+        -------
+        bool
+            Whether the memory is below the high-watermark.
+        """
+        deadline = time.time() + self.max_wait_s
+        while self.is_over_watermark():
+            self.reclaim()
+            if time.time() >= deadline:
+                logger.warning(f'Memory over {self.max_memory_mb} MB after {self.max_wait_s} s')
+                return False
+            await asyncio.sleep(MEMORY_POLL_INTERVAL_S)
+        return True
+
+
+sessions = SessionRegistry()
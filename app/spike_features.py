@@ -0,0 +1,158 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Spike and backpropagating action potential (bAP) features of all
+the recorded segments.
+
+The voltages of the recorded segments are processed at once as an
+(n_segments, n_steps) matrix, instead of one trace at a time
+(cf. detect_somatic_spikes). The spikes are counted as upward threshold
+crossings, and the first spike of the reference segment (the soma if it
+is recorded) defines the window in which the bAP peak, amplitude,
+half-width and latency are measured in every segment.
+"""
+
+import numpy as np
+
+# Graph parameters of the latest simulation
+SPIKE_PARAMS = {
+    'n_spikes': 'Number of spikes',
+    'bAP_amplitude': 'Amplitude of the first (backpropagating) spike (mV)',
+    'bAP_latency': 'Latency of the peak relative to the reference (ms)',
+    'bAP_half_width': 'Half-width of the first (backpropagating) spike (ms)',
+}
+
+# Voltage (mV) that counts as a spike when crossed upwards
+SPIKE_THRESHOLD = -20
+
+# Time (ms) before the reference spike used as the baseline
+BASELINE_TIME = 1
+
+# Time (ms) after the reference spike in which the peaks are found
+BAP_WINDOW = 10
+
+
+def _interpolate(t, v, rows, i, level):
+    """
+    Time at which the rows of v cross the level between the steps i and i + 1.
+    """
+    v0, v1 = v[rows, i], v[rows, i + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (level - v0) / (v1 - v0)
+    return t[i] + fraction * (t[i + 1] - t[i])
+
+
+def extract_spike_features(t, voltages, ref_idx=None, threshold=SPIKE_THRESHOLD):
+    """
+    Extract the spike features of multiple voltage traces.
+
+    Parameters
+    ----------
+    t : array_like
+        The time points, (n_steps,).
+    voltages : array_like
+        The voltage traces, (n_traces, n_steps).
+    ref_idx : int
+        The index of the reference trace. Defaults to
+        the trace that crosses the threshold first.
+    threshold : float
+        The spike threshold in mV.
+
+    Returns
+    -------
+    dict
+        The spike times of each trace (list of arrays) and the SPIKE_PARAMS
+        as arrays, NaN if the reference trace does not spike.
+    """
+    t = np.asarray(t, dtype=float)
+    v = np.asarray(voltages, dtype=float)
+    n_traces = v.shape[0]
+
+    # Upward threshold crossings
+    crossings = (v[:, :-1] < threshold) & (v[:, 1:] >= threshold)
+    rows, steps = np.nonzero(crossings)
+    times = _interpolate(t, v, rows, steps, threshold)
+    n_spikes = crossings.sum(axis=1)
+    spike_times = np.split(times, np.cumsum(n_spikes)[:-1])
+
+    features = {
+        'spike_times': spike_times,
+        'n_spikes': n_spikes.astype(float),
+        'bAP_amplitude': np.full(n_traces, np.nan),
+        'bAP_latency': np.full(n_traces, np.nan),
+        'bAP_half_width': np.full(n_traces, np.nan),
+    }
+    if not n_spikes.any():
+        return features
+
+    first_steps = np.where(n_spikes > 0, crossings.argmax(axis=1), len(t))
+    if ref_idx is None or not n_spikes[ref_idx]:
+        ref_idx = np.argmin(first_steps)
+    if not n_spikes[ref_idx]:
+        return features
+
+    dt = t[1] - t[0]
+    start = max(first_steps[ref_idx] - int(BASELINE_TIME / dt), 0)
+    stop = min(first_steps[ref_idx] + int(BAP_WINDOW / dt), len(t))
+    window = v[:, start:stop]
+    t_window = t[start:stop]
+
+    baseline = window[:, 0]
+    peaks = window.argmax(axis=1)
+    amplitudes = window.max(axis=1) - baseline
+    half = baseline + amplitudes / 2
+
+    # Last step below the half-amplitude before the peak
+    # and first step below it after the peak
+    steps = np.arange(window.shape[1])
+    below = window < half[:, None]
+    left = np.where(below & (steps < peaks[:, None]), steps, -1).max(axis=1)
+    right = np.where(below & (steps > peaks[:, None]), steps, window.shape[1]).min(axis=1)
+    valid = (left >= 0) & (right < window.shape[1])
+    left, right = np.where(valid, left, 0), np.where(valid, right - 1, 0)
+    traces = np.arange(n_traces)
+    half_widths = (_interpolate(t_window, window, traces, right, half)
+                   - _interpolate(t_window, window, traces, left, half))
+
+    peak_times = t_window[peaks]
+    features['bAP_amplitude'] = amplitudes
+    # No latency without a rise after the baseline
+    features['bAP_latency'] = np.where(peaks > 0, peak_times - peak_times[ref_idx], np.nan)
+    features['bAP_half_width'] = np.where(valid, half_widths, np.nan)
+    return features
+
+
+def calculate_spike_maps(model, t, recordings):
+    """
+    Calculate the spike features of the recorded segments.
+
+    Parameters
+    ----------
+    model : Model
+        The neuron model.
+    t : array_like
+        The time points of the simulation.
+    recordings : dict
+        The voltage traces as {seg.idx: values}.
+
+    Returns
+    -------
+    dict
+        The SPIKE_PARAMS as arrays indexed by seg.idx,
+        NaN in the segments without recordings.
+    """
+    n = len(model.seg_tree)
+    maps = {name: np.full(n, np.nan) for name in SPIKE_PARAMS}
+    if not recordings:
+        return maps
+
+    idxs = np.array(sorted(recordings))
+    voltages = np.array([recordings[idx] for idx in idxs])
+    soma_idx = model.seg_tree.root.idx
+    ref_idx = int(np.argmax(idxs == soma_idx)) if soma_idx in recordings else None
+
+    features = extract_spike_features(t, voltages, ref_idx=ref_idx)
+    for name in SPIKE_PARAMS:
+        maps[name][idxs] = features[name]
+    return maps
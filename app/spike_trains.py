@@ -0,0 +1,163 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Bulk generation of the spike trains of a synaptic population.
+
+Instead of drawing one train per synapse with its own generator and
+vector (cf. Population.create_inputs), the trains of all the synapses
+are drawn at once from the population's generator into a flat array of
+spike times, with the number of spikes of each synapse. The array is
+copied to NEURON in one vector, from which the vectors of the existing
+VecStims are filled, so that the stimuli and the connections are
+reused when the input parameters change. Only the connections are
+updated when only the weight or the delay changes.
+"""
+
+import numpy as np
+
+# Input parameters that change the spike times
+STIM_PARAMS = ('rate', 'noise', 'start', 'end', 'seed')
+
+# Input parameters of the connections
+CON_PARAMS = ('weight', 'delay')
+
+
+def generate_spike_trains(N, rate=1, noise=1, duration=300, delay=0, seed=None):
+    """
+    Generate the spike trains of N synapses at once.
+
+    Parameters
+    ----------
+    N : int
+        The number of synapses.
+    rate : float
+        The rate of the spike trains, in Hz.
+    noise : float
+        A parameter between 0 and 1 that controls the regularity of the
+        spike trains. 0 corresponds to regular spike trains. 1 corresponds
+        to Poisson processes.
+    duration : int
+        The duration of the spike trains, in ms.
+    delay : int
+        The delay of the spike trains, in ms.
+    seed : int
+        The seed of the population's generator.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The sorted spike times of each synapse one after the other, in ms,
+        and the number of spikes of each synapse.
+    """
+    if N == 0 or rate <= 0 or duration <= 0:
+        return np.empty(0), np.zeros(N, dtype=int)
+
+    rng = np.random.default_rng(seed)
+
+    if noise == 1:
+        # The number of events of a Poisson process, uniformly distributed
+        counts = rng.poisson(rate * duration / 1000, N)
+        times = rng.uniform(0, duration, counts.sum())
+        rows = np.repeat(np.arange(N), counts)
+        times = times[np.lexsort((times, rows))]
+    else:
+        interval = 1000 / rate
+        grid = np.arange(0, duration, interval)
+        times = grid + rng.normal(0, noise * interval, (N, len(grid)))
+        times.sort(axis=1)
+        valid = (times >= 0) & (times <= duration)
+        counts = valid.sum(axis=1)
+        times = times[valid]
+
+    return delay + times, counts
+
+
+def load_spike_trains(population, times, counts):
+    """
+    Play the spike trains in the VecStims of the population's synapses
+    in the order of population.flat_synapses. The stimuli and connections
+    of the synapses are created if they do not exist.
+    """
+    from neuron import h
+
+    flat_vec = h.Vector(np.asarray(times, dtype=float))
+    stops = np.cumsum(counts)
+    weight = population.input_params['weight']
+    delay = population.input_params['delay']
+
+    for syn, start, stop in zip(population.flat_synapses, stops - counts, stops):
+        if syn._ref_stim is None:
+            spike_vec = h.Vector()
+            stim = h.VecStim()
+            stim.play(spike_vec)
+            syn._ref_stim = [stim, spike_vec]
+        spike_vec = syn._ref_stim[1]
+        spike_vec.resize(stop - start)
+        if stop > start:
+            spike_vec.copy(flat_vec, int(start), int(stop) - 1)
+        if syn._ref_con is None:
+            syn.create_con(delay=delay, weight=weight)
+
+
+def create_population_inputs(population):
+    """
+    Generate and load the spike trains of all the synapses
+    of the population.
+    """
+    params = population.input_params
+    times, counts = generate_spike_trains(
+        population.N,
+        rate=params['rate'],
+        noise=params['noise'],
+        duration=params['end'] - params['start'],
+        delay=params['start'],
+        seed=params['seed'],
+    )
+    load_spike_trains(population, times, counts)
+
+
+def update_population_connections(population):
+    """
+    Set the weight and the delay of the connections of the population.
+    """
+    weight = population.input_params['weight']
+    delay = population.input_params['delay']
+    for syns in population.synapses.values():
+        for syn in syns:
+            syn._ref_con.weight[0] = weight
+            syn._ref_con.delay = delay
+
+
+def update_population_inputs(population, **params):
+    """
+    Update the input parameters of the population, regenerating the
+    spike trains only if the parameters that define them changed.
+
+    Returns
+    -------
+    list[str]
+        The names of the changed parameters.
+    """
+    changed = [name for name, value in params.items()
+               if population.input_params.get(name) != value]
+    population.input_params.update(params)
+
+    if any(name in STIM_PARAMS for name in changed):
+        create_population_inputs(population)
+    if any(name in CON_PARAMS for name in changed):
+        update_population_connections(population)
+    return changed
+
+
+def get_population_spike_trains(population):
+    """
+    Returns the spike times of the synapses of the population
+    as a flat array in the order of population.flat_synapses,
+    and the number of spikes of each synapse.
+    """
+    vecs = [syn._ref_stim[1].as_numpy() if syn._ref_stim else np.empty(0)
+            for syn in population.flat_synapses]
+    counts = np.array([len(vec) for vec in vecs], dtype=int)
+    times = np.concatenate(vecs) if vecs else np.empty(0)
+    return times, counts
@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Fit of the standard kinetics to a channel, run in the processes of a
+process pool (see ChannelMixin.fit_standard_channels). The processes are
+started from a fork server and import this module, so it must not import
+Bokeh or the app logger.
+"""
+
+
+def fit_standard_channel(name, state_powers, ion, params, data):
+    """
+    Fit the standard kinetics to the data of a channel.
+    Runs in a worker process, so it only takes and returns plain data.
+
+    Returns
+    -------
+    dict
+        The fitted parameters, e.g. {'vhalf_m': ..., 'sigma_m': ...}.
+    """
+    from dendrotweaks.biophys import StandardIonChannel
+
+    standard_channel = StandardIonChannel(name=f'std{name}', 
+                                          state_powers=state_powers, 
+                                          ion=ion)
+    for param in ['q10', 'temp']:
+        if param in params:
+            standard_channel.params[param] = params[param]
+    standard_channel.set_tadj(params.get('temp'))
+
+    states = [state for state in data if state != 'x']
+    standard_channel.fit(data)
+    return {f'{param}_{state}': float(standard_channel.params[f'{param}_{state}'])
+            for state in states 
+            for param in StandardIonChannel.STANDARD_PARAMS}
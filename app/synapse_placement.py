@@ -0,0 +1,131 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Placement of synapses on many segments according to a density.
+
+Instead of choosing a location for each synapse among a grid of
+locations of the selected sections (cf. Population.allocate_synapses),
+the expected number of synapses of each segment is the density at its
+distance from the root times its length or area. The number of synapses
+of the segments are drawn from one multinomial distribution and their
+locations uniformly within the segments, all at once.
+"""
+
+import numpy as np
+
+from dendrotweaks.stimuli.populations import Population
+
+
+def calculate_expected_counts(measures, distances, density):
+    """
+    Calculate the expected number of synapses of the segments.
+
+    Parameters
+    ----------
+    measures : array_like
+        The length (µm) or area (µm²) of the segments.
+    distances : array_like
+        The path distances of the segments to the root (µm).
+    density : callable or float
+        The number of synapses per µm or µm² as a function of the
+        distance, e.g. a dendrotweaks Distribution, or a constant.
+
+    Returns
+    -------
+    np.ndarray
+        The expected number of synapses of each segment.
+    """
+    distances = np.asarray(distances, dtype=float)
+    densities = density(distances) if callable(density) else density
+    densities = np.broadcast_to(np.asarray(densities, dtype=float), distances.shape)
+    return np.clip(densities, 0, None) * np.asarray(measures, dtype=float)
+
+
+def exponential_density(density, length_constant):
+    """
+    Return a density that changes exponentially with the distance,
+    i.e. density * exp(distance / length_constant). A negative length
+    constant gives a decreasing density.
+    """
+    def func(distances):
+        return density * np.exp(np.asarray(distances) / length_constant)
+    return func
+
+
+def place_synapses(segments, measures, distances, density, N=None, seed=None):
+    """
+    Place synapses on the segments according to a density.
+
+    Parameters
+    ----------
+    segments : list[Segment]
+        The segments on which the synapses are placed.
+    measures : array_like
+        The length (µm) or area (µm²) of the segments.
+    distances : array_like
+        The path distances of the segments to the root (µm).
+    density : callable or float
+        The number of synapses per µm or µm² as a function of the distance.
+    N : int
+        The total number of synapses. If given, the density is only
+        relative. Defaults to the expected number of synapses.
+    seed : int
+        The seed of the random number generator.
+
+    Returns
+    -------
+    list[tuple]
+        The (sec, x) locations of the synapses sorted by (sec.idx, x),
+        as expected by Population.allocate_synapses.
+    """
+    expected = calculate_expected_counts(measures, distances, density)
+    total = expected.sum()
+    if N is None:
+        N = int(round(total))
+    if N <= 0 or total <= 0:
+        return []
+
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(N, expected / total)
+
+    sections = [seg._section for seg in segments]
+    nseg = np.array([sec._ref.nseg for sec in sections])
+    # Index of the segment in its section
+    positions = np.floor(np.array([seg.x for seg in segments]) * nseg)
+
+    rows = np.repeat(np.arange(len(segments)), counts)
+    xs = (positions[rows] + rng.random(N)) / nseg[rows]
+    sec_idxs = np.array([sec.idx for sec in sections])[rows]
+    order = np.lexsort((xs, sec_idxs))
+
+    return [(sections[rows[i]], float(xs[i])) for i in order]
+
+
+def build_population(name, syn_locs, syn_type):
+    """
+    Create a population with the synapses at the given locations.
+
+    Parameters
+    ----------
+    name : str
+        The name of the population.
+    syn_locs : list[tuple]
+        The (sec, x) locations of the synapses, e.g. from place_synapses.
+    syn_type : str
+        The type of synapse e.g. 'AMPA', 'NMDA', 'AMPA_NMDA', 'GABAa'.
+
+    Returns
+    -------
+    Population
+        The population with its synapses allocated.
+    """
+    segments = list({sec(x): None for sec, x in syn_locs})
+    # Population.__init__ looks up every segment of the sections in the
+    # list of segments to exclude them from its own choice of locations, 
+    # which is quadratic and not needed since the locations are given.
+    population = Population(name, [], len(syn_locs), syn_type)
+    population.segments = segments
+    population.sections = list({seg._section: None for seg in segments})
+    population.allocate_synapses(syn_locs=syn_locs)
+    return population
@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Export of recorded traces to compressed files.
+
+A run is given as (t, recordings), where recordings is {var: {seg.idx: values}}.
+The traces are written one at a time, so that only a single trace is
+copied in memory on top of the recordings. The files are served
+in chunks by the TraceExportHandler (see handlers.py).
+
+The runs kept for export are spooled to disk as they finish (see
+spool_run), and read back one run at a time when they are exported.
+"""
+
+import os
+import zipfile
+import importlib.util
+
+import numpy as np
+
+# Format name: (file extension, required module)
+EXPORT_FORMATS = {
+    'NPZ': ('npz', None),
+    'HDF5': ('h5', 'h5py'),
+    'Parquet': ('parquet', 'pyarrow'),
+}
+
+
+def get_available_formats():
+    """
+    Returns the formats whose dependencies are installed.
+    """
+    return [name for name, (_, module) in EXPORT_FORMATS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def _to_array(values):
+    # NEURON Vectors are viewed without a copy
+    if hasattr(values, 'as_numpy'):
+        return values.as_numpy()
+    return np.asarray(values, dtype=float)
+
+
+def write_npz(path_to_file, runs, compression=zipfile.ZIP_DEFLATED):
+    """
+    Keys are 'run_<i>/t' and 'run_<i>/<var>/<seg_idx>'.
+    """
+    with zipfile.ZipFile(path_to_file, 'w', compression=compression,
+                         allowZip64=True) as zf:
+        for i, (t, recordings) in enumerate(runs):
+            arrays = [('t', t)] + [(f'{var}/{seg_idx}', values)
+                                   for var, recs in recordings.items()
+                                   for seg_idx, values in recs.items()]
+            for key, values in arrays:
+                with zf.open(f'run_{i}/{key}.npy', 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, _to_array(values), allow_pickle=False)
+
+
+def write_hdf5(path_to_file, runs):
+    """
+    One group per run with the time vector 't' and a 2D dataset
+    (segments x time) per variable, with the segment indices in
+    the 'seg_idx' attribute.
+    """
+    import h5py
+
+    with h5py.File(path_to_file, 'w') as f:
+        for i, (t, recordings) in enumerate(runs):
+            group = f.create_group(f'run_{i}')
+            t = _to_array(t)
+            group.create_dataset('t', data=t, compression='gzip')
+            for var, recs in recordings.items():
+                dataset = group.create_dataset(var, shape=(len(recs), len(t)),
+                                               dtype=float, chunks=(1, len(t)),
+                                               compression='gzip')
+                dataset.attrs['seg_idx'] = np.fromiter(recs.keys(), dtype=np.int32)
+                for row, values in enumerate(recs.values()):
+                    dataset[row] = _to_array(values)
+
+
+def write_parquet(path_to_file, runs):
+    """
+    Long format with the columns run, var, seg_idx, t and value,
+    one row group per trace.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('run', pa.int32()),
+        ('var', pa.dictionary(pa.int32(), pa.string())),
+        ('seg_idx', pa.int32()),
+        ('t', pa.float64()),
+        ('value', pa.float64()),
+    ])
+    with pq.ParquetWriter(path_to_file, schema, compression='zstd') as writer:
+        for i, (t, recordings) in enumerate(runs):
+            t = _to_array(t)
+            for var, recs in recordings.items():
+                for seg_idx, values in recs.items():
+                    n = len(t)
+                    table = pa.table({
+                        'run': pa.array(np.full(n, i, dtype=np.int32)),
+                        'var': pa.DictionaryArray.from_arrays(
+                            pa.array(np.zeros(n, dtype=np.int32)), pa.array([var])),
+                        'seg_idx': pa.array(np.full(n, seg_idx, dtype=np.int32)),
+                        't': pa.array(t),
+                        'value': pa.array(_to_array(values)),
+                    }, schema=schema)
+                    writer.write_table(table)
+
+
+WRITERS = {
+    'NPZ': write_npz,
+    'HDF5': write_hdf5,
+    'Parquet': write_parquet,
+}
+
+
+def spool_run(path_to_file, run):
+    """
+    Write a run to an uncompressed NPZ file, so that it does
+    not have to be kept in memory. The file is read with 
+    load_spooled_runs.
+    """
+    write_npz(path_to_file, [run], compression=zipfile.ZIP_STORED)
+
+
+def load_spooled_runs(paths_to_files):
+    """
+    Read the spooled runs back, one run at a time.
+
+    Yields
+    ------
+    tuple
+        The (t, recordings) of each run.
+    """
+    for path_to_file in paths_to_files:
+        t, recordings = None, {}
+        with np.load(path_to_file, allow_pickle=False) as data:
+            for key in data.files:
+                key_in_run = key.split('/', 1)[1]
+                if key_in_run == 't':
+                    t = data[key]
+                else:
+                    var, seg_idx = key_in_run.rsplit('/', 1)
+                    recordings.setdefault(var, {})[int(seg_idx)] = data[key]
+        yield t, recordings
+
+
+def export_traces(path_to_dir, file_name, runs, format_name='NPZ'):
+    """
+    Write the runs to path_to_dir/file_name.<ext>.
+
+    Returns
+    -------
+    str
+        The path to the file.
+    """
+    extension, _ = EXPORT_FORMATS[format_name]
+    path_to_file = os.path.join(path_to_dir, f'{file_name}.{extension}')
+    WRITERS[format_name](path_to_file, runs)
+    return path_to_file
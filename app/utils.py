@@ -49,6 +49,16 @@ def get_sec_id(match):
 def lambda_f(sec, f):
     return 1e5*np.sqrt(sec.diam/(4*np.pi*f*sec.Ra*sec.cm))
 
+def calculate_nseg(frusta, Ra, cm, d_lambda, f=100):
+    """
+    The d_lambda rule of Model.set_segmentation over arrays of sections.
+    frusta is the sum of length / sqrt(d1 + d2) over the frusta
+    of each section, which only depends on the morphology.
+    """
+    # Electrotonic length of the sections, L / lambda_f
+    electrotonic_L = frusta * np.sqrt(2) * 1e-5 * np.sqrt(4 * np.pi * f * Ra * cm)
+    return np.maximum(1, ((electrotonic_L / d_lambda + 0.9) / 2).astype(int) * 2 + 1)
+
 def get_seg_name(seg, round_x=True):
     if round_x:
         return f'{get_sec_name(seg.sec)}({round(seg.x, 5)})'
@@ -113,3 +123,50 @@ def decrease_saturation_and_brightness(color_list, saturation_decrease, brightne
         new_colors.append('#' + rgb_to_hex(new_rgb))
     return new_colors
 
+
+
+def simplify_polyline(points, tolerance):
+    """
+    Simplify a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        (N, D) array of point coordinates.
+    tolerance : float
+        Maximum distance of a removed point from the simplified line.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the points to keep. The end points are always kept.
+    """
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start < 2:
+            continue
+        a, b = points[start], points[stop]
+        inner = points[start + 1:stop] - a
+        ab = b - a
+        norm = np.linalg.norm(ab)
+        if norm == 0:
+            dists = np.linalg.norm(inner, axis=1)
+        else:
+            # Distance to the line through a and b
+            proj = inner @ ab / norm
+            dists = np.sqrt(np.maximum(np.sum(inner**2, axis=1) - proj**2, 0))
+        i = np.argmax(dists)
+        if dists[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, stop))
+
+    return np.flatnonzero(keep)
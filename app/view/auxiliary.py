@@ -7,6 +7,48 @@ from bokeh.events import ButtonClick
 from bokeh.plotting import figure
 from bokeh.models import Span
 
+# Evaluates the distribution function in the browser while a spinner 
+# is being dragged. The model is updated only on value_throttled.
+DISTRIBUTION_PREVIEW_JS = """
+const p = {}
+for (const [name, spinner] of Object.entries(spinners)) {
+    p[name] = spinner.value
+}
+const functions = {
+    constant: (x) => p.value,
+    uniform: (x) => p.value,
+    linear: (x) => p.slope * x + p.intercept,
+    power: (x) => p.vertical_shift + p.scale_factor * Math.pow(x + p.horizontal_shift, p.exponent),
+    exponential: (x) => p.vertical_shift + p.scale_factor * Math.exp(p.growth_rate * (x - p.horizontal_shift)),
+    sigmoid: (x) => p.vertical_shift + p.scale_factor / (1 + Math.exp(-p.growth_rate * (x - p.horizontal_shift))),
+    sinusoidal: (x) => p.amplitude * Math.sin(p.frequency * x + p.phase),
+    gaussian: (x) => p.amplitude * Math.exp(-((x - p.mean) ** 2) / (2 * p.std ** 2)),
+    step: (x) => (p.start < x && x < p.end) ? p.max_value : p.min_value,
+}
+const f = functions[function_name]
+if (f === undefined) return
+const in_group = new Set(segment_ids)
+
+const graph_data = graph.data
+if (param_name in graph_data) {
+    const values = graph_data[param_name]
+    for (let i = 0; i < values.length; i++) {
+        if (in_group.has(graph_data.index[i])) {
+            values[i] = f(graph_data.distance[i])
+        }
+    }
+    graph.change.emit()
+}
+
+const {x, y, label} = distribution.data
+for (let i = 0; i < y.length; i++) {
+    if (in_group.has(Number(label[i]))) {
+        y[i] = f(x[i])
+    }
+}
+distribution.change.emit()
+"""
+
 class AuxiliaryMixin():
 
     def __init__(self):
@@ -128,6 +170,37 @@ class AuxiliaryMixin():
         self.figures['distribution'].add_layout(vspan)
         # self.figures['distribution'].y_range.start = 0
 
+    def add_distribution_preview(self, spinners, function_name, param_name, segment_ids):
+        """
+        Preview the distribution in the graph and the distribution plot
+        while the spinners are being changed.
+
+        Parameters
+        ----------
+        spinners : dict
+            The spinners of the distribution parameters by parameter name.
+        function_name : str
+            The name of the distribution function.
+        param_name : str
+            The name of the distributed parameter.
+        segment_ids : list
+            The indices of the segments in the group.
+        """
+        callback = self.pool.get(
+            'distribution_preview', CustomJS,
+            args=dict(
+                spinners={name: spinner.spinner for name, spinner in spinners.items()},
+                function_name=function_name,
+                param_name=param_name,
+                segment_ids=segment_ids,
+                graph=self.figures['graph'].renderers[0].node_renderer.data_source,
+                distribution=self.sources['distribution'],
+            ),
+            code=DISTRIBUTION_PREVIEW_JS
+        )
+        for spinner in spinners.values():
+            spinner.js_on_change('value', callback)
+
 
     # ==================================================================
     # Kinetics plots
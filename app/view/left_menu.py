@@ -23,6 +23,39 @@ from bokeh.plotting import figure
 from bokeh.events import ButtonClick
 from bokeh.models import CustomJS
 
+from handlers import handlers_enabled, UPLOAD_EXTENSIONS
+from trace_export import get_available_formats
+
+# Streams the selected file to the UploadHandler, which
+# writes it to disk chunk by chunk, and reports the progress
+UPLOAD_FILE_JS = """
+const input = document.createElement('input');
+input.type = 'file';
+input.accept = accept.join(',');
+input.onchange = () => {
+    const file = input.files[0];
+    if (!file) return;
+    const xhr = new XMLHttpRequest();
+    xhr.open('POST', '/upload?filename=' + encodeURIComponent(file.name) + '&key=' + key);
+    xhr.upload.onprogress = (e) => {
+        if (e.lengthComputable) {
+            status.text = `Uploading ${file.name}: ${Math.round(100 * e.loaded / e.total)}%`;
+        }
+    };
+    xhr.onload = () => {
+        if (xhr.status == 200) {
+            status.text = `Uploaded ${file.name}`;
+            result.value = JSON.stringify({token: JSON.parse(xhr.responseText).token, 
+                                           filename: file.name});
+        } else {
+            status.text = `Upload failed: ${xhr.statusText}`;
+        }
+    };
+    xhr.onerror = () => { status.text = 'Upload failed'; };
+    xhr.send(file);
+};
+input.click();
+"""
 
 
 class LeftMenuMixin():
@@ -124,9 +157,31 @@ class LeftMenuMixin():
         self.widgets.buttons['download_model'].on_event(ButtonClick, self.p.download_model_callback)
 
     # File import
-    # self.widgets.file_input['all'] = FileInput(accept='.swc, .asc, .mod', name='file', visible=True, width=242, disabled=False)
-    # self.widgets.file_input['all'].on_change('filename', self.p.import_file_callback)
-    # self.widgets.file_input['all'].on_change('value', self.p.import_file_callback)
+
+    def _create_upload_file_button(self):
+
+        self.DOM_elements['upload_status'] = Div(text='', align='center')
+
+        # Receives the reply of the UploadHandler
+        self.widgets.text['uploaded_file'] = TextInput(value='', visible=False)
+        self.widgets.text['uploaded_file'].on_change('value', self.p.upload_file_callback)
+
+        self.widgets.buttons['upload_file'] = Button(
+            label='Upload .swc or .mod file',
+            button_type='default',
+            width=242,
+            align='center',
+            disabled=not handlers_enabled(),
+        )
+        self.widgets.buttons['upload_file'].js_on_click(CustomJS(
+            args=dict(
+                status=self.DOM_elements['upload_status'],
+                result=self.widgets.text['uploaded_file'],
+                accept=UPLOAD_EXTENSIONS,
+                key=self.p.upload_key,
+            ), 
+            code=UPLOAD_FILE_JS
+        ))
 
     def _create_io_tab_panel(self):
 
@@ -147,6 +202,7 @@ class LeftMenuMixin():
         )
 
         if self.p.config['dev_tools']['allow_file_io']:
+            self._create_upload_file_button()
             self._create_file_name_text_input()
             self._create_export_model_button()
             self._create_download_model_button()
@@ -154,7 +210,9 @@ class LeftMenuMixin():
             export_layout = column(
                 [
                     Div(text='File Export', align='center', styles={'padding-top': '20px'}),
-                    # self.widgets.file_input['all'],
+                    self.widgets.buttons['upload_file'],
+                    self.DOM_elements['upload_status'],
+                    self.widgets.text['uploaded_file'],
                     self.widgets.text['file_name'],
                     self.widgets.buttons['export_model'],
                     self.widgets.buttons['download_model'],
@@ -198,6 +256,8 @@ class LeftMenuMixin():
             width=242, 
             align='center'
         )
+        self.widgets.sliders['d_lambda'].on_change('value', self.p.d_lambda_callback)
+        self.DOM_elements['segmentation_preview'] = Div(text='', align='center')
 
     def _create_set_segmentation_button(self):
         self.widgets.buttons['set_segmentation'] = Button(
@@ -224,7 +284,6 @@ class LeftMenuMixin():
             width=242,
             align='center'
         )
-        self.widgets.sliders['duration'].js_link('value', self.widgets.sliders['iclamp_duration'], 'end')
         self.widgets.sliders['duration'].on_change('value_throttled', self.p.voltage_callback_on_change)
 
 
@@ -283,6 +342,13 @@ class LeftMenuMixin():
         self.widgets.switches['run_on_interaction'].on_change('active', enable_run_button)
 
 
+    def _create_linear_preview_switch(self):
+        self.widgets.switches['linear_preview'] = Switch(
+            active=self.p.config['simulation']['linear_preview']
+        )
+        self.widgets.switches['linear_preview'].on_change('active', self.p.linear_preview_callback)
+
+
     def _create_run_button(self):
         
         self.DOM_elements['runtime'] = Div(text='', align='center')
@@ -302,6 +368,34 @@ class LeftMenuMixin():
         self.widgets.buttons['run'].on_event(ButtonClick, self.p.voltage_callback_on_click)
 
 
+    # Trace export
+
+    def _create_keep_runs_switch(self):
+        self.widgets.switches['keep_runs'] = Switch(active=False)
+        self.widgets.switches['keep_runs'].on_change('active', self.p.keep_runs_callback)
+
+
+    def _create_export_traces_controls(self):
+
+        self.widgets.selectors['export_format'] = Select(
+            options=get_available_formats(),
+            value='NPZ',
+            width=100,
+            align='center'
+        )
+
+        self.widgets.buttons['export_traces'] = Button(
+            label='Export traces',
+            button_type='default',
+            width=134,
+            align='end',
+            disabled=not handlers_enabled(),
+        )
+        self.widgets.buttons['export_traces'].on_event(ButtonClick, self.p.export_traces_callback)
+
+        self.DOM_elements['export_link'] = Div(text='', align='center')
+
+
     # Tab panel
 
     def _create_simulation_tab_panel(self):
@@ -313,12 +407,16 @@ class LeftMenuMixin():
         self._create_temperature_slider()
         self._create_v_init_slider()
         self._create_run_on_interaction_switch()
+        self._create_linear_preview_switch()
         self._create_run_button()
+        self._create_keep_runs_switch()
+        self._create_export_traces_controls()
         
         simulation_layout = column(
             [
                 Div(text='Segmentation', align='center', styles={'padding-top': '20px'}),
                 self.widgets.sliders['d_lambda'],
+                self.DOM_elements['segmentation_preview'],
                 self.widgets.buttons['set_segmentation'],
                 Div(text='Simulation parameters', align='center', styles={'padding-top': '20px'}),
                 self.widgets.sliders['duration'],
@@ -327,8 +425,14 @@ class LeftMenuMixin():
                 self.widgets.sliders['v_init'],
                 Div(text='Simulation controls', align='center', styles={'padding-top': '20px'}),
                 row(self.widgets.switches['run_on_interaction'], Div(text='Run on interaction'), align='center'),
+                row(self.widgets.switches['linear_preview'], Div(text='Linear preview'), align='center'),
                 self.widgets.buttons['run'],
                 self.DOM_elements['runtime'],
+                Div(text='Trace export', align='center', styles={'padding-top': '20px'}),
+                row(self.widgets.switches['keep_runs'], Div(text='Keep runs'), align='center'),
+                row(self.widgets.selectors['export_format'], 
+                    self.widgets.buttons['export_traces'], align='center'),
+                self.DOM_elements['export_link'],
             ],
             align='center',
             width=280,
@@ -38,10 +38,114 @@ DOMAINS_TO_COLORS = {
     'oblique': 'rosybrown'
 }
 
+# Tab panels of each right menu tab with their titles
+TAB_PANELS = {
+    'morphology': {
+        'sections': 'Sections',
+        'domains': 'Domains',
+        'reduction': 'Reduction',
+        'morphometric_analysis': 'Morphometric analysis',
+    },
+    'biophys': {
+        'membrane_mechanisms': 'Membrane mechanisms',
+        'segment_groups': 'Segment groups',
+        'parameters': 'Parameters',
+    },
+    'stimuli': {
+        'recordings': 'Recordings',
+        'iclamp': 'IClamps',
+        'synapses': 'Synapses',
+        'validation': 'Ephys analysis',
+    },
+}
+
+# Widgets, DOM elements, figures and sources created by each tab panel.
+# A panel is built when it is first shown or when any of them is first accessed.
+TAB_PANEL_CONTENTS = {
+    'sections': ['nseg', 'psection', 'sections_layout'],
+    'domains': ['domain', 'domain_color', 'domain_name', 'domain_type_idx', 'set_domain'],
+    'reduction': ['delete_subtree', 'reduce_subtree'],
+    'morphometric_analysis': ['stats'],
+    'membrane_mechanisms': ['add_default_mechanisms', 'domains', 'mechanism_to_insert', 
+                            'mechanisms', 'recompile'],
+    'segment_groups': ['add_group', 'condition_max', 'condition_min', 'group', 
+                       'group_domains', 'group_name', 'remove_group', 'select_by'],
+    'parameters': ['add_distribution', 'assigned_group', 'distribution', 'distribution_type', 
+                   'distribution_widgets_panel', 'group_panel', 'inf', 'inf_fit', 'inf_log', 
+                   'inf_orig', 'mechanism', 'param', 'param_panel', 'remove_distribution', 
+                   'show_kinetics', 'standardize', 'standardize_all', 
+                   'tau', 'tau_fit', 'tau_log', 'tau_orig'],
+    'recordings': ['record', 'record_from_all', 'recording_variable', 'remove_all'],
+    'iclamp': ['iclamp', 'iclamp_amp', 'iclamp_duration', 'remove_all_iclamps'],
+    'synapses': ['N_syn', 'add_population', 'population', 'population_name', 'population_panel', 
+                 'remove_all_populations', 'remove_population', 'syn_type', 'syn_placement',
+                 'syn_density_per', 'syn_density', 'syn_length_constant', 'syn_density_panel'],
+    'validation': ['clear_validation', 'protocol', 'protocol_max', 'protocol_min', 'protocol_n', 
+                   'protocol_widgets', 'run_protocol', 'stats_ephys', 'stats_ephys_extra'],
+}
+
+TAB_PANEL_BY_CONTENT = {name: panel_name 
+                        for panel_name, names in TAB_PANEL_CONTENTS.items() 
+                        for name in names}
+
 class RightMenuMixin():
 
     def __init__(self):
         super().__init__()
+        self._built_tab_panels = set()
+
+    # =================================================================
+    # LAZY TAB PANELS
+    # =================================================================
+
+    def _create_tabs(self, tabs_name, visible):
+        """
+        Create the tabs with empty tab panels, 
+        whose content is built on first use (see build_tab_panel).
+        """
+        for panel_name, title in TAB_PANELS[tabs_name].items():
+            self.widgets.tab_panels[panel_name] = TabPanel(
+                title=title,
+                child=column(),
+                name=panel_name,
+            )
+
+        self.widgets.tabs[tabs_name] = Tabs(
+            tabs=[self.widgets.tab_panels[panel_name] 
+                  for panel_name in TAB_PANELS[tabs_name]],
+            active=0,
+            visible=visible,
+        )
+        self.widgets.tabs[tabs_name].on_change('active', self.p.switch_tab_callback)
+
+    def build_tab_panel(self, panel_name):
+        """
+        Build the content of the tab panel if it is not built yet.
+        """
+        if panel_name in self._built_tab_panels:
+            return
+        self._built_tab_panels.add(panel_name)
+        figure_names = set(self.figures)
+        getattr(self, f'_create_{panel_name}_tab_panel')()
+        for name in set(self.figures) - figure_names:
+            self._adjust_figure(name, self.figures[name])
+
+    def _set_tab_panel_content(self, panel_name, layout):
+        # The tabs are not re-rendered when the child of a tab panel 
+        # is replaced, so the content is added to the existing child
+        self.widgets.tab_panels[panel_name].child.children = [layout]
+
+    def _build_tab_panel_with(self, name):
+        """
+        Build the tab panel that creates the widget, DOM element, 
+        figure or source with the given name. 
+        Returns False if there is no such panel left to build.
+        """
+        panel_name = TAB_PANEL_BY_CONTENT.get(name)
+        if panel_name is None or panel_name in self._built_tab_panels:
+            return False
+        self.build_tab_panel(panel_name)
+        return True
 
     # =================================================================
     # MORPHOLOGY 
@@ -91,10 +195,7 @@ class RightMenuMixin():
             self.DOM_elements['psection']
         )
 
-        self.widgets.tab_panels['sections'] = TabPanel(
-            title='Sections',
-            child= sections_layout,
-        )
+        self._set_tab_panel_content('sections', sections_layout)
 
     # -----------------------------------------------------------------
     # Domains tab
@@ -178,10 +279,7 @@ class RightMenuMixin():
                         self.widgets.buttons['set_domain']),
                 ])
 
-        self.widgets.tab_panels['domains'] = TabPanel(
-            title='Domains',
-            child=domains_panel,
-        )
+        self._set_tab_panel_content('domains', domains_panel)
 
     # -----------------------------------------------------------------
     # Morphology modification tab
@@ -213,10 +311,7 @@ class RightMenuMixin():
             ]
         )
 
-        self.widgets.tab_panels['reduction'] = TabPanel(
-            title='Reduction',
-            child=tree_modification_panel,
-        )
+        self._set_tab_panel_content('reduction', tree_modification_panel)
 
     # -----------------------------------------------------------------
     # Morphometric analysis tab
@@ -239,29 +334,11 @@ class RightMenuMixin():
             name='stats_panel'
         )
 
-        self.widgets.tab_panels['morphometric_analysis'] = TabPanel(
-            title='Morphometric analysis',
-            child=stats_panel,
-        )
+        self._set_tab_panel_content('morphometric_analysis', stats_panel)
         
 
     def _create_morphology_tabs(self):
-
-        self._create_sections_tab_panel()
-        self._create_domains_tab_panel()
-        self._create_reduction_tab_panel()
-        self._create_morphometric_analysis_tab_panel()
-        
-        self.widgets.tabs['morphology'] = Tabs(
-            tabs = [
-                self.widgets.tab_panels['sections'],
-                self.widgets.tab_panels['domains'],
-                self.widgets.tab_panels['reduction'],
-                self.widgets.tab_panels['morphometric_analysis']
-            ],
-            active = 0,
-        )
-        self.widgets.tabs['morphology'].on_change('active', self.p.switch_tab_callback)
+        self._create_tabs('morphology', visible=True)
 
     # =================================================================
     # BIOPHYSICS
@@ -334,10 +411,7 @@ class RightMenuMixin():
             self.widgets.multichoice['domains'],
         ])
 
-        self.widgets.tab_panels['membrane_mechanisms'] = TabPanel(
-            title='Membrane mechanisms',
-            child=mechanisms_panel,
-        )
+        self._set_tab_panel_content('membrane_mechanisms', mechanisms_panel)
 
     # -----------------------------------------------------------------
     # Segment groups tab
@@ -451,10 +525,7 @@ class RightMenuMixin():
             ], 
         )
 
-        self.widgets.tab_panels['segment_groups'] = TabPanel(
-            title='Segment groups',
-            child=groups_panel,
-        )
+        self._set_tab_panel_content('segment_groups', groups_panel)
 
     # -----------------------------------------------------------------
     # Parameters tab (Distribution and kinetics)
@@ -483,6 +554,17 @@ class RightMenuMixin():
         
         self.widgets.buttons['standardize'].on_event(ButtonClick, self.p.standardize_callback)
         self.widgets.buttons['standardize'].on_event(ButtonClick, self.p.voltage_callback_on_event)
+
+        self.widgets.buttons['standardize_all'] = Button(label='Standardize all',
+                                                        button_type='warning',
+                                                        width=120,
+                                                        styles={"padding-top":"20px"}
+                                                        )
+
+        self.add_message(self.widgets.buttons['standardize_all'], 'Standardizing all channels. Please wait...', callback_type='on_click')
+
+        self.widgets.buttons['standardize_all'].on_event(ButtonClick, self.p.standardize_all_callback)
+        self.widgets.buttons['standardize_all'].on_event(ButtonClick, self.p.voltage_callback_on_event)
         
     def _create_show_kinetics_switch(self):
 
@@ -619,6 +701,7 @@ class RightMenuMixin():
                     [
                         self.widgets.selectors['mechanism'], 
                         self.widgets.buttons['standardize'],
+                        self.widgets.buttons['standardize_all'],
                     ]
                 ),
                 row(
@@ -639,27 +722,10 @@ class RightMenuMixin():
             ]
         )
 
-        self.widgets.tab_panels['parameters'] = TabPanel(
-            title='Parameters', 
-            child=parameters_panel
-        )
+        self._set_tab_panel_content('parameters', parameters_panel)
 
     def _create_biophys_tabs(self):
-
-        self._create_membrane_mechanisms_tab_panel()
-        self._create_segment_groups_tab_panel()
-        self._create_parameters_tab_panel()
-        
-        self.widgets.tabs['biophys'] = Tabs(
-            tabs = [
-                self.widgets.tab_panels['membrane_mechanisms'],
-                self.widgets.tab_panels['segment_groups'],
-                self.widgets.tab_panels['parameters']
-            ],
-            active = 0,
-            visible=False,
-        )
-        self.widgets.tabs['biophys'].on_change('active', self.p.switch_tab_callback)
+        self._create_tabs('biophys', visible=False)
 
     # =================================================================
     # STIMULI
@@ -721,10 +787,7 @@ class RightMenuMixin():
             name='recordings_panel'
         )
 
-        self.widgets.tab_panels['recordings'] = TabPanel(
-            title='Recordings',
-            child=recordings_panel,
-        )
+        self._set_tab_panel_content('recordings', recordings_panel)
 
     # -----------------------------------------------------------------
     # Iclamps tab
@@ -738,7 +801,7 @@ class RightMenuMixin():
     def _create_iclamp_duration_slider(self):
         self.widgets.sliders['iclamp_duration'] = RangeSlider(
             start=0,
-            end=300,
+            end=self.widgets.sliders['duration'].value,
             value=(100,200),
             step=5,
             title="Duration, ms",
@@ -746,6 +809,7 @@ class RightMenuMixin():
         )
         self.widgets.sliders['iclamp_duration'].on_change('value_throttled', self.p.iclamp_duration_callback)
         self.widgets.sliders['iclamp_duration'].on_change('value_throttled', self.p.voltage_callback_on_change)
+        self.widgets.sliders['duration'].js_link('value', self.widgets.sliders['iclamp_duration'], 'end')
 
     def _create_iclamp_delay_slider(self):
         self.widgets.sliders['iclamp_amp'] = AdjustableSpinner(
@@ -784,10 +848,7 @@ class RightMenuMixin():
             name='iclamp_panel'
         )
 
-        self.widgets.tab_panels['iclamp'] = TabPanel(
-            title='IClamps',
-            child=iclamp_panel,
-        )
+        self._set_tab_panel_content('iclamp', iclamp_panel)
 
     # -----------------------------------------------------------------
     # Synapses tab
@@ -806,6 +867,38 @@ class RightMenuMixin():
         self.widgets.spinners['N_syn'] = NumericInput(value=1, title='Number of synapses', width=100)
 
 
+    def _create_syn_placement_widgets(self):
+        self.widgets.selectors['syn_placement'] = Select(
+            title='Place on',
+            value='selection',
+            options=[('selection', 'Selected segments')],
+            width=150
+        )
+        self.widgets.selectors['syn_density_per'] = Select(
+            title='Density per',
+            value='length',
+            options=[('length', 'µm'), ('area', 'µm²')],
+            width=75
+        )
+        self.widgets.spinners['syn_density'] = NumericInput(value=None, title='Density', width=75, mode='float')
+        self.widgets.spinners['syn_length_constant'] = NumericInput(value=None, title='Length constant, µm', 
+                                                                    width=150, mode='float')
+
+        self.DOM_elements['syn_density_panel'] = column([
+            Div(text='The synapses are placed on the segments of the group according to the density '
+                     '(scaled by exp(distance / length constant) if given). '
+                     'Without a density, the number of synapses is distributed by length or area.',
+                styles={'font-size': '12px'}),
+            row([self.widgets.selectors['syn_density_per'], 
+                 self.widgets.spinners['syn_density'],
+                 self.widgets.spinners['syn_length_constant']]),
+        ], visible=False)
+
+        def toggle_density_panel_callback(attr, old, new):
+            self.DOM_elements['syn_density_panel'].visible = new != 'selection'
+        self.widgets.selectors['syn_placement'].on_change('value', toggle_density_panel_callback)
+
+
     def _create_population_name_text_input(self):
         self.widgets.text['population_name'] = TextInput(value='', 
                                                         title='Population name', 
@@ -857,6 +950,7 @@ class RightMenuMixin():
         
         self._create_syn_type_selector()
         self._create_n_syn_spinner()
+        self._create_syn_placement_widgets()
         self._create_population_name_text_input()
         self._create_add_population_button()
         self._create_remove_all_populations_button()
@@ -867,9 +961,11 @@ class RightMenuMixin():
 
         synapses_panel = column([
             # self.widgets.buttons['remove_all_populations'],
-            Div(text='Add populations of "virtual" neurons that synapse onto the selected segments. You can use the lasso tool to select multiple segments in the graph.',
+            Div(text='Add populations of "virtual" neurons that synapse onto the selected segments or the segments of a group. You can use the lasso tool to select multiple segments in the graph.',
                 styles={'font-size': '12px'}),
             row([self.widgets.selectors['syn_type'], self.widgets.spinners['N_syn']]),
+            self.widgets.selectors['syn_placement'],
+            self.DOM_elements['syn_density_panel'],
             row([self.widgets.text['population_name'], self.widgets.buttons['add_population']]),
             Div(text='<hr style="width:30em">'),
             row([self.widgets.selectors['population'], self.widgets.buttons['remove_population']]),
@@ -877,10 +973,7 @@ class RightMenuMixin():
             self.widgets.buttons['remove_all_populations'],
         ])
 
-        self.widgets.tab_panels['synapses'] = TabPanel(
-            title='Synapses',
-            child=synapses_panel,
-        )
+        self._set_tab_panel_content('synapses', synapses_panel)
 
     # ------------------------------------------------------------------------------------
     # Validation tab panel
@@ -897,6 +990,7 @@ class RightMenuMixin():
                     'Voltage attenuation',
                     # 'Sag ratio',
                     'f-I curve',
+                    'Adaptive f-I curve',
                     'Dendritic nonlinearity',
                 ]
             )
@@ -986,30 +1080,12 @@ class RightMenuMixin():
             ],
         )
         
-        self.widgets.tab_panels['validation'] = TabPanel(
-            title='Ephys analysis',
-            child=validation_layout,
-        )
+        self._set_tab_panel_content('validation', validation_layout)
+        self.widgets.selectors['protocol'].value = 'Somatic spikes'
 
 
     def _create_stimuli_tabs(self):
-
-        self._create_recordings_tab_panel()
-        self._create_iclamp_tab_panel()
-        self._create_synapses_tab_panel()
-        self._create_validation_tab_panel()
-
-        self.widgets.tabs['stimuli'] = Tabs(
-            tabs = [
-                self.widgets.tab_panels['recordings'],
-                self.widgets.tab_panels['iclamp'],
-                self.widgets.tab_panels['synapses'],
-                self.widgets.tab_panels['validation'],
-            ],
-            active = 0,
-            visible=False,
-        )
-        self.widgets.tabs['stimuli'].on_change('active', self.p.switch_tab_callback)
+        self._create_tabs('stimuli', visible=False)
 
     def _create_radio_buttons(self):
 
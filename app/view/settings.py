@@ -9,7 +9,10 @@ from bokeh.models import ColumnDataSource
 from bokeh.models import MultiLine
 from bokeh.models import Patches
 from bokeh.models import ColorPicker
-from dendrotweaks import __version__ as VERSION
+from importlib.metadata import version
+
+# Read from the package metadata, not to import dendrotweaks with the view
+VERSION = version('dendrotweaks')
 
 class SettingsMixin():
 
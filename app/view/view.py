@@ -1,7 +1,6 @@
 # SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
 # SPDX-License-Identifier: MPL-2.0
 
-from collections import defaultdict
 
 from bokeh.models import ColumnDataSource, Select, Slider, Button
 
@@ -18,9 +17,12 @@ from bokeh.models import CustomJS
 from bokeh.io import curdoc
 
 import numpy as np
-from matplotlib.colors import LinearSegmentedColormap
 import colorcet as cc
 
+from bokeh_utils import ModelPool
+from impedance import IMPEDANCE_PARAMS
+from spike_features import SPIKE_PARAMS
+
 from view.left_menu import LeftMenuMixin
 from view.right_menu import RightMenuMixin
 from view.workspace import WorkspaceMixin
@@ -108,24 +110,48 @@ PARAMS = {
     'Geometry': ['diam', 'section_diam', 'area', 'distance', 'domain_distance'],
     'Stimuli': ['iclamps'],
     'Recordings': ['rec_v'],
-    'Synapses': []
+    'Synapses': [],
+    'Impedance': list(IMPEDANCE_PARAMS),
+    'Spikes': list(SPIKE_PARAMS),
 }
 
 
+class LazyDict(dict):
+    """
+    A dict whose missing items can be built on access.
+    The build function is called with the missing key and returns 
+    whether it built anything, otherwise the item is created with 
+    the default_factory as in a defaultdict, if any.
+    """
+
+    def __init__(self, default_factory=None):
+        super().__init__()
+        self.default_factory = default_factory
+        self.build = None
+
+    def __missing__(self, key):
+        if self.build is not None and self.build(key) and key in self:
+            return self[key]
+        if self.default_factory is None:
+            raise KeyError(key)
+        self[key] = self.default_factory()
+        return self[key]
+
+
 @dataclass
 class WidgetManager():
-    text: dict = field(default_factory=dict)
-    selectors: dict = field(default_factory=dict)
-    sliders: dict = field(default_factory=dict)
-    buttons: dict = field(default_factory=dict)
-    switches: dict = field(default_factory=dict)
-    spinners: defaultdict = field(default_factory=lambda: defaultdict(dict))
-    multichoice: defaultdict = field(default_factory=lambda: defaultdict(dict))
-    color_pickers: dict = field(default_factory=dict)
+    text: dict = field(default_factory=LazyDict)
+    selectors: dict = field(default_factory=LazyDict)
+    sliders: dict = field(default_factory=LazyDict)
+    buttons: dict = field(default_factory=LazyDict)
+    switches: dict = field(default_factory=LazyDict)
+    spinners: dict = field(default_factory=lambda: LazyDict(dict))
+    multichoice: dict = field(default_factory=lambda: LazyDict(dict))
+    color_pickers: dict = field(default_factory=LazyDict)
     tabs: dict = field(default_factory=dict)
     tab_panels: dict = field(default_factory=dict)
-    numeric: dict = field(default_factory=dict)
-    file_input: dict = field(default_factory=dict)
+    numeric: dict = field(default_factory=LazyDict)
+    file_input: dict = field(default_factory=LazyDict)
 
 
 
@@ -135,16 +161,20 @@ class CellView(LeftMenuMixin, WorkspaceMixin, RightMenuMixin, SettingsMixin, Aux
         super().__init__()
         self._presenter = None
         self.theme = THEMES[theme]
-        self.figures = {}
-        self.sources = {}
+        self.figures = LazyDict()
+        self.sources = LazyDict()
         self.renderers = {}
         self.widgets = WidgetManager()
-        self.DOM_elements = {}
+        self.DOM_elements = LazyDict()
+        # Reused models of the panels and glyphs rebuilt on selection
+        self.pool = ModelPool()
+        # The right menu tab panels are built on first access
+        for items in [self.figures, self.sources, self.DOM_elements, *vars(self.widgets).values()]:
+            if isinstance(items, LazyDict):
+                items.build = self._build_tab_panel_with
         self.layout_elements = {}
         self.params = PARAMS
         self._add_theme_callbacks()
-        self._file_content = None
-        self._filename = None
         self.recordings_color_mapper = None
 
     @property
@@ -163,6 +193,21 @@ class CellView(LeftMenuMixin, WorkspaceMixin, RightMenuMixin, SettingsMixin, Aux
             widget.js_on_click(callback)
 
 
+    def _adjust_figure(self, name, fig):
+
+        fig.toolbar.logo = None
+        fig.border_fill_color = None
+        # The raster of large populations has too many glyphs for SVG
+        fig.output_backend = "webgl" if name == 'spikes' else "svg"
+
+        if name in ['cell', 'graph']:
+            fig.grid.visible = False
+            fig.axis.visible = False
+            fig.outline_line_color = None
+
+        if fig.background_fill_color is not None:
+            fig.background_fill_color = self.theme.background_fill_color
+
     def set_theme(self, theme_name):
         self.theme = THEMES[theme_name]
         
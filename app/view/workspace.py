@@ -10,17 +10,51 @@ from bokeh.transform import CategoricalColorMapper
 from bokeh.models import Tabs, TabPanel
 from bokeh.models import Div
 from bokeh.models import Button
-from bokeh.events import ButtonClick
+from bokeh.events import ButtonClick, RangesUpdate
 from bokeh.models import HoverTool
-from bokeh.models import Spinner
+from bokeh.models import Spinner, NumericInput
 from bokeh.models import ColorBar
 from bokeh.transform import linear_cmap
 from bokeh.palettes import Viridis256
 from bokeh.models import LinearColorMapper
 from bokeh.models import Switch
 from bokeh.models import Span
+from bokeh.models import CustomJSTransform
 import colorcet as cc
 
+# Rotation of the morphology around the Y axis at the soma center.
+# The point coordinates are stored as flat arrays in the `cell_points` source, 
+# each row of the `cell` source holds the offsets of a section in these arrays.
+ROTATE_XS_JS = """
+const {x, z} = points.data
+const {stop} = cell.data
+const theta = (slider.value - rotation.data.angle[0]) * Math.PI / 180
+const cos = Math.cos(theta)
+const sin = Math.sin(theta)
+const cx = rotation.data.cx[0]
+const cz = rotation.data.cz[0]
+const result = new Array(xs.length)
+for (let i = 0; i < xs.length; i++) {
+    const line = new Float64Array(stop[i] - xs[i])
+    for (let j = 0; j < line.length; j++) {
+        const k = xs[i] + j
+        line[j] = cx + (x[k] - cx) * cos + (z[k] - cz) * sin
+    }
+    result[i] = line
+}
+return result
+"""
+
+SLICE_YS_JS = """
+const {y} = points.data
+const {stop} = cell.data
+const result = new Array(xs.length)
+for (let i = 0; i < xs.length; i++) {
+    result[i] = y.slice(xs[i], stop[i])
+}
+return result
+"""
+
 class WorkspaceMixin():
 
 
@@ -41,12 +75,31 @@ class WorkspaceMixin():
             tools='pan, box_zoom,reset, tap, wheel_zoom, save'
         )
         # self.figures['cell'].toolbar.active_scroll = self.figures['cell'].select_one(WheelZoomTool)
-        self.sources['cell'] = ColumnDataSource(data={'xs': [], 'ys': [], 'line_color': [], 'line_width': [], 'label': [], 'line_alpha': []})
+        self.sources['cell'] = ColumnDataSource(data={'start': [], 'stop': [], 'line_color': [], 'line_width': [], 'label': [], 'line_alpha': []})
+        self.sources['cell_points'] = ColumnDataSource(data={'x': [], 'y': [], 'z': []})
+        self.sources['cell_rotation'] = ColumnDataSource(data={'angle': [0], 'cx': [0], 'cz': [0]})
         self.sources['soma'] = ColumnDataSource(data={'x': [], 'y': [], 'rad': [], 'color': []})
+
+        transform_args = dict(
+            points=self.sources['cell_points'],
+            cell=self.sources['cell'],
+            rotation=self.sources['cell_rotation'],
+            slider=self.widgets.sliders['rotate_cell']
+        )
+        xs = {'field': 'start', 'transform': CustomJSTransform(args=transform_args, v_func=ROTATE_XS_JS)}
+        ys = {'field': 'start', 'transform': CustomJSTransform(args=transform_args, v_func=SLICE_YS_JS)}
+
+        # Re-evaluate the transforms in the browser on rotation, the model 
+        # point tree is rotated only when needed (see CellMixin._apply_cell_rotation)
+        self.widgets.sliders['rotate_cell'].js_on_change('value', CustomJS(
+            args=dict(cell=self.sources['cell']), 
+            code="cell.change.emit()"
+        ))
+
         color_mapper = CategoricalColorMapper(palette=['#E69F00', '#F0E442', '#019E73', '#0072B2'], factors=['soma', 'axon', 'dend', 'apic'])
         glyph = MultiLine(
-            xs='xs', 
-            ys='ys', 
+            xs=xs, 
+            ys=ys, 
             line_color='line_color', 
             line_width='line_width', 
             line_alpha=.7
@@ -54,11 +107,14 @@ class WorkspaceMixin():
         self.figures['cell'].add_glyph(self.sources['cell'], glyph)
 
         # change nonselection glyph alpha
-        self.figures['cell'].renderers[0].selection_glyph = MultiLine(line_alpha=0.8, line_width='line_width', line_color='line_color')
-        self.figures['cell'].renderers[0].nonselection_glyph = MultiLine(line_alpha=0.3, line_width='line_width', line_color='line_color')
+        self.figures['cell'].renderers[0].selection_glyph = MultiLine(xs=xs, ys=ys, line_alpha=0.8, line_width='line_width', line_color='line_color')
+        self.figures['cell'].renderers[0].nonselection_glyph = MultiLine(xs=xs, ys=ys, line_alpha=0.3, line_width='line_width', line_color='line_color')
 
         self.figures['cell'].circle(x='x', y='y', radius='rad', color='color', source=self.sources['soma'], alpha=0.9)
 
+        # Fetch finer or coarser points depending on the zoom level
+        self.figures['cell'].on_event(RangesUpdate, self.p.cell_ranges_callback)
+
 
     def _create_rotate_cell_slider(self):
 
@@ -70,7 +126,6 @@ class WorkspaceMixin():
             title="Rotate", 
             width=370, 
         )
-        self.widgets.sliders['rotate_cell'].on_change('value', self.p.rotate_cell_renderer_callback)
 
     ## Selectors
     def _create_section_selector(self):
@@ -119,8 +174,8 @@ class WorkspaceMixin():
 
     def create_cell_panel(self):
 
-        self._create_cell_figure()
         self._create_rotate_cell_slider()
+        self._create_cell_figure()
         self._create_section_selector()
         self._create_seg_x_selector()
         navigation = self._create_navigation_panel()
@@ -210,6 +265,17 @@ class WorkspaceMixin():
         )
         self.widgets.sliders['graph_param_high'].on_change('value_throttled', self.p.colormap_max_callback)
 
+    def _create_impedance_freq_input(self):
+        self.widgets.numeric['impedance_freq'] = NumericInput(
+            title='Frequency, Hz',
+            value=100,
+            low=0,
+            width=100,
+            mode='float',
+            visible=False
+        )
+        self.widgets.numeric['impedance_freq'].on_change('value', self.p.impedance_freq_callback)
+
     def _create_time_slice_spinner(self):
         self.widgets.sliders['time_slice'] = Spinner(title="Time slice", low=0, high=1000, step=0.1, value=100, width=100, visible=False)
         self.widgets.sliders['time_slice'].on_change('value_throttled', self.p.update_time_slice_callback)
@@ -233,6 +299,7 @@ class WorkspaceMixin():
         self._create_graph_figure()
         self._create_graph_param_selector()
         self._create_time_slice_spinner()
+        self._create_impedance_freq_input()
         self._create_update_graph_button()
 
         # Add the graph to the panel
@@ -244,6 +311,7 @@ class WorkspaceMixin():
                         self.widgets.selectors['graph_param'], 
                         self.widgets.sliders['graph_param_high'],
                         self.widgets.sliders['time_slice'],
+                        self.widgets.numeric['impedance_freq'],
                         self.widgets.buttons['update_graph']
                     ]
                 ),
@@ -383,31 +451,59 @@ class WorkspaceMixin():
 
     def _create_spike_times_figure(self):
 
-        from bokeh.models import FactorRange
+        from bokeh.models import FixedTicker
 
         self.figures['spikes'] = figure(height=250, 
                         width=1100,
                         x_axis_label='Time (ms)',
                         x_range=(0, 300),
                         y_axis_label='Synapses',
-                        y_range=FactorRange(factors=[]),
+                        y_range=(-0.5, 0.5),
                         tools="pan, box_zoom, reset, save")
 
         self.figures['spikes'].toolbar.logo = None
         self.figures['spikes'].grid.grid_line_alpha = 0.1
         self.figures['spikes'].ygrid.visible = False
+        # The ticks are the synapses or, for many synapses, the populations
+        self.figures['spikes'].yaxis.ticker = FixedTicker(ticks=[])
 
-        self.sources['spikes'] = ColumnDataSource(data={'x': [], 'y': [], 'color': []})
-
-
-        self.figures['spikes'].circle(x='x', y='y', color='color', source=self.sources['spikes'])
+        # One row per spike: the time, the row of the synapse 
+        # and whether the synapse is inhibitory
+        self.sources['spikes'] = ColumnDataSource(data={'x': [], 'y': [], 'inhibitory': []})
 
+        self.figures['spikes'].circle(x='x', y='y', source=self.sources['spikes'],
+                                      color=linear_cmap('inhibitory', ['orange', 'blue'], 0, 1))
 
         # self.renderers['span_t'] = Span(location=100, dimension='height', line_color='red', line_width=1)
         # self.figures['spikes'].add_layout(self.renderers['span_v'])
 
         self.figures['sim'].x_range = self.figures['spikes'].x_range = self.figures['curr'].x_range
 
+    def _create_psth_figure(self):
+
+        self.figures['psth'] = figure(height=150, 
+                        width=1100,
+                        x_axis_label='Time (ms)',
+                        y_axis_label='Rate (Hz)',
+                        tools="pan, box_zoom, reset, save",
+                        visible=False)
+
+        self.figures['psth'].toolbar.logo = None
+        self.figures['psth'].grid.grid_line_alpha = 0.1
+
+        self.sources['psth'] = ColumnDataSource(data={'xs': [], 'ys': [], 'color': [], 'label': []})
+        self.figures['psth'].multi_line(xs='xs', ys='ys', line_color='color', 
+                                        legend_field='label', source=self.sources['psth'])
+        self.figures['psth'].legend.location = 'top_right'
+        self.figures['psth'].legend.background_fill_alpha = 0
+
+        self.figures['psth'].x_range = self.figures['curr'].x_range
+
+    def _create_psth_switch(self):
+
+        self.widgets.switches['psth'] = Switch(active=False)
+        self.widgets.switches['psth'].on_change('active', self.p.psth_callback)
+
 
     def _create_voltage_tab_panel(self):
 
@@ -452,11 +548,14 @@ class WorkspaceMixin():
     def _create_spike_times_tab_panel(self):
         
         self._create_spike_times_figure()
+        self._create_psth_figure()
+        self._create_psth_switch()
 
         spike_times_layout = column(
             self.figures['spikes'], 
+            row([self.widgets.switches['psth'], Div(text='PSTH of large populations')]),
+            self.figures['psth'],
             width=1100, 
-            height=250, 
         )
 
         self.widgets.tab_panels['spike_times'] = TabPanel(
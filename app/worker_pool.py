@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Pool of pre-warmed simulation worker processes.
+
+The workers are forked from a fork server that has already imported
+NEURON and dendrotweaks and loaded the default mechanisms (see 
+worker_preload.py), so that a session gets a ready worker without
+paying for the imports and the loading. A worker is
+dedicated to one session and is terminated when the session is
+released, as its NEURON state cannot be reset reliably. The number of 
+worker processes, idle and acquired, is capped at max_workers, and no
+worker is handed out past the cap.
+"""
+
+import threading
+import multiprocessing
+
+from logger import logger
+
+import neuron_worker
+
+# A fork server is used instead of fork, so that the workers
+# do not inherit the NEURON sections of the running sessions
+START_METHOD = 'forkserver'
+PRELOAD = ['worker_preload']
+
+
+class Worker():
+    """
+    Handle of a worker process, used by a session
+    to talk to the process over a pipe.
+    """
+
+    def __init__(self, context):
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=neuron_worker.serve,
+                                       args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def call(self, command, *args):
+        """
+        Send a command to the worker and wait for the result.
+        Safe to call from multiple threads, the calls are serialized.
+        """
+        with self._lock:
+            try:
+                self._conn.send((command, args))
+                status, result = self._conn.recv()
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f'Worker {self.pid} is not responding: {e}')
+        if status == 'error':
+            raise RuntimeError(f'Worker {self.pid} failed:\n{result}')
+        return result
+
+    def close(self):
+        try:
+            with self._lock:
+                self._conn.send(('close', ()))
+        except (EOFError, OSError):
+            pass
+        self._conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class WorkerPool():
+    """
+    Keeps a number of idle workers ready to be handed to new sessions,
+    without exceeding max_workers processes in total (0 for no limit).
+    """
+
+    def __init__(self, size, max_workers=0):
+        self.size = size
+        self.max_workers = max_workers
+        self._context = multiprocessing.get_context(START_METHOD)
+        self._context.set_forkserver_preload(PRELOAD)
+        self._idle = []
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def _has_room(self):
+        return not self.max_workers or len(self._idle) + len(self._active) < self.max_workers
+
+    def fill(self):
+        with self._lock:
+            self._idle = [worker for worker in self._idle if worker.is_alive()]
+            while len(self._idle) < self.size and self._has_room():
+                self._idle.append(Worker(self._context))
+        logger.info(f'Worker pool: {len(self._idle)} idle, {len(self._active)} active workers')
+
+    def acquire(self):
+        """
+        Take an idle worker (or start a new one if none is ready)
+        and refill the pool in the background.
+
+        Returns
+        -------
+        Worker or None
+            The worker, or None if max_workers are already in use.
+        """
+        with self._lock:
+            worker = None
+            while self._idle and worker is None:
+                candidate = self._idle.pop()
+                if candidate.is_alive():
+                    worker = candidate
+            if worker is None:
+                if not self._has_room():
+                    logger.warning(f'All {self.max_workers} workers are in use')
+                    return None
+                worker = Worker(self._context)
+            self._active.add(worker)
+        threading.Thread(target=self.fill, daemon=True).start()
+        logger.info(f'Acquired worker {worker.pid}')
+        return worker
+
+    def release(self, worker):
+        logger.info(f'Releasing worker {worker.pid}')
+        with self._lock:
+            self._active.discard(worker)
+        worker.close()
+
+    def close(self):
+        with self._lock:
+            for worker in self._idle:
+                worker.close()
+            self._idle = []
+
+
+_pool = None
+
+def get_pool(size=None, max_workers=0):
+    """
+    Returns the pool of this server process, created on first call.
+    """
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(size or 1, max_workers)
+        _pool.fill()
+    return _pool
@@ -0,0 +1,37 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Preloaded by the fork server of the simulation workers (see worker_pool.py).
+
+Imports NEURON and dendrotweaks and loads the default mechanisms, shared by
+all the models, once in the fork server, so that every worker forked from
+it starts with them. Like neuron_worker.py, this module must not import
+the app logger.
+"""
+
+import os
+
+from dendrotweaks.biophys.io import MODFileLoader
+
+import neuron_worker
+from config import load_config
+
+
+def load_default_mechanisms(path_to_data):
+    """
+    Load the MOD files of the Default folder of the data
+    and return the loader, which skips them when loaded again.
+    """
+    mod_loader = MODFileLoader()
+    path_to_default = os.path.join(path_to_data, 'Default')
+    if os.path.isdir(path_to_default):
+        for file_name in sorted(os.listdir(path_to_default)):
+            if file_name.endswith('.mod'):
+                mod_loader.load_mechanism(os.path.join(path_to_default, file_name),
+                                          recompile=False)
+    return mod_loader
+
+
+neuron_worker.DEFAULT_MOD_LOADER = load_default_mechanisms(
+    load_config()['data']['path_to_data'])
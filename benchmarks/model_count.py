@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Reports the growth of the document models of a session.
+
+Loads an example model, then repeats the selections that rebuild the
+dynamic panels and color mappers (populations, distributions, graph
+parameters and recorded traces), and reports how many models the
+document gains and how many new models are created, i.e. sent to the
+browser, per round. Fails if either is above the limit after the first
+round, which creates the reused models.
+
+    python benchmarks/model_count.py [--model Toy] [--rounds 10] [--max-new-models 0]
+"""
+
+import os
+import sys
+import runpy
+import argparse
+import logging
+
+PATH_TO_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_session(model_name):
+    os.chdir(PATH_TO_REPO)
+    sys.path.insert(0, os.path.join(PATH_TO_REPO, 'app'))
+    from bokeh.document import Document
+    from bokeh.io.doc import set_curdoc
+
+    doc = Document()
+    set_curdoc(doc)
+    namespace = runpy.run_path('app/main.py', run_name='bokeh_app')
+    logging.disable(logging.CRITICAL)
+    p, view = namespace['p'], namespace['view']
+
+    selectors = view.widgets.selectors
+    # Does not require graphviz
+    selectors['graph_layout'].value = 'kamada-kawai'
+    selectors['model'].value = model_name
+    selectors['morphology'].value = p.model.list_morphologies()[0]
+    for name, options in [('biophys', p.model.list_biophys()),
+                          ('stimuli', p.model.list_stimuli())]:
+        if options:
+            selectors[name].value = options[0]
+    return doc, p, view
+
+
+def select_all(p, view):
+    """
+    One round of the selections that rebuild panels and color mappers.
+    """
+    widgets = view.widgets
+    graph_params = [param for params in widgets.selectors['graph_param'].options.values()
+                    for param in params]
+    for population in widgets.selectors['population'].options:
+        widgets.selectors['population'].value = population
+    p._toggle_distribution_widgets(p.selected_param_name)
+    for param in graph_params:
+        widgets.selectors['graph_param'].value = param
+    p._update_traces_renderers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', default='Toy')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--max-new-models', type=int, default=0)
+    args = parser.parse_args()
+
+    doc, p, view = create_session(args.model)
+
+    # Show the panels so that they are built and refreshed
+    view.widgets.buttons['switch_right_menu'].active = 2
+    view.widgets.tabs['stimuli'].active = 2
+    view.widgets.buttons['switch_right_menu'].active = 1
+    view.widgets.tabs['biophys'].active = 2
+
+    select_all(p, view)
+    n_models = len(doc.models)
+    ids = {model.id for model in doc.models}
+    for _ in range(args.rounds):
+        select_all(p, view)
+    growth = len(doc.models) - n_models
+    new_models = len({model.id for model in doc.models} - ids)
+
+    print(f'Document models: {n_models}')
+    print(f'Growth per round: {growth / args.rounds:.1f}')
+    print(f'New models per round: {new_models / args.rounds:.1f}')
+
+    if max(growth, new_models) > args.max_new_models * args.rounds:
+        print(f'FAILED: over {args.max_new_models} new models per round')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Guards the time to first render of the app.
+
+Builds the Bokeh document of main.py in a fresh interpreter, as a new
+server process does for its first session, then once more as for any
+later session, and fails if either build exceeds its budget or if a
+module that should be imported lazily was loaded.
+
+    python benchmarks/startup.py [--first-session-s 4] [--next-session-s 1]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+PATH_TO_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported only when needed (standardizing channels, graphviz layouts)
+LAZY_MODULES = ['symfit', 'sympy', 'pygraphviz']
+
+MEASURE = """
+import os, sys, time, json, runpy
+t0 = time.perf_counter()
+os.chdir({repo!r})
+sys.path.insert(0, os.path.join({repo!r}, 'app'))
+from bokeh.document import Document
+from bokeh.io.doc import set_curdoc
+times = []
+for _ in range(2):
+    start = time.perf_counter()
+    doc = Document()
+    set_curdoc(doc)
+    runpy.run_path('app/main.py', run_name='bokeh_app')
+    times.append(time.perf_counter() - start)
+print(json.dumps({{
+    'first_session_s': time.perf_counter() - t0 - times[1],
+    'next_session_s': times[1],
+    'n_models': len(doc.models),
+    'lazy_loaded': [m for m in {lazy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure():
+    code = MEASURE.format(repo=PATH_TO_REPO, lazy=LAZY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--first-session-s', type=float, default=4.0)
+    parser.add_argument('--next-session-s', type=float, default=1.0)
+    args = parser.parse_args()
+
+    stats = measure()
+    print(f"First session (imports included): {stats['first_session_s']:.2f} s")
+    print(f"Next session: {stats['next_session_s']:.2f} s")
+    print(f"Document models: {stats['n_models']}")
+
+    errors = []
+    if stats['first_session_s'] > args.first_session_s:
+        errors.append(f'first session over {args.first_session_s} s')
+    if stats['next_session_s'] > args.next_session_s:
+        errors.append(f'next session over {args.next_session_s} s')
+    if stats['lazy_loaded']:
+        errors.append(f"loaded at startup: {', '.join(stats['lazy_loaded'])}")
+    if errors:
+        print('FAILED: ' + '; '.join(errors))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+The modules of the app import each other as top-level modules,
+as when the app is served from the app folder (see serve.py).
+"""
+
+import os
+import sys
+
+PATH_TO_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(PATH_TO_REPO, 'app'))
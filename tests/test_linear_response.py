@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from linear_response import LinearResponse, _next_pow2
+
+DT = 0.1
+T = np.arange(0, 100, DT)
+TAU = 10
+RESISTANCE = 50
+V_REST = -70
+
+
+def create_response(step_response):
+    """
+    Responses of one clamp, measured as a step response, 
+    as sent from a worker (see LinearResponse.to_dict).
+    """
+    n_fft = _next_pow2(2 * len(T))
+    impulse_response = np.diff(step_response, axis=1, prepend=0)
+    data = {
+        'stimulus_segments': [0],
+        'recorded_segments': [0],
+        'dt': DT,
+        't': T,
+        'v0': np.full((1, len(T)), V_REST, dtype=float),
+        'n_fft': n_fft,
+        'responses': np.fft.rfft(impulse_response, n=n_fft, axis=1)[None],
+    }
+    return LinearResponse.from_dict(data, segments=['soma'])
+
+
+def create_model(amp, delay, dur):
+    return SimpleNamespace(iclamps={'soma': SimpleNamespace(amp=amp, delay=delay, dur=dur)})
+
+
+def test_next_pow2():
+    assert [_next_pow2(n) for n in [1, 2, 3, 1000, 1024, 1025]] == [1, 2, 4, 1024, 1024, 2048]
+
+
+def test_get_currents():
+    response = create_response(np.zeros((1, len(T))))
+    currents = response.get_currents(create_model(0.2, 10, 5))
+    assert currents.shape == (1, len(T))
+    assert np.isclose(currents.sum() * DT, 0.2 * 5)
+    assert currents[0, int(round(10 / DT)) - 1] == 0
+    assert currents[0, int(round(10 / DT))] == 0.2
+
+
+def test_predict_pulse_from_step_response():
+    # The response to a pulse is the step response minus the step response delayed by the duration
+    step_response = RESISTANCE * (1 - np.exp(-T / TAU))[None]
+    response = create_response(step_response)
+    amp, delay, dur = 0.1, 20, 30
+    v = response.predict(create_model(amp, delay, dur))
+
+    start, stop = int(round(delay / DT)), int(round((delay + dur) / DT))
+    expected = np.zeros(len(T))
+    expected[start:] += step_response[0, :len(T) - start]
+    expected[stop:] -= step_response[0, :len(T) - stop]
+    assert v.shape == (1, len(T))
+    assert np.allclose(v[0], V_REST + amp * expected, atol=1e-9)
+
+
+def test_predict_is_linear():
+    step_response = RESISTANCE * (1 - np.exp(-T / TAU))[None]
+    response = create_response(step_response)
+    v1 = response.predict(create_model(0.1, 10, 20)) - V_REST
+    v2 = response.predict(create_model(-0.3, 10, 20)) - V_REST
+    assert np.allclose(v2, -3 * v1, atol=1e-9)
@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+import numpy as np
+
+from spike_features import extract_spike_features
+
+DT = 0.025
+T = np.arange(0, 50, DT)
+REST = -70
+
+
+def gaussian_spike(peak_time, amplitude=100, sigma=0.5):
+    return REST + amplitude * np.exp(-(T - peak_time)**2 / (2 * sigma**2))
+
+
+def test_counts_spikes():
+    v = REST + np.zeros_like(T)
+    for peak_time in [10, 20, 30]:
+        v = v + gaussian_spike(peak_time) - REST
+    features = extract_spike_features(T, [v, REST + np.zeros_like(T)])
+    assert features['n_spikes'].tolist() == [3, 0]
+    # Interpolated upward crossings of the threshold, before each peak
+    assert np.all(np.diff(features['spike_times'][0]) > 0)
+    assert np.allclose(features['spike_times'][0], [10, 20, 30], atol=1)
+    assert len(features['spike_times'][1]) == 0
+
+
+def test_half_width_is_interpolated():
+    sigma = 0.5
+    features = extract_spike_features(T, [gaussian_spike(10, sigma=sigma)])
+    fwhm = 2 * np.sqrt(2 * np.log(2)) * sigma
+    # Within a fraction of the time step
+    assert abs(features['bAP_half_width'][0] - fwhm) < DT / 4
+    # From the baseline 1 ms before the crossing, on the rise of the spike
+    assert np.isclose(features['bAP_amplitude'][0], 100, atol=1)
+
+
+def test_latency_relative_to_reference():
+    v = np.array([gaussian_spike(10), gaussian_spike(11.5, amplitude=60)])
+    features = extract_spike_features(T, v, ref_idx=0)
+    assert np.allclose(features['bAP_latency'], [0, 1.5], atol=DT)
+    assert features['bAP_amplitude'][1] < features['bAP_amplitude'][0]
+
+
+def test_reference_defaults_to_first_crossing():
+    v = np.array([gaussian_spike(12), gaussian_spike(10)])
+    features = extract_spike_features(T, v)
+    assert np.isclose(features['bAP_latency'][1], 0)
+    assert features['bAP_latency'][0] > 0
+
+
+def test_no_spikes():
+    features = extract_spike_features(T, [REST + np.zeros_like(T)] * 2)
+    assert features['n_spikes'].tolist() == [0, 0]
+    for name in ['bAP_amplitude', 'bAP_latency', 'bAP_half_width']:
+        assert np.all(np.isnan(features[name]))
@@ -0,0 +1,89 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+import sys
+import types
+from types import SimpleNamespace
+
+import numpy as np
+
+from spike_trains import generate_spike_trains, load_spike_trains
+
+
+def split_trains(times, counts):
+    return np.split(times, np.cumsum(counts)[:-1])
+
+
+def test_poisson_rate():
+    N, rate, duration, delay = 2000, 20, 500, 100
+    times, counts = generate_spike_trains(N, rate=rate, noise=1, 
+                                          duration=duration, delay=delay, seed=0)
+    assert counts.shape == (N,)
+    assert counts.sum() == len(times)
+    expected = rate * duration / 1000
+    # The mean and the variance of a Poisson count are both the rate times the duration
+    assert abs(counts.mean() - expected) < 4 * np.sqrt(expected / N)
+    assert abs(counts.var() / expected - 1) < 0.15
+    assert times.min() >= delay and times.max() <= delay + duration
+    for train in split_trains(times, counts):
+        assert np.all(np.diff(train) >= 0)
+
+
+def test_regular_trains():
+    times, counts = generate_spike_trains(5, rate=50, noise=0, duration=100, seed=0)
+    assert counts.tolist() == [5] * 5
+    for train in split_trains(times, counts):
+        assert np.allclose(np.diff(train), 1000 / 50)
+
+
+def test_seed():
+    first = generate_spike_trains(10, rate=10, seed=1)
+    second = generate_spike_trains(10, rate=10, seed=1)
+    assert np.array_equal(first[0], second[0])
+    assert np.array_equal(first[1], second[1])
+
+
+def test_no_trains():
+    times, counts = generate_spike_trains(3, rate=0)
+    assert len(times) == 0
+    assert counts.tolist() == [0, 0, 0]
+
+
+class Vector(list):
+    """
+    The methods of NEURON's Vector used by load_spike_trains.
+    """
+
+    def resize(self, n):
+        del self[n:]
+        self.extend([0.0] * (n - len(self)))
+
+    def copy(self, source, start, end):
+        # Copies source[start:end + 1] to the start of the vector
+        self[:end + 1 - start] = source[start:end + 1]
+
+
+class VecStim():
+
+    def play(self, vector):
+        self.vector = vector
+
+
+def test_load_spike_trains(monkeypatch):
+    h = SimpleNamespace(Vector=lambda values=(): Vector(values), VecStim=VecStim)
+    monkeypatch.setitem(sys.modules, 'neuron', types.SimpleNamespace(h=h))
+
+    synapses = [SimpleNamespace(_ref_stim=None, _ref_con=None, create_con=lambda **kwargs: None)
+                for _ in range(4)]
+    # The vector of a reused stimulus is longer than its new train
+    synapses[2]._ref_stim = [None, Vector([1.0] * 10)]
+    population = SimpleNamespace(flat_synapses=synapses, 
+                                 input_params={'weight': 1, 'delay': 0})
+    # A synapse without spikes between two with spikes
+    trains = [np.array([5.0, 12.5]), np.array([]), np.array([3.0]), np.array([1.0, 2.0, 4.0])]
+    times = np.concatenate(trains)
+    counts = np.array([len(train) for train in trains])
+
+    load_spike_trains(population, times, counts)
+    for syn, train in zip(synapses, split_trains(times, counts)):
+        assert syn._ref_stim[1] == train.tolist()
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip('dendrotweaks')
+
+from synapse_placement import calculate_expected_counts, exponential_density, place_synapses
+
+
+def create_segments(nsegs):
+    """
+    Segments of sections with the given number of segments,
+    with the sections in reverse order of their idx.
+    """
+    segments = []
+    for i, nseg in enumerate(nsegs):
+        sec = SimpleNamespace(idx=len(nsegs) - 1 - i, _ref=SimpleNamespace(nseg=nseg))
+        segments += [SimpleNamespace(_section=sec, x=(j + 0.5) / nseg) for j in range(nseg)]
+    return segments
+
+
+def test_expected_counts():
+    measures = np.array([10, 20, 30])
+    distances = np.array([0, 100, 200])
+    assert np.allclose(calculate_expected_counts(measures, distances, 0.5), [5, 10, 15])
+    density = exponential_density(1, 100)
+    assert np.allclose(calculate_expected_counts(measures, distances, density), 
+                       measures * np.exp(distances / 100))
+    # Negative densities count as zero
+    assert np.allclose(calculate_expected_counts(measures, distances, lambda d: 1 - d / 100), 
+                       [10, 0, 0])
+
+
+def test_place_synapses():
+    segments = create_segments([3, 1, 5])
+    measures = np.ones(len(segments))
+    distances = np.arange(len(segments)) * 10.
+    syn_locs = place_synapses(segments, measures, distances, 20, seed=0)
+    assert len(syn_locs) == 20 * len(segments)
+
+    # Sorted by (sec.idx, x) and within their segment
+    keys = [(sec.idx, x) for sec, x in syn_locs]
+    assert keys == sorted(keys)
+    sections = {seg._section.idx: seg._section for seg in segments}
+    for sec, x in syn_locs:
+        assert sections[sec.idx] is sec
+        assert 0 <= x <= 1
+
+
+def test_place_synapses_follows_density():
+    segments = create_segments([4])
+    measures = np.ones(4)
+    distances = np.array([0, 10, 20, 30])
+    # No synapses in the first half of the section
+    syn_locs = place_synapses(segments, measures, distances, lambda d: (d >= 20) * 1., N=1000, seed=0)
+    xs = np.array([x for _, x in syn_locs])
+    assert len(xs) == 1000
+    assert xs.min() >= 0.5
+    # The two halves of the second half receive about as many synapses
+    assert abs((xs < 0.75).mean() - 0.5) < 0.1
+
+
+def test_place_synapses_seed():
+    segments = create_segments([2, 2])
+    args = (segments, np.ones(4), np.zeros(4), 5)
+    assert place_synapses(*args, seed=3) == place_synapses(*args, seed=3)
+    assert place_synapses(*args, N=0) == []
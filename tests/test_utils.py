@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2025 Poirazi Lab <dendrotweaks@dendrites.gr>
+# SPDX-License-Identifier: MPL-2.0
+
+import numpy as np
+import pytest
+
+from utils import calculate_nseg, simplify_polyline
+
+
+def get_frusta(distances, diameters):
+    # As SegmentDataMixin.get_section_frusta
+    return np.sum(np.diff(distances) / np.sqrt(diameters[:-1] + diameters[1:]))
+
+
+def test_calculate_nseg_matches_set_segmentation():
+    """
+    The same number of segments as the d_lambda rule of 
+    Model.set_segmentation for each section.
+    """
+    dd_utils = pytest.importorskip('dendrotweaks.utils')
+    rng = np.random.default_rng(0)
+    frusta, nsegs, Ras, cms = [], [], [], []
+    for _ in range(50):
+        n_points = rng.integers(2, 10)
+        distances = np.concatenate([[0], np.cumsum(rng.uniform(1, 100, n_points - 1))])
+        diameters = rng.uniform(0.2, 5, n_points)
+        Ra, cm = rng.uniform(50, 200), rng.uniform(0.5, 2)
+        lambda_f = dd_utils.calculate_lambda_f(distances, diameters, Ra, cm, 100)
+        nsegs.append(max(1, int((distances[-1] / (0.1 * lambda_f) + 0.9) / 2) * 2 + 1))
+        frusta.append(get_frusta(distances, diameters))
+        Ras.append(Ra)
+        cms.append(cm)
+    assert calculate_nseg(np.array(frusta), np.array(Ras), np.array(cms), 0.1).tolist() == nsegs
+
+
+def test_calculate_nseg():
+    # A cylinder of 1 µm diameter and 1000 µm length
+    frusta = np.array([get_frusta(np.array([0, 1000]), np.array([1, 1]))])
+    Ra, cm = 100, 1
+    lambda_f = 1e5 * np.sqrt(1 / (4 * np.pi * 100 * Ra * cm))
+    nseg = calculate_nseg(frusta, Ra, cm, d_lambda=0.1)
+    assert nseg.tolist() == [int((1000 / (0.1 * lambda_f) + 0.9) / 2) * 2 + 1]
+    assert nseg[0] % 2 == 1
+    # Short sections have a single segment
+    assert calculate_nseg(frusta / 1000, Ra, cm, d_lambda=0.1).tolist() == [1]
+
+
+def test_simplify_straight_line():
+    points = np.column_stack([np.linspace(0, 10, 11), np.zeros(11), np.zeros(11)])
+    assert simplify_polyline(points, 0.01).tolist() == [0, 10]
+
+
+def test_simplify_keeps_corners():
+    points = np.array([[0, 0], [1, 0.001], [2, 0], [2, 1], [2, 2]], dtype=float)
+    assert simplify_polyline(points, 0.01).tolist() == [0, 2, 4]
+    # Nothing is removed without a tolerance or with fewer than three points
+    assert simplify_polyline(points, 0).tolist() == [0, 1, 2, 3, 4]
+    assert simplify_polyline(points[:2], 1).tolist() == [0, 1]
+
+
+def test_simplify_within_tolerance():
+    rng = np.random.default_rng(0)
+    points = np.cumsum(rng.normal(size=(200, 3)), axis=0)
+    tolerance = 2
+    keep = simplify_polyline(points, tolerance)
+    assert keep[0] == 0 and keep[-1] == len(points) - 1
+    # Every removed point is within the tolerance of its simplified segment
+    for start, stop in zip(keep[:-1], keep[1:]):
+        a, b = points[start], points[stop]
+        ab = (b - a) / np.linalg.norm(b - a)
+        inner = points[start + 1:stop] - a
+        dists = np.linalg.norm(inner - np.outer(inner @ ab, ab), axis=1)
+        assert np.all(dists <= tolerance)